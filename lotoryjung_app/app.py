@@ -5,8 +5,9 @@ Main application entry point
 """
 
 import os
-from app import create_app, db, socketio
-from app.models import User, Rule, BlockedNumber, Order, OrderItem, NumberTotal, DownloadToken, AuditLog
+import click
+from app import create_app, db
+from app.models import User, Rule, BlockedNumber, Order, OrderItem, NumberTotal, UserStat, DownloadToken, AuditLog
 from flask_migrate import upgrade
 from werkzeug.security import generate_password_hash
 
@@ -24,6 +25,7 @@ def make_shell_context():
         'Order': Order,
         'OrderItem': OrderItem,
         'NumberTotal': NumberTotal,
+        'UserStat': UserStat,
         'DownloadToken': DownloadToken,
         'AuditLog': AuditLog
     }
@@ -104,6 +106,68 @@ def init_db():
     db.session.commit()
     print("Database initialized successfully!")
 
+@app.cli.command()
+def rebuild_user_stats():
+    """Recompute per-user running statistics from orders"""
+    from app.services.user_stats_service import UserStatsService
+    print("Rebuilding user statistics...")
+    rows = UserStatsService.rebuild()
+    print(f"User statistics rebuilt ({rows} rows)")
+
+@app.cli.command()
+@click.option('--batch-id', default=None, help='Batch to check (default: all batches)')
+@click.option('--apply', 'apply_fixes', is_flag=True, help='Write fixes to number_totals')
+@click.option('--workers', default=1, type=int, help='Recompute per field on N threads (report only)')
+def reconcile_number_totals(batch_id, apply_fixes, workers):
+    """Recompute number totals from order items and report/fix drift"""
+    from app.services.number_total_service import NumberTotalService
+    result = NumberTotalService.reconcile(batch_id=batch_id, apply=apply_fixes, workers=workers)
+    for entry in result['drift']:
+        print(f"{entry['batch_id']} {entry['field']} {entry['number_norm']}: "
+              f"stored {entry['stored_amount']} ({entry['stored_count']}) "
+              f"-> expected {entry['expected_amount']} ({entry['expected_count']})")
+    print(f"Checked {result['checked']} totals: {result['missing']} missing, "
+          f"{result['mismatched']} mismatched, {result['extra']} extra"
+          + (" - fixed" if result['applied'] and result['drift'] else ""))
+
+@app.cli.command()
+@click.option('--batch-id', 'batch_ids', multiple=True, help='Batch to archive (default: all closed batches)')
+@click.option('--keep-hot', is_flag=True, help='Export only, do not delete from the hot tables')
+@click.option('--chunk-size', default=500, type=int, help='Orders deleted per transaction')
+def archive_batches(batch_ids, keep_hot, chunk_size):
+    """Move closed batches to columnar archive files"""
+    from app.services.archive_service import ArchiveService, ArchiveError
+    for batch_id in batch_ids or ArchiveService.closed_batch_ids():
+        try:
+            summary = ArchiveService.archive_batch(batch_id, delete_hot=not keep_hot, chunk_size=chunk_size)
+            print(f"Archived {batch_id}: {summary['order_count']} orders, {summary['total_amount']:.2f}")
+        except ArchiveError as e:
+            print(f"Skipped {batch_id}: {e}")
+
+@app.cli.command()
+@click.option('--socket', 'socket_path', default=None, help='Unix socket path (default: LIMIT_AUTHORITY_SOCKET)')
+def limit_authority(socket_path):
+    """Run the node-local limit authority (exposure book + reservation journal)"""
+    import logging
+    from app.services.limit_authority import LimitAuthority
+    socket_path = socket_path or app.config.get('LIMIT_AUTHORITY_SOCKET')
+    if not socket_path:
+        raise click.UsageError('Set LIMIT_AUTHORITY_SOCKET or pass --socket')
+    logging.basicConfig(level=logging.INFO)
+    LimitAuthority.from_app(app).serve(socket_path)
+
+@app.cli.command()
+@click.option('--path', default=None, help='Snapshot file (default: WARM_SNAPSHOT_PATH)')
+def warm_snapshot(path):
+    """Write the warm-start snapshot (rules + open-batch exposure)"""
+    from app.services.warm_snapshot import write_warm_snapshot
+    path = path or app.config.get('WARM_SNAPSHOT_PATH')
+    if not path:
+        raise click.UsageError('Set WARM_SNAPSHOT_PATH or pass --path')
+    result = write_warm_snapshot(path)
+    print(f"Wrote {result['path']} ({result['bytes']} bytes, rules v{result['rules_version']}, "
+          f"batches: {', '.join(result['batches']) or '-'})")
+
 @app.cli.command()
 def reset_db():
     """Reset database (drop all tables and recreate)"""
@@ -115,5 +179,7 @@ def reset_db():
 
 if __name__ == '__main__':
     # Run the application
+    from app import init_socketio
+    socketio = init_socketio(app)
     socketio.run(app, host='0.0.0.0', port=5002, debug=True, allow_unsafe_werkzeug=True)
 
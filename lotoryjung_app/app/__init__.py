@@ -3,12 +3,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-from flask_cors import CORS
-from flask_socketio import SocketIO
 from dotenv import load_dotenv
 import os
+import sys
 
 # Load environment variables
 load_dotenv()
@@ -18,14 +15,58 @@ db = SQLAlchemy()
 migrate = Migrate()
 login_manager = LoginManager()
 csrf = CSRFProtect()
-limiter = Limiter(
-    key_func=get_remote_address,
-    default_limits=["1000 per day", "200 per hour", "50 per minute"]
-)
-cors = CORS()
-socketio = SocketIO()
 
-def create_app(config_name='development'):
+# HTTP-only extensions, created by init_web_extensions() / init_socketio()
+# so CLI commands and scripts do not import them
+limiter = None
+cors = None
+socketio = None
+
+def init_web_extensions(app):
+    """Rate limiting and CORS (only needed when serving requests)"""
+    global limiter, cors
+    from flask_limiter import Limiter
+    from flask_limiter.util import get_remote_address
+    from flask_cors import CORS
+    
+    if limiter is None:
+        limiter = Limiter(
+            key_func=get_remote_address,
+            default_limits=["1000 per day", "200 per hour", "50 per minute"]
+        )
+        cors = CORS()
+    limiter.init_app(app)
+    cors.init_app(app)
+
+def init_socketio(app):
+    """Flask-SocketIO server (app.py's development runner)"""
+    global socketio
+    from flask_socketio import SocketIO
+    
+    if socketio is None:
+        socketio = SocketIO()
+    socketio.init_app(app, cors_allowed_origins="*")
+    return socketio
+
+def _is_cli_command():
+    """True for `flask <command>` other than run (and limiter, which needs the extension)"""
+    if os.getenv('FLASK_RUN_FROM_CLI') != 'true':
+        return False
+    return not any(arg in ('run', 'limiter') for arg in sys.argv[1:])
+
+def create_app(config_name='development', web=None):
+    """
+    Create the Flask application
+    
+    Args:
+        config_name: Configuration name
+        web: Initialise rate limiting and CORS (default: unless running a
+            `flask` CLI command); pass False for scripts that never serve
+            requests
+    """
+    if web is None:
+        web = not _is_cli_command()
+    
     # Create Flask app with explicit template and static folders
     app = Flask(__name__, 
                 template_folder='../templates',
@@ -40,24 +81,92 @@ def create_app(config_name='development'):
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
     app.config['UPLOAD_FOLDER'] = 'static/receipts'
     
+    # Database engine profile (SQLite WAL/pragmas or PostgreSQL pool tuning)
+    from app.utils.db_engine import apply_engine_profile, register_engine_listeners
+    app.config['DB_PROFILE'] = os.getenv('DB_PROFILE', 'auto')
+    apply_engine_profile(app)
+    
     # Initialize extensions
     db.init_app(app)
+    register_engine_listeners(app, db)
+    
+    # Route report queries to the read-only pool / replica / snapshot
+    from app.utils.read_routing import read_router
+    app.config['READ_ROUTING'] = os.getenv('READ_ROUTING', 'auto')
+    app.config['READ_MAX_STALENESS_SECONDS'] = int(os.getenv('READ_MAX_STALENESS_SECONDS', 60))
+    read_router.init_app(app, db)
     migrate.init_app(app, db)
     login_manager.init_app(app)
     csrf.init_app(app)
-    limiter.init_app(app)
-    cors.init_app(app)
-    socketio.init_app(app, cors_allowed_origins="*")
+    if web:
+        init_web_extensions(app)
     
     # Login manager configuration
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'กรุณาเข้าสู่ระบบเพื่อเข้าถึงหน้านี้'
     login_manager.login_message_category = 'info'
     
+    # Authenticated user cache (invalidated on User updates)
+    from app.utils.user_cache import user_cache, register_user_cache
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 60))
+    register_user_cache(app)
+    
+    # Change counters (rule snapshot invalidation)
+    from app.utils.change_tracking import register_change_tracking
+    register_change_tracking()
+    
+    # Partial-fill policy when an order exceeds remaining limits
+    # (first_come, proportional, max_payout_safe)
+    app.config['QUOTA_ALLOCATION_POLICY'] = os.getenv('QUOTA_ALLOCATION_POLICY', 'first_come')
+    
+    # Order numbers: per-process worker id (lock file in instance/ unless set)
+    from app.utils.order_number import order_number_generator
+    app.config['ORDER_WORKER_ID'] = os.getenv('ORDER_WORKER_ID')
+    app.config['ORDER_WORKER_LOCK_DIR'] = os.getenv('ORDER_WORKER_LOCK_DIR')
+    order_number_generator.init_app(app)
+    
+    # Archived (closed) batches - columnar files read by ReportsService
+    app.config['ARCHIVE_DIR'] = os.getenv('ARCHIVE_DIR')
+    
+    # SQLite: group-commit order writes through one writer thread per process
+    from app.utils.write_coordinator import write_coordinator
+    app.config['WRITE_COORDINATOR'] = os.getenv('WRITE_COORDINATOR', 'off')
+    app.config['WRITE_GROUP_MAX_JOBS'] = int(os.getenv('WRITE_GROUP_MAX_JOBS', 32))
+    app.config['WRITE_GROUP_WAIT_MS'] = int(os.getenv('WRITE_GROUP_WAIT_MS', 2))
+    app.config['WRITE_TIMEOUT_SECONDS'] = int(os.getenv('WRITE_TIMEOUT_SECONDS', 30))
+    write_coordinator.init_app(app, db)
+    
+    # Warm start: rule snapshot (and limit authority exposure) from the last snapshot file
+    from app.services.warm_snapshot import warm_start
+    app.config['WARM_SNAPSHOT_PATH'] = os.getenv('WARM_SNAPSHOT_PATH')
+    app.config['WARM_SNAPSHOT_INTERVAL'] = int(os.getenv('WARM_SNAPSHOT_INTERVAL', 60))
+    app.extensions['warm_snapshot'] = warm_start(app)
+    
+    # Optional node-local limit authority (flask limit_authority); unset = database only
+    from app.services.limit_authority import limit_authority
+    app.config['LIMIT_AUTHORITY_SOCKET'] = os.getenv('LIMIT_AUTHORITY_SOCKET')
+    app.config['LIMIT_AUTHORITY_JOURNAL'] = os.getenv('LIMIT_AUTHORITY_JOURNAL')
+    app.config['LIMIT_AUTHORITY_FSYNC'] = os.getenv('LIMIT_AUTHORITY_FSYNC', 'on')
+    app.config['LIMIT_AUTHORITY_TIMEOUT_MS'] = int(os.getenv('LIMIT_AUTHORITY_TIMEOUT_MS', 200))
+    app.config['LIMIT_AUTHORITY_RESERVATION_TTL'] = int(os.getenv('LIMIT_AUTHORITY_RESERVATION_TTL', 60))
+    app.config['LIMIT_AUTHORITY_RESYNC_SECONDS'] = int(os.getenv('LIMIT_AUTHORITY_RESYNC_SECONDS', 30))
+    app.config['LIMIT_AUTHORITY_RULES_POLL_SECONDS'] = float(os.getenv('LIMIT_AUTHORITY_RULES_POLL_SECONDS', 1))
+    limit_authority.init_app(app)
+    
+    # Hot numbers: per-process top-K rankings kept current from the exposure feed
+    from app.services.top_numbers import top_numbers
+    app.config['TOP_NUMBERS_K'] = int(os.getenv('TOP_NUMBERS_K', 50))
+    top_numbers.init_app(app)
+    
+    # JSON responses: gzip above a size threshold (0 = off)
+    from app.utils.http_cache import register_compression
+    app.config['GZIP_MIN_BYTES'] = int(os.getenv('GZIP_MIN_BYTES', 1024))
+    app.config['GZIP_LEVEL'] = int(os.getenv('GZIP_LEVEL', 5))
+    register_compression(app)
+    
     @login_manager.user_loader
     def load_user(user_id):
-        from app.models import User
-        return User.query.get(int(user_id))
+        return user_cache.load(int(user_id))
     
     # Template context processors
     @app.context_processor
@@ -23,6 +23,7 @@ class User(UserMixin, db.Model):
     
     # Relationships
     orders = db.relationship('Order', backref='user', lazy=True, cascade='all, delete-orphan')
+    stats = db.relationship('UserStat', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
         """Set password hash"""
@@ -93,6 +94,8 @@ class Order(db.Model):
     batch_id = db.Column(db.String(20), nullable=False, index=True)  # batch identifier
     pdf_path = db.Column(db.String(255), nullable=True)
     notes = db.Column(db.Text, nullable=True)
+    idempotency_key = db.Column(db.String(64), nullable=True)  # client request key (Idempotency-Key header)
+    idempotency_hash = db.Column(db.String(64), nullable=True)  # sha256 of the request body sent with the key
     created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(BANGKOK_TZ), index=True)
     updated_at = db.Column(db.DateTime, onupdate=lambda: datetime.now(BANGKOK_TZ))
     
@@ -103,6 +106,8 @@ class Order(db.Model):
     __table_args__ = (
         db.Index('idx_order_period_batch', 'lottery_period', 'batch_id'),
         db.Index('idx_order_user_created', 'user_id', 'created_at'),
+        # Keys are scoped to a batch, so they expire when the batch closes
+        db.UniqueConstraint('user_id', 'batch_id', 'idempotency_key', name='unique_order_idempotency_key'),
     )
     
     def __repr__(self):
@@ -169,15 +174,40 @@ class NumberTotal(db.Model):
     total_amount = db.Column(db.Numeric(10, 2), nullable=False, default=0)
     order_count = db.Column(db.Integer, nullable=False, default=0)
     last_updated = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(BANGKOK_TZ))
+    # 'exposure_seq' counter value of the last change (exposure change feed)
+    seq = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
     
     __table_args__ = (
         db.UniqueConstraint('batch_id', 'field', 'number_norm', name='unique_number_total'),
         db.Index('idx_total_batch_field', 'batch_id', 'field'),
+        db.Index('idx_total_batch_seq', 'batch_id', 'seq'),
     )
     
     def __repr__(self):
         return f'<NumberTotal {self.batch_id}:{self.field}:{self.number_norm}={self.total_amount}>'
 
+class UserStat(db.Model):
+    """Running order statistics per user, batch and status (maintained on submit/cancel)"""
+    __tablename__ = 'user_stats'
+
+    # batch_id value for the all-batches row
+    ALL_BATCHES = 'ALL'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    batch_id = db.Column(db.String(20), nullable=False)  # batch id or 'ALL'
+    status = db.Column(db.String(20), nullable=False)  # pending, confirmed, cancelled
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    last_updated = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(BANGKOK_TZ))
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'batch_id', 'status', name='unique_user_stat'),
+    )
+
+    def __repr__(self):
+        return f'<UserStat {self.user_id}:{self.batch_id}:{self.status}={self.order_count}/{self.total_amount}>'
+
 class DownloadToken(db.Model):
     """Secure download tokens for PDF receipts"""
     __tablename__ = 'download_tokens'
@@ -223,3 +253,34 @@ class AuditLog(db.Model):
     def __repr__(self):
         return f'<AuditLog {self.action}:{self.resource}:{self.resource_id}>'
 
+
+class ChangeCounter(db.Model):
+    """Monotonic change counters (e.g. 'rules' is bumped whenever Rule/BlockedNumber change)"""
+    __tablename__ = 'change_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(BANGKOK_TZ))
+    
+    def __repr__(self):
+        return f'<ChangeCounter {self.name}={self.value}>'
+
+
+class RuleChange(db.Model):
+    """Keys of Rule/BlockedNumber rows changed at each 'rules' counter version (delta sync)"""
+    __tablename__ = 'rule_changes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False)
+    entity = db.Column(db.String(20), nullable=False)  # rule, blocked_number, reset (bulk change)
+    rule_type = db.Column(db.String(50), nullable=True)
+    field = db.Column(db.String(20), nullable=True)
+    number_norm = db.Column(db.String(10), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(BANGKOK_TZ))
+    
+    __table_args__ = (
+        db.Index('idx_rule_changes_version', 'version'),
+    )
+    
+    def __repr__(self):
+        return f'<RuleChange v{self.version} {self.entity}:{self.rule_type}:{self.field}:{self.number_norm}>'
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, SelectField, TextAreaField, SubmitField, BooleanField, DecimalField
@@ -13,11 +13,16 @@ from app.utils.number_utils import (
     preview_bulk_blocked_numbers
 )
 from app.services.limit_service import LimitService
-from app.services.reports_service import ReportsService
+from app.services.rule_service import RuleService
+from app.utils.pagination import keyset_paginate, InvalidCursor
+from app.services.reports_service import ReportsService, DASHBOARD_SECTIONS
 from app.services.risk_management_service import RiskManagementService
-from app.services.order_service import OrderService
+from app.services.order_service import OrderService, OrderValidationError
 from app.services.simple_sales_service import SimpleSalesService
 from app.services.sales_report_service import SalesReportService
+from app.services.export_service import ExportService, ExportError
+from app.utils.http_cache import conditional, rules_version, exposure_version, batch_version
+from app.utils.read_routing import read_session
 from app import db
 
 admin_bp = Blueprint('admin', __name__)
@@ -142,6 +147,21 @@ def dashboard():
                              stats=stats, 
                              recent_orders=[])
 
+def _blocked_numbers_page(field_filter: str = '', search: str = '', cursor: str = None, per_page: int = 100):
+    """Keyset page of active blocked numbers ordered by (field, number_norm) - unique_blocked_number index"""
+    query = BlockedNumber.query.filter(BlockedNumber.is_active == True)
+    
+    if field_filter:
+        query = query.filter_by(field=field_filter)
+    
+    if search:
+        query = query.filter(BlockedNumber.number_norm.contains(search))
+    
+    return keyset_paginate(
+        query, [BlockedNumber.field, BlockedNumber.number_norm],
+        cursor=cursor, per_page=per_page, descending=False
+    )
+
 @admin_bp.route('/blocked_numbers')
 @login_required  
 @admin_required
@@ -149,43 +169,29 @@ def blocked_numbers():
     """Blocked numbers list"""
     from flask_wtf import FlaskForm
     
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     field_filter = request.args.get('field', '')
     search = request.args.get('search', '')
     
-    query = BlockedNumber.query
-    
-    if field_filter:
-        query = query.filter_by(field=field_filter)
-    
-    if search:
-        query = query.filter(BlockedNumber.number_norm.contains(search))
-    
-    blocked_numbers = query.order_by(BlockedNumber.created_at.desc())\
-                          .paginate(page=page, per_page=100, error_out=False)
+    try:
+        blocked_numbers = _blocked_numbers_page(field_filter, search, cursor, per_page=100)
+    except InvalidCursor:
+        return redirect(url_for('admin.blocked_numbers', field=field_filter, search=search))
     
     # Get statistics
     stats = {
-        'total': BlockedNumber.query.count(),
+        'total': BlockedNumber.query.filter(BlockedNumber.is_active == True).count(),
         'by_field': {}
     }
     
     field_counts = db.session.query(
         BlockedNumber.field,
         db.func.count(BlockedNumber.id)
-    ).group_by(BlockedNumber.field).all()
+    ).filter(BlockedNumber.is_active == True).group_by(BlockedNumber.field).all()
     
     for field, count in field_counts:
         stats['by_field'][field] = count
     
-    # DEBUG: Print info to console
-    print(f"DEBUG blocked_numbers route:")
-    print(f"  Total items: {len(blocked_numbers.items) if blocked_numbers else 'None'}")
-    print(f"  Total pages: {blocked_numbers.total if blocked_numbers else 'None'}")
-    print(f"  Stats: {stats}")
-    if blocked_numbers and blocked_numbers.items:
-        print(f"  First item: {blocked_numbers.items[0].field} - {blocked_numbers.items[0].number_norm}")
-    
     # Create empty form for CSRF protection
     delete_form = FlaskForm()
     
@@ -196,6 +202,35 @@ def blocked_numbers():
                          stats=stats,
                          delete_form=delete_form)
 
+@admin_bp.route('/api/blocked_numbers')
+@login_required
+@admin_required
+@conditional(rules_version)
+def api_blocked_numbers():
+    """Blocked numbers (JSON, cursor paginated)"""
+    try:
+        page = _blocked_numbers_page(
+            request.args.get('field', ''),
+            request.args.get('search', ''),
+            request.args.get('cursor'),
+            request.args.get('per_page', 100, type=int)
+        )
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'data': [{
+            'id': blocked.id,
+            'field': blocked.field,
+            'number_norm': blocked.number_norm,
+            'reason': blocked.reason,
+            'is_active': blocked.is_active,
+            'created_at': blocked.created_at.isoformat()
+        } for blocked in page.items],
+        'pagination': page.to_dict()
+    })
+
 @admin_bp.route('/blocked_numbers/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -218,7 +253,20 @@ def add_blocked_number():
             # Generate permutations
             records = generate_blocked_numbers_for_field(form.number_norm.data, number_type)
             
+            # Rows deactivated by a bulk sync are reused instead of re-inserted
+            existing = {
+                (b.field, b.number_norm): b
+                for b in BlockedNumber.query.filter(
+                    BlockedNumber.number_norm.in_({r['number_norm'] for r in records})
+                )
+            }
+            
             for record in records:
+                blocked_number = existing.get((record['field'], record['number_norm']))
+                if blocked_number:
+                    blocked_number.reason = form.reason.data
+                    blocked_number.is_active = form.is_active.data
+                    continue
                 blocked_number = BlockedNumber(
                     field=record['field'],
                     number_norm=record['number_norm'],
@@ -294,16 +342,7 @@ def bulk_add_blocked_numbers():
                 flash(error, 'error')
             return render_template('admin/bulk_blocked_number_form.html', form=form, title='เพิ่มเลขอั้นหลายตัว')
         
-        success_count = 0
-        error_count = 0
-        errors = []
-        duplicate_count = 0
-        
         try:
-            # Clear all existing blocked numbers first
-            deleted_count = BlockedNumber.query.delete()
-            print(f"🗑️ DEBUG: ล้าง blocked numbers ทั้งหมด {deleted_count} รายการ")
-            
             # Process each input number and generate all permutations
             all_records = []
             
@@ -311,72 +350,20 @@ def bulk_add_blocked_numbers():
                 number = item['number']
                 number_type = item['type']
                 
-                print(f"🎲 DEBUG PERMUTATION: {number} ({number_type})")
-                
-                # Generate permutations based on number type
-                if number_type == '2_digit':
-                    # For 2-digit, generate permutations for both 2_top and 2_bottom
-                    records = generate_blocked_numbers_for_field(number, '2_digit')
-                    print(f"  → Generated {len(records)} records for 2_digit: {[r['field'] + ':' + r['number_norm'] for r in records]}")
-                    all_records.extend(records)
-                elif number_type == '3_digit':
-                    # For 3-digit, generate permutations for 3_top and tote
-                    records = generate_blocked_numbers_for_field(number, '3_digit')
-                    print(f"  → Generated {len(records)} records for 3_digit: {[r['field'] + ':' + r['number_norm'] for r in records]}")
-                    all_records.extend(records)
-            
-            # Remove duplicates and apply global settings
-            unique_records = []
-            seen = set()
-            
-            print(f"📝 DEBUG UNIQUE FILTERING:")
-            print(f"  Total records before filtering: {len(all_records)}")
-            
-            for record in all_records:
-                key = (record['field'], record['number_norm'])
-                if key not in seen:
-                    seen.add(key)
-                    # Apply global form settings
-                    if form.reason.data:
-                        record['reason'] = form.reason.data
-                    record['is_active'] = form.is_active.data
-                    unique_records.append(record)
-                else:
-                    print(f"  Skipping duplicate: {record['field']}:{record['number_norm']}")
-            
-            print(f"  Total unique records: {len(unique_records)}")
-            print(f"  Unique records by field:")
-            from collections import Counter
-            field_counts = Counter([r['field'] for r in unique_records])
-            for field, count in field_counts.items():
-                print(f"    {field}: {count}")
+                # 2-digit → 2_top/2_bottom, 3-digit → 3_top/tote (with permutations)
+                if number_type in ('2_digit', '3_digit'):
+                    all_records.extend(generate_blocked_numbers_for_field(number, number_type))
             
-            # Batch insert new records to database
-            if unique_records:
-                print(f"💾 DEBUG: เริ่มเพิ่ม {len(unique_records)} records ใหม่")
-                for record in unique_records:
-                    # ไม่ต้องเช็ค duplicate เพราะล้างไปแล้ว
-                    try:
-                        blocked_number = BlockedNumber(
-                            field=record['field'],
-                            number_norm=record['number_norm'],
-                            reason=record.get('reason', ''),
-                            is_active=record['is_active']
-                        )
-                        db.session.add(blocked_number)
-                        success_count += 1
-                    except Exception as e:
-                        error_count += 1
-                        errors.append(f"เลข {record['number_norm']}: {str(e)}")
-                
-                # Commit all changes (delete + insert)
-                print(f"💾 DEBUG: Committing transaction...")
-                db.session.commit()
-                print(f"✅ DEBUG: Transaction committed สำเร็จ!")
+            # Sync table to the desired set: insert new, deactivate removed, leave the rest
+            sync_result = RuleService.sync_blocked_numbers(
+                all_records,
+                reason=form.reason.data,
+                is_active=form.is_active.data,
+                user_id=current_user.id
+            )
         
         except Exception as e:
             print(f"❌ DEBUG: เกิด Exception: {str(e)}")
-            print(f"❌ DEBUG: Type: {type(e)}")
             import traceback
             traceback.print_exc()
             db.session.rollback()
@@ -384,19 +371,12 @@ def bulk_add_blocked_numbers():
             return render_template('admin/bulk_blocked_number_form.html', form=form, title='เพิ่มเลขอั้นหลายตัว')
         
         # Show results
-        if success_count > 0:
-            flash(f'✅ สำเร็จ! ล้างข้อมูลเก่า {deleted_count} รายการ และบันทึกข้อมูลใหม่ {success_count} รายการ', 'success')
-            flash(f'📊 สถิติ: บันทึกจาก {len(validation_result["valid_numbers"])} เลขที่กรอก → สร้างเป็น {success_count} records ในฐานข้อมูล', 'info')
-        
-        # ไม่แสดง duplicate เพราะล้างไปแล้ว
-        
-        if error_count > 0:
-            flash(f'⚠️ พบข้อผิดพลาด {error_count} รายการ', 'warning')
-            for error in errors[:3]:  # Show first 3 errors
-                flash(error, 'error')
+        total_numbers = sync_result['added'] + sync_result['activated'] + sync_result['unchanged']
+        flash(f'✅ สำเร็จ! เพิ่มใหม่ {sync_result["added"]} รายการ, เปิดใช้งานอีกครั้ง {sync_result["activated"]} รายการ, '
+              f'ยกเลิก {sync_result["deactivated"]} รายการ, ไม่เปลี่ยนแปลง {sync_result["unchanged"]} รายการ', 'success')
+        flash(f'📊 สถิติ: บันทึกจาก {len(validation_result["valid_numbers"])} เลขที่กรอก → เป็นเลขอั้น {total_numbers} records ในฐานข้อมูล', 'info')
         
-        if success_count > 0:
-            return redirect(url_for('admin.blocked_numbers'))
+        return redirect(url_for('admin.blocked_numbers'))
         
     print(f"🎯 DEBUG: bulk_add GET - แสดงฟอร์ม")
     return render_template('admin/bulk_blocked_number_form.html', form=form, title='เพิ่มเลขอั้นหลายตัว')
@@ -481,12 +461,69 @@ def rules():
     return render_template('admin/rules.html')
 
 
+def _audit_logs_page(action: str = '', user_id: int = None, cursor: str = None, per_page: int = 50):
+    """Keyset page of audit logs, newest first (idx_audit_created)"""
+    query = AuditLog.query
+    
+    if action:
+        query = query.filter(AuditLog.action == action)
+    
+    if user_id:
+        query = query.filter(AuditLog.user_id == user_id)
+    
+    return keyset_paginate(
+        query, [AuditLog.created_at, AuditLog.id],
+        cursor=cursor, per_page=per_page
+    )
+
 @admin_bp.route('/audit_logs')
 @login_required
 @admin_required
 def audit_logs():
     """Audit logs"""
-    return render_template('admin/audit_logs.html')
+    cursor = request.args.get('cursor')
+    action = request.args.get('action', '')
+    user_id = request.args.get('user_id', type=int)
+    
+    try:
+        logs = _audit_logs_page(action, user_id, cursor)
+    except InvalidCursor:
+        return redirect(url_for('admin.audit_logs', action=action, user_id=user_id))
+    
+    return render_template('admin/audit_logs.html',
+                         logs=logs,
+                         action=action,
+                         user_id=user_id)
+
+@admin_bp.route('/api/audit_logs')
+@login_required
+@admin_required
+def api_audit_logs():
+    """Audit logs (JSON, cursor paginated)"""
+    try:
+        logs = _audit_logs_page(
+            request.args.get('action', ''),
+            request.args.get('user_id', type=int),
+            request.args.get('cursor'),
+            request.args.get('per_page', 50, type=int)
+        )
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'data': [{
+            'id': log.id,
+            'user_id': log.user_id,
+            'action': log.action,
+            'resource': log.resource,
+            'resource_id': log.resource_id,
+            'ip_address': log.ip_address,
+            'details': log.details,
+            'created_at': log.created_at.isoformat()
+        } for log in logs.items],
+        'pagination': logs.to_dict()
+    })
 
 
 @admin_bp.route('/settings')
@@ -575,6 +612,7 @@ def edit_group_limits():
 @admin_bp.route('/group_limits/api/dashboard_data')
 @login_required
 @admin_required
+@conditional(rules_version, lambda: batch_version(request.args.get('batch_id') or LimitService._get_current_batch_id()))
 def api_group_limits_dashboard():
     """API endpoint for dashboard data (for AJAX updates)"""
     try:
@@ -678,11 +716,56 @@ def api_update_group_limit():
 def individual_limits():
     """Individual number limits management page"""
     try:
-        return render_template('admin/individual_limits.html')
+        field = request.args.get('field', '')
+        cursor = request.args.get('cursor')
+        
+        try:
+            individual_limits, page = LimitService.get_individual_limits_page(field, cursor)
+        except InvalidCursor:
+            return redirect(url_for('admin.individual_limits', field=field))
+        
+        field_names = {f: LimitService._get_field_display_name(f) for f in ['2_top', '2_bottom', '3_top', 'tote']}
+        field_colors = {'2_top': 'info', '2_bottom': 'warning', '3_top': 'success', 'tote': 'primary'}
+        
+        return render_template('admin/individual_limits.html',
+                             individual_limits=individual_limits,
+                             page=page,
+                             field=field,
+                             default_limits=LimitService.get_default_limits(),
+                             field_names=field_names,
+                             field_colors=field_colors)
     except Exception as e:
         flash(f'เกิดข้อผิดพลาด: {str(e)}', 'error')
         return redirect(url_for('admin.dashboard'))
 
+@admin_bp.route('/api/individual_limits')
+@login_required
+@admin_required
+@conditional(rules_version, lambda: batch_version(request.args.get('batch_id') or LimitService._get_current_batch_id()))
+def api_individual_limits():
+    """Individual number limits with current usage (JSON, cursor paginated)"""
+    try:
+        individual_limits, page = LimitService.get_individual_limits_page(
+            request.args.get('field', ''),
+            request.args.get('cursor'),
+            request.args.get('per_page', 50, type=int),
+            request.args.get('batch_id')
+        )
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'data': [{
+            'field': item['field'],
+            'number_norm': item['number_norm'],
+            'limit': float(item['limit']),
+            'current_usage': float(item['current_usage']),
+            'created_at': item['created_at'].isoformat()
+        } for item in individual_limits],
+        'pagination': page.to_dict()
+    })
+
 @admin_bp.route('/payout_rates')
 @login_required
 @admin_required
@@ -815,6 +898,165 @@ def api_delete_individual_limit():
             'error': str(e)
         })
 
+@admin_bp.route('/api/rules/import', methods=['POST'])
+@login_required
+@admin_required
+def api_import_rules():
+    """
+    Bulk import of individual limits / default limits / payout rates
+    
+    Accepts JSON ({'rules': [...], 'dry_run': bool} or a list of rules) or
+    CSV (uploaded as 'file' or sent as the text/csv body; columns
+    rule_type, field, number, value). All rows are applied in one
+    transaction, or none when any row is invalid.
+    """
+    from app.services.rule_service import RuleImportError
+    
+    try:
+        upload = request.files.get('file')
+        if upload is not None or request.mimetype == 'text/csv':
+            raw = upload.read() if upload is not None else request.get_data()
+            try:
+                text = raw.decode('utf-8')
+            except UnicodeDecodeError:
+                return jsonify({'success': False, 'error': 'ไฟล์ CSV ต้องเป็น UTF-8'}), 400
+            source = 'csv'
+            records = RuleService.parse_rules_csv(text)
+            dry_run = request.values.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                records, dry_run = data.get('rules'), bool(data.get('dry_run'))
+            else:
+                records, dry_run = data, False
+            source = 'json'
+            if not isinstance(records, list):
+                return jsonify({'success': False, 'error': 'ไม่มีข้อมูลที่ส่งมา'}), 400
+        
+        result = RuleService.import_rules(records, user_id=current_user.id, source=source, dry_run=dry_run)
+        return jsonify({'success': True, **result})
+    
+    except RuleImportError as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': f'ข้อมูลไม่ถูกต้อง {len(e.errors)} แถว ไม่มีการบันทึก',
+            'errors': e.errors[:100]
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@admin_bp.route('/api/orders/cancel', methods=['POST'])
+@login_required
+@admin_required
+def api_cancel_orders():
+    """Cancel a list of orders in one transaction"""
+    data = request.get_json(silent=True)
+    order_ids = OrderService.parse_order_ids(data.get('order_ids') if isinstance(data, dict) else None)
+    if order_ids is None:
+        return jsonify({
+            'success': False,
+            'error': 'ต้องระบุ order_ids'
+        }), 400
+    
+    try:
+        result = OrderService.cancel_orders(
+            actor_id=current_user.id,
+            order_ids=order_ids,
+            reason=data.get('reason')
+        )
+        if not result['cancelled']:
+            return jsonify({
+                'success': False,
+                'error': 'ไม่พบรายการสั่งซื้อที่ยกเลิกได้'
+            }), 404
+        return jsonify({'success': True, **result})
+    except OrderValidationError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@admin_bp.route('/api/orders/void_batch', methods=['POST'])
+@login_required
+@admin_required
+def api_void_batch():
+    """Void every order of an agent in a batch (e.g. at batch close)"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    user_id = data.get('user_id')
+    batch_id = data.get('batch_id')
+    
+    if not user_id or not batch_id:
+        return jsonify({
+            'success': False,
+            'error': 'ข้อมูลไม่ครบถ้วน (user_id, batch_id)'
+        }), 400
+    
+    try:
+        result = OrderService.cancel_orders(
+            actor_id=current_user.id,
+            user_id=int(user_id),
+            batch_id=str(batch_id),
+            reason=data.get('reason') or 'void batch'
+        )
+        return jsonify({'success': True, **result})
+    except (OrderValidationError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@admin_bp.route('/api/number_totals/reconcile', methods=['POST'])
+@login_required
+@admin_required
+def api_reconcile_number_totals():
+    """Check number totals against order items (and fix drift when apply=true)"""
+    from app.services.number_total_service import NumberTotalService
+    
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({
+            'success': False,
+            'error': 'ข้อมูลไม่ถูกต้อง'
+        }), 400
+    apply = data.get('apply', False)
+    if not isinstance(apply, bool):
+        # "false", 0, ... must not apply fixes by accident
+        return jsonify({
+            'success': False,
+            'error': 'apply ต้องเป็น true หรือ false'
+        }), 400
+    
+    try:
+        result = NumberTotalService.reconcile(
+            batch_id=data.get('batch_id') or LimitService._get_current_batch_id(),
+            apply=apply,
+            user_id=current_user.id
+        )
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @admin_bp.route('/api/update_payout_rate', methods=['POST'])
 @login_required
 @admin_required
@@ -886,6 +1128,7 @@ def reports():
 @admin_bp.route('/api/reports/summary')
 @login_required
 @admin_required
+@conditional(lambda: batch_version(request.args.get('batch_id'), read_session()))
 def api_reports_summary():
     """API: รายงานสรุปภาพรวม"""
     batch_id = request.args.get('batch_id')
@@ -901,6 +1144,7 @@ def api_reports_summary():
 @admin_bp.route('/api/reports/number_detail')
 @login_required
 @admin_required
+@conditional(lambda: batch_version(request.args.get('batch_id'), read_session()))
 def api_reports_number_detail():
     """API: รายละเอียดเลขเฉพาะตัว"""
     field = request.args.get('field')
@@ -918,6 +1162,7 @@ def api_reports_number_detail():
 @admin_bp.route('/api/reports/risk_analysis')
 @login_required
 @admin_required
+@conditional(lambda: batch_version(request.args.get('batch_id'), read_session()))
 def api_reports_risk_analysis():
     """API: วิเคราะห์ความเสี่ยง"""
     batch_id = request.args.get('batch_id')
@@ -934,6 +1179,7 @@ def api_reports_risk_analysis():
 @admin_bp.route('/api/reports/charts')
 @login_required
 @admin_required
+@conditional(lambda: batch_version(request.args.get('batch_id'), read_session()))
 def api_reports_charts():
     """API: ข้อมูลสำหรับกราฟ"""
     batch_id = request.args.get('batch_id')
@@ -950,6 +1196,7 @@ def api_reports_charts():
 @admin_bp.route('/api/reports/batches')
 @login_required
 @admin_required
+@conditional(lambda: exposure_version(read_session()))
 def api_reports_batches():
     """API: รายการ batch ที่มีข้อมูล"""
     batches = ReportsService.get_available_batches()
@@ -959,6 +1206,68 @@ def api_reports_batches():
         'data': batches
     })
 
+def _reports_dashboard_version():
+    """Dashboard version: the batch's, or every batch's when the batch list is included"""
+    sections = request.args.get('sections')
+    if sections is None or 'batches' in [section.strip() for section in sections.split(',')]:
+        return exposure_version(read_session())
+    return batch_version(request.args.get('batch_id'), read_session())
+
+@admin_bp.route('/api/reports/dashboard')
+@login_required
+@admin_required
+@conditional(_reports_dashboard_version)
+def api_reports_dashboard():
+    """API: ข้อมูลทุก widget ของหน้ารายงานในครั้งเดียว (sections=summary,charts,risk_analysis,batches)"""
+    batch_id = request.args.get('batch_id')
+    threshold = float(request.args.get('threshold', 0.1))  # 10% default
+    sections = request.args.get('sections')
+    sections = [section.strip() for section in sections.split(',') if section.strip()] if sections else DASHBOARD_SECTIONS
+    
+    unknown = set(sections) - set(DASHBOARD_SECTIONS)
+    if unknown:
+        return jsonify({'success': False, 'error': f"ไม่รู้จัก section: {', '.join(sorted(unknown))}"})
+    if not batch_id and set(sections) != {'batches'}:
+        return jsonify({'success': False, 'error': 'กรุณาระบุ batch_id'})
+    
+    result = ReportsService.get_dashboard(batch_id, sections, threshold)
+    
+    return jsonify(result)
+
+@admin_bp.route('/api/reports/export/<report>')
+@login_required
+@admin_required
+def api_reports_export(report):
+    """API: ดาวน์โหลดรายงานเป็น CSV / XLSX (ส่งแบบ streaming)"""
+    batch_id = request.args.get('batch_id')
+    fmt = request.args.get('format', 'csv').lower()
+    
+    try:
+        limit = int(request.args.get('limit', 50))
+        header, rows = ExportService.prepare(
+            report, batch_id, fmt,
+            field=request.args.get('field'),
+            number=request.args.get('number'),
+            limit=limit
+        )
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit ต้องเป็นตัวเลข'}), 400
+    except ExportError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if fmt == 'xlsx':
+        body = ExportService.iter_xlsx(header, rows, report)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = ExportService.iter_csv(header, rows)
+        mimetype = 'text/csv'
+    
+    filename = ExportService.filename(report, batch_id, fmt)
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'  # ไม่ให้ nginx buffer ทั้งไฟล์
+    })
+
 # Risk Management Routes
 @admin_bp.route('/risk-management')
 @login_required
@@ -980,6 +1289,8 @@ def risk_management():
 @admin_bp.route('/api/risk-dashboard')
 @login_required
 @admin_required
+@conditional(lambda: rules_version(read_session()),
+             lambda: batch_version(request.args.get('batch_id', OrderService.get_current_batch_id()), read_session()))
 def api_risk_dashboard():
     """API สำหรับ Risk Dashboard"""
     try:
@@ -996,6 +1307,8 @@ def api_risk_dashboard():
 @admin_bp.route('/api/risk-detail')
 @login_required
 @admin_required  
+@conditional(lambda: rules_version(read_session()),
+             lambda: batch_version(request.args.get('batch_id', OrderService.get_current_batch_id()), read_session()))
 def api_risk_detail():
     """API สำหรับข้อมูลความเสี่ยงรายละเอียดของเลขเฉพาะ"""
     try:
@@ -1035,6 +1348,7 @@ def sales_report():
 @admin_bp.route('/api/sales-summary')
 @login_required
 @admin_required
+@conditional(lambda: exposure_version(read_session()), lambda: rules_version(read_session()))
 def api_sales_summary():
     """API สำหรับรายงานสรุปยอดขายและยอดที่คาดว่าจะจ่าย (ไม่แยก batch)"""
     try:
@@ -1047,6 +1361,7 @@ def api_sales_summary():
 @admin_bp.route('/api/top-sales')
 @login_required
 @admin_required
+@conditional(lambda: exposure_version(read_session()), lambda: rules_version(read_session()))
 def api_top_sales():
     """API สำหรับ Top Sales Numbers แยกตามประเภท (ไม่แยก batch)"""
     try:
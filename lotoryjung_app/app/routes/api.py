@@ -1,9 +1,20 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from app.models import Order, OrderItem, Rule, BlockedNumber, NumberTotal
 from app.services.limit_service import LimitService
+from app.services.user_stats_service import UserStatsService
+from app.services.order_service import OrderService, OrderValidationError
+from app.utils.write_coordinator import write_coordinator, WriteTimeout
+from app.services.limit_authority import limit_authority, LimitAuthorityUnavailable
+from app.services.rule_sync import RuleSyncService
+from app.services.exposure_feed import ExposureFeedService
+from app.utils.http_cache import conditional, rules_version
+from app.utils.pagination import keyset_paginate, InvalidCursor
+from app.utils.number_utils import generate_tote_number, generate_order_number
 from app import db
+from sqlalchemy.exc import IntegrityError
 from decimal import Decimal, InvalidOperation
+import hashlib
 import json
 import uuid
 from datetime import datetime, date
@@ -32,6 +43,7 @@ def health():
 
 @api_bp.route('/rules/<field>')
 @login_required
+@conditional(rules_version)
 def get_rules(field):
     """Get rules for a specific field"""
     payout_rule = Rule.query.filter_by(
@@ -53,6 +65,7 @@ def get_rules(field):
 
 @api_bp.route('/blocked_numbers/<field>')
 @login_required
+@conditional(rules_version)
 def get_blocked_numbers(field):
     """Get blocked numbers for a specific field"""
     blocked = BlockedNumber.query.filter_by(
@@ -64,6 +77,71 @@ def get_blocked_numbers(field):
         'blocked_numbers': [b.number_norm for b in blocked]
     })
 
+@api_bp.route('/sync/rules')
+@login_required
+def sync_rules():
+    """
+    Rule and blocked-number changes since a version (delta sync for terminals)
+    
+    Query:
+        since: 'version' of the terminal's last sync; omitted, unknown or too
+            old returns a full snapshot ('full': true)
+    
+    The ETag is the current version, so a terminal that is up to date gets
+    304 Not Modified from If-None-Match without any rows being read.
+    """
+    try:
+        since = request.args.get('since', type=int)
+        etag = f"rules-{RuleSyncService.current_version()}"
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            payload = RuleSyncService.changes_since(since)
+            etag = f"rules-{payload['version']}"
+            response = jsonify({'success': True, 'since': since, **payload})
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'เกิดข้อผิดพลาดในการซิงค์กฎ: {str(e)}'
+        }), 500
+
+@api_bp.route('/sync/exposure')
+@login_required
+def sync_exposure():
+    """
+    Number totals of a batch changed since a sequence (exposure change feed)
+    
+    Query:
+        batch_id: Batch (default: current batch)
+        since: 'seq' of the client's last call; omitted, or behind a removal
+            in the batch, returns every total of the batch ('full': true)
+    
+    Totals are parallel arrays per field ('numbers', 'amounts', 'counts'),
+    so a whole 00-99 board costs one call. The ETag carries the sequence;
+    an up-to-date client gets 304 Not Modified from If-None-Match.
+    """
+    try:
+        batch_id = request.args.get('batch_id') or LimitService._get_current_batch_id()
+        since = request.args.get('since', type=int)
+        etag = f"exposure-{batch_id}-{ExposureFeedService.current_seq()}"
+        if request.if_none_match.contains_weak(etag):
+            response = current_app.response_class(status=304)
+        else:
+            payload = ExposureFeedService.changes_since(batch_id, since)
+            etag = f"exposure-{batch_id}-{payload['seq']}"
+            response = jsonify({'success': True, 'since': since, **payload})
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'เกิดข้อผิดพลาดในการดึงยอดซื้อ: {str(e)}'
+        }), 500
+
 @api_bp.route('/number_totals/<field>/<number>')
 @login_required
 def get_number_total(field, number):
@@ -82,6 +160,85 @@ def get_number_total(field, number):
         'order_count': total.order_count if total else 0
     })
 
+@api_bp.route('/orders')
+@login_required
+def get_orders():
+    """Current user's orders, newest first (cursor paginated)"""
+    try:
+        page = keyset_paginate(
+            Order.query.filter_by(user_id=current_user.id),
+            [Order.created_at, Order.id],
+            cursor=request.args.get('cursor'),
+            per_page=request.args.get('per_page', 20, type=int),
+            max_per_page=100
+        )
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'data': [{
+            'id': order.id,
+            'order_number': order.order_number,
+            'customer_name': order.customer_name,
+            'total_amount': float(order.total_amount),
+            'status': order.status,
+            'batch_id': order.batch_id,
+            'lottery_period': order.lottery_period.isoformat(),
+            'created_at': order.created_at.isoformat()
+        } for order in page.items],
+        'pagination': page.to_dict()
+    })
+
+@api_bp.route('/orders/cancel', methods=['POST'])
+@login_required
+def cancel_orders():
+    """
+    Cancel several of the current user's live orders at once
+    
+    Only pending / confirmed orders of open (not yet archived) batches are
+    cancelled; 404 when none of the given orders can be.
+    
+    Request format:
+    {
+        "order_ids": [1, 2, 3],
+        "reason": "ลูกค้ายกเลิก"
+    }
+    """
+    from app.services.archive_service import ArchiveService
+    
+    data = request.get_json(silent=True)
+    order_ids = OrderService.parse_order_ids(data.get('order_ids') if isinstance(data, dict) else None)
+    if order_ids is None:
+        return jsonify({
+            'success': False,
+            'error': 'ต้องระบุ order_ids'
+        }), 400
+    
+    try:
+        result = OrderService.cancel_orders(
+            actor_id=current_user.id,
+            order_ids=order_ids,
+            user_id=current_user.id,
+            reason=data.get('reason'),
+            batch_ids=ArchiveService.open_batch_ids()
+        )
+        if not result['cancelled']:
+            return jsonify({
+                'success': False,
+                'error': 'ไม่พบรายการสั่งซื้อที่ยกเลิกได้'
+            }), 404
+        return jsonify({'success': True, **result})
+    except OrderValidationError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': f'เกิดข้อผิดพลาดในการยกเลิก: {str(e)}'
+        }), 500
+
 @api_bp.route('/validate_bulk_order', methods=['POST'])
 @login_required
 def validate_bulk_order():
@@ -126,6 +283,9 @@ def validate_bulk_order():
         # Payout rates from database
         payout_rates = LimitService.get_base_payout_rates()
         
+        # All usage/limit/blocked lookups in one limit authority message (if configured)
+        prefetched_states = _prefetch_limit_states(orders, batch_id)
+        
         for order in orders:
             number = order.get('number', '').strip()
             amount_2_top = Decimal(str(order.get('amount_2_top', 0)))
@@ -183,13 +343,16 @@ def validate_bulk_order():
                 lookup_number = clean_number
                 if field == 'tote' and len(clean_number) == 3:
                     # สำหรับโต๊ด: เรียงหลักจากเล็กไปใหญ่ (123, 231, 312 → 123)
-                    from app.utils.number_utils import generate_tote_number
                     lookup_number = generate_tote_number(clean_number)
                 
                 # Get current usage and limits
-                current_usage = LimitService.get_current_usage(field, lookup_number, batch_id)
-                limit = LimitService.get_individual_limit(field, lookup_number)
-                is_blocked = LimitService.is_blocked_number(field, lookup_number)
+                state = prefetched_states.get((field, lookup_number))
+                if state:
+                    current_usage, limit, is_blocked = state
+                else:
+                    current_usage = LimitService.get_current_usage(field, lookup_number, batch_id)
+                    limit = LimitService.get_individual_limit(field, lookup_number)
+                    is_blocked = LimitService.is_blocked_number(field, lookup_number)
                 
                 # Calculate new total after this purchase
                 new_total = current_usage + amount
@@ -340,7 +503,6 @@ def validate_single_item():
             lookup_number = clean_number
             if field == 'tote' and len(clean_number) == 3:
                 # สำหรับโต๊ด: เรียงหลักจากเล็กไปใหญ่ (123, 231, 312 → 123)
-                from app.utils.number_utils import generate_tote_number
                 lookup_number = generate_tote_number(clean_number)
             
             validation = LimitService.validate_order_item(field, lookup_number, amount, batch_id)
@@ -412,12 +574,105 @@ def get_current_totals(field, number):
             'error': f'เกิดข้อผิดพลาดในการดึงข้อมูล: {str(e)}'
         }), 500
 
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+
+def _get_idempotency_key():
+    """
+    Read the client request key from the Idempotency-Key header
+    
+    Returns:
+        (key or None, error message or None)
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+    if not key:
+        return None, None
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH or not key.isprintable():
+        return None, f'{IDEMPOTENCY_HEADER} ต้องไม่เกิน {IDEMPOTENCY_KEY_MAX_LENGTH} ตัวอักษร'
+    return key, None
+
+def _request_hash(data):
+    """sha256 of the request body in canonical JSON (key order and spacing ignored)"""
+    body = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+def _find_idempotent_order(user_id, batch_id, key):
+    """Order already created for this key in the current batch (None if not)"""
+    if not key:
+        return None
+    return Order.query.filter_by(user_id=user_id, batch_id=batch_id, idempotency_key=key).first()
+
+def _bulk_order_payload(order, order_items, replayed=False):
+    """Build the submit_bulk_order response data from a saved order"""
+    external_calculation_data = []
+    
+    for item in order_items:
+        external_calculation_data.append({
+            'order_item_id': item.id,
+            'number': item.number,
+            'field': item.field,
+            'field_display': LimitService._get_field_display_name(item.field),
+            'amount': float(item.amount),
+            'validation_factor': float(item.validation_factor),  # ⭐ สำคัญ!
+            'validation_reason': item.validation_reason,
+            'for_external_calculation': {
+                'base_rate': get_base_payout_rate(item.field),
+                'suggested_payout': float(item.amount) * get_base_payout_rate(item.field) * float(item.validation_factor)
+            }
+        })
+    
+    return {
+        'success': True,
+        'message': 'บันทึกคำสั่งซื้อเรียบร้อย',
+        'order_id': order.id,
+        'total_amount': float(order.total_amount),
+        'total_items': len(order_items),
+        'customer_name': order.customer_name,
+        'batch_id': order.batch_id,
+        'external_calculation_data': external_calculation_data,  # ⭐ สำหรับคำนวณภายนอก
+        'validation_factors_recorded': True,
+        'idempotent_replay': replayed
+    }
+
+def _replayed_order_payload(order, request_hash):
+    """
+    Original result of an already-submitted order (no validation, no writes)
+    
+    Returns:
+        (response payload, HTTP status) - 422 when the key was first sent
+        with a different request body
+    """
+    # Orders saved before request hashes were recorded have none to compare
+    if order.idempotency_hash and order.idempotency_hash != request_hash:
+        return {
+            'success': False,
+            'error': f'{IDEMPOTENCY_HEADER} นี้ถูกใช้กับคำสั่งซื้อที่มีข้อมูลต่างกันแล้ว'
+        }, 422
+    order_items = OrderItem.query.filter_by(order_id=order.id).order_by(OrderItem.id).all()
+    return _bulk_order_payload(order, order_items, replayed=True), 200
+
+def _replay_bulk_order(order, request_hash):
+    """Response for a retried request (see _replayed_order_payload)"""
+    payload, status = _replayed_order_payload(order, request_hash)
+    return jsonify(payload), status
+
 @api_bp.route('/submit_bulk_order', methods=['POST'])
 @login_required
 def submit_bulk_order():
     """
     Submit bulk order with validation factors
     Records validation factors for external payout calculation
+    
+    An optional Idempotency-Key header makes retries safe: a repeated key
+    (same user, same batch) returns the original order's result without
+    re-running validation or writes. Reusing a key with a different request
+    body is rejected with 422. Keys expire when the batch closes.
+    
+    Validation and writes run as one write job (see app.utils.write_coordinator),
+    group-committed with other submits when WRITE_COORDINATOR is on. With a
+    limit authority configured (app.services.limit_authority) the order is
+    validated and its amounts reserved there first, outside the write lock,
+    and the reservation is committed or released once the write is settled.
     """
     try:
         data = request.get_json()
@@ -428,176 +683,65 @@ def submit_bulk_order():
                 'error': 'Invalid request data'
             }), 400
         
+        idempotency_key, key_error = _get_idempotency_key()
+        if key_error:
+            return jsonify({
+                'success': False,
+                'error': key_error
+            }), 400
+        
         orders = data['orders']
         customer_name = data.get('customer_name', '').strip()
         batch_id = LimitService._get_current_batch_id()
+        request_hash = _request_hash(data) if idempotency_key else None
         
-        # Get base payout rates for calculation
-        payout_rates = LimitService.get_base_payout_rates()
-        
-        # Re-validate before submission to ensure data integrity
-        validation_response = validate_bulk_order_internal(orders, batch_id)
-        if not validation_response['success']:
-            return jsonify(validation_response), 400
+        # Retry of a request that already went through
+        existing_order = _find_idempotent_order(current_user.id, batch_id, idempotency_key)
+        if existing_order:
+            return _replay_bulk_order(existing_order, request_hash)
         
-        validation_results = validation_response['validation_results']
+        # Generate unique order number (also the limit authority reservation reference)
+        order_number = generate_order_number()
         
-        # Create main order record
-        total_amount = sum(
-            sum(detail['amount'] for detail in result['details'])
-            for result in validation_results
-            if result['status'] != 'error'
-        )
+        validation_response = None
+        if limit_authority.enabled:
+            validation_response = validate_bulk_order_internal(orders, batch_id, reservation_ref=order_number)
+            if not validation_response['reserved']:
+                # Authority unreachable: validate against the database under the write lock
+                validation_response = None
         
-        # Generate unique order number
-        order_number = f"ORD{datetime.now().strftime('%Y%m%d')}{str(uuid.uuid4())[:8].upper()}"
-        
-        # Set lottery period (default to today)
-        lottery_period = date.today()
-        
-        new_order = Order(
-            order_number=order_number,
-            user_id=current_user.id,
-            customer_name=customer_name,
-            total_amount=Decimal(str(total_amount)),
-            batch_id=batch_id,
-            lottery_period=lottery_period,
-            status='confirmed'
-        )
-        
-        db.session.add(new_order)
-        db.session.flush()  # Get order ID
-        
-        # Create order items with validation factors
-        # ⭐ แก้ปัญหา UNIQUE constraint: รวมยอด tote ที่ normalize เหมือนกันก่อน
-        consolidated_items = {}  # Key: (field, number_norm), Value: item_data
-        
-        for result in validation_results:
-            if result['status'] == 'error':
-                continue
-                
-            clean_number = ''.join(filter(str.isdigit, result['number']))
-            
-            for detail in result['details']:
-                # ⭐ แก้ไข: สำหรับโต๊ด ต้องใช้ tote normalization (เรียงหลักจากเล็กไปใหญ่)
-                normalized_number = clean_number
-                if detail['field'] == 'tote' and len(clean_number) == 3:
-                    # สำหรับโต๊ด: เรียงหลักจากเล็กไปใหญ่ (123, 231, 312 → 123)
-                    from app.utils.number_utils import generate_tote_number
-                    normalized_number = generate_tote_number(clean_number)
-                
-                # สร้าง key สำหรับ consolidation
-                key = (detail['field'], normalized_number)
-                
-                # Calculate actual payout for this item
-                base_payout = Decimal(str(detail['amount'])) * payout_rates[detail['field']]
-                actual_payout = base_payout * Decimal(str(detail['payout_rate']))
-                
-                if key in consolidated_items:
-                    # รวมยอดกับรายการที่มีอยู่แล้ว
-                    existing = consolidated_items[key]
-                    existing['amount'] += Decimal(str(detail['amount']))
-                    existing['potential_payout'] += actual_payout
-                    # เก็บหมายเลขทั้งหมดที่รวมมา (สำหรับ display)
-                    existing['numbers'].append(result['number'])
-                    existing['details'].append(detail)
-                else:
-                    # สร้างรายการใหม่
-                    consolidated_items[key] = {
-                        'field': detail['field'],
-                        'number_norm': normalized_number,
-                        'amount': Decimal(str(detail['amount'])),
-                        'potential_payout': actual_payout,
-                        'validation_factor': Decimal(str(detail['payout_rate'])),
-                        'validation_reason': detail['reason'],
-                        'current_usage_at_time': Decimal(str(detail['current_usage'])),
-                        'limit_at_time': Decimal(str(detail['limit'])),
-                        'is_blocked': detail['is_blocked'],
-                        'numbers': [result['number']],  # เก็บหมายเลขต้นฉบับทั้งหมด
-                        'details': [detail]
-                    }
-        
-        # สร้าง OrderItem จาก consolidated data
-        order_items = []
-        for (field, number_norm), item_data in consolidated_items.items():
-            # สำหรับ display: ใช้หมายเลขแรกหรือรวมหมายเลข
-            display_numbers = ', '.join(item_data['numbers'])
-            
-            order_item = OrderItem(
-                order_id=new_order.id,
-                number=display_numbers,  # new field - แสดงหมายเลขทั้งหมดที่รวมมา
-                number_input=display_numbers,  # legacy field (NOT NULL)
-                number_norm=number_norm,  # normalized number
-                field=field,
-                amount=item_data['amount'],  # new field - ยอดรวม
-                buy_amount=item_data['amount'],  # legacy field (NOT NULL) - ยอดรวม
-                validation_factor=item_data['validation_factor'],  # ⭐ สำคัญ!
-                validation_reason=item_data['validation_reason'],
-                current_usage_at_time=item_data['current_usage_at_time'],
-                limit_at_time=item_data['limit_at_time'],
-                is_blocked=item_data['is_blocked'],
-                # ⭐ แก้ปัญหา: ใส่ค่าเริ่มต้นสำหรับ legacy fields (NOT NULL constraint)
-                payout_rate=item_data['validation_factor'],  # ใช้ค่าเดียวกับ validation_factor
-                potential_payout=item_data['potential_payout']  # คำนวณจากข้อมูลจริง
+        written = False
+        try:
+            payload, status = write_coordinator.run(
+                _save_bulk_order, current_user.id, batch_id, orders, customer_name, idempotency_key,
+                request_hash, order_number, validation_response
             )
-            
-            order_items.append(order_item)
-            db.session.add(order_item)
-        
-        # Update NumberTotal for tracking
-        for item in order_items:
-            # Find or create NumberTotal record
-            number_total = NumberTotal.query.filter(
-                NumberTotal.batch_id == batch_id,
-                NumberTotal.field == item.field,
-                NumberTotal.number_norm == item.number_norm
-            ).first()
-            
-            if number_total:
-                number_total.total_amount += item.amount
-                number_total.order_count += 1
-            else:
-                number_total = NumberTotal(
-                    batch_id=batch_id,
-                    field=item.field,
-                    number_norm=item.number_norm,
-                    total_amount=item.amount,
-                    order_count=1
-                )
-                db.session.add(number_total)
-        
-        # Commit transaction
-        db.session.commit()
+            written = status == 200 and not payload['idempotent_replay']
+        except IntegrityError:
+            # Same key committed by a concurrent request between the check and the commit
+            db.session.rollback()
+            existing_order = _find_idempotent_order(current_user.id, batch_id, idempotency_key)
+            if existing_order:
+                return _replay_bulk_order(existing_order, request_hash)
+            raise
+        except WriteTimeout as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 503
+        finally:
+            if validation_response is not None:
+                if written:
+                    limit_authority.commit(order_number, batch_id)
+                else:
+                    limit_authority.release(order_number)
+            elif written and limit_authority.enabled:
+                # Validated against the database (authority was unreachable):
+                # an unreserved commit makes the authority reload the batch
+                limit_authority.commit(order_number, batch_id)
         
         # Prepare response with validation factors for external calculation
-        external_calculation_data = []
-        
-        for item in order_items:
-            external_calculation_data.append({
-                'order_item_id': item.id,
-                'number': item.number,
-                'field': item.field,
-                'field_display': LimitService._get_field_display_name(item.field),
-                'amount': float(item.amount),
-                'validation_factor': float(item.validation_factor),  # ⭐ สำคัญ!
-                'validation_reason': item.validation_reason,
-                'for_external_calculation': {
-                    'base_rate': get_base_payout_rate(item.field),
-                    'suggested_payout': float(item.amount) * get_base_payout_rate(item.field) * float(item.validation_factor)
-                }
-            })
-        
-        return jsonify({
-            'success': True,
-            'message': 'บันทึกคำสั่งซื้อเรียบร้อย',
-            'order_id': new_order.id,
-            'total_amount': float(total_amount),
-            'total_items': len(order_items),
-            'customer_name': customer_name,
-            'batch_id': batch_id,
-            'external_calculation_data': external_calculation_data,  # ⭐ สำหรับคำนวณภายนอก
-            'validation_factors_recorded': True
-        })
+        return jsonify(payload), status
         
     except Exception as e:
         db.session.rollback()
@@ -606,18 +750,247 @@ def submit_bulk_order():
             'error': f'เกิดข้อผิดพลาดในการบันทึก: {str(e)}'
         }), 500
 
-def validate_bulk_order_internal(orders, batch_id):
-    """Internal validation function for reuse"""
+def _save_bulk_order(user_id, batch_id, orders, customer_name, idempotency_key,
+                     request_hash, order_number, validation_response=None):
+    """
+    Validate and save a bulk order (write job - runs under the write lock)
+    
+    Args:
+        validation_response: Result of validate_bulk_order_internal already
+            reserved with the limit authority; validated here when None
+    
+    Returns:
+        (response payload, HTTP status)
+    """
+    # Re-check under the write lock (a concurrent retry may have just committed)
+    existing_order = _find_idempotent_order(user_id, batch_id, idempotency_key)
+    if existing_order:
+        return _replayed_order_payload(existing_order, request_hash)
+    
+    # Get base payout rates for calculation
+    payout_rates = LimitService.get_base_payout_rates()
+    
+    # Re-validate before submission to ensure data integrity
+    if validation_response is None:
+        validation_response = validate_bulk_order_internal(orders, batch_id)
+    if not validation_response['success']:
+        return validation_response, 400
+    
+    validation_results = validation_response['validation_results']
+    
+    # Create main order record
+    total_amount = sum(
+        sum(detail['amount'] for detail in result['details'])
+        for result in validation_results
+        if result['status'] != 'error'
+    )
+    
+    # Set lottery period (default to today)
+    lottery_period = date.today()
+    
+    new_order = Order(
+        order_number=order_number,
+        user_id=user_id,
+        customer_name=customer_name,
+        total_amount=Decimal(str(total_amount)),
+        batch_id=batch_id,
+        lottery_period=lottery_period,
+        status='confirmed',
+        idempotency_key=idempotency_key,
+        idempotency_hash=request_hash
+    )
+    
+    db.session.add(new_order)
+    db.session.flush()  # Get order ID
+    # Create order items with validation factors
+    # ⭐ แก้ปัญหา UNIQUE constraint: รวมยอด tote ที่ normalize เหมือนกันก่อน
+    consolidated_items = {}  # Key: (field, number_norm), Value: item_data
+    
+    for result in validation_results:
+        if result['status'] == 'error':
+            continue
+            
+        clean_number = ''.join(filter(str.isdigit, result['number']))
+        
+        for detail in result['details']:
+            # ⭐ แก้ไข: สำหรับโต๊ด ต้องใช้ tote normalization (เรียงหลักจากเล็กไปใหญ่)
+            normalized_number = clean_number
+            if detail['field'] == 'tote' and len(clean_number) == 3:
+                # สำหรับโต๊ด: เรียงหลักจากเล็กไปใหญ่ (123, 231, 312 → 123)
+                normalized_number = generate_tote_number(clean_number)
+            
+            # สร้าง key สำหรับ consolidation
+            key = (detail['field'], normalized_number)
+            
+            # Calculate actual payout for this item
+            base_payout = Decimal(str(detail['amount'])) * payout_rates[detail['field']]
+            actual_payout = base_payout * Decimal(str(detail['payout_rate']))
+            
+            if key in consolidated_items:
+                # รวมยอดกับรายการที่มีอยู่แล้ว
+                existing = consolidated_items[key]
+                existing['amount'] += Decimal(str(detail['amount']))
+                existing['potential_payout'] += actual_payout
+                # เก็บหมายเลขทั้งหมดที่รวมมา (สำหรับ display)
+                existing['numbers'].append(result['number'])
+                existing['details'].append(detail)
+            else:
+                # สร้างรายการใหม่
+                consolidated_items[key] = {
+                    'field': detail['field'],
+                    'number_norm': normalized_number,
+                    'amount': Decimal(str(detail['amount'])),
+                    'potential_payout': actual_payout,
+                    'validation_factor': Decimal(str(detail['payout_rate'])),
+                    'validation_reason': detail['reason'],
+                    'current_usage_at_time': Decimal(str(detail['current_usage'])),
+                    'limit_at_time': Decimal(str(detail['limit'])),
+                    'is_blocked': detail['is_blocked'],
+                    'numbers': [result['number']],  # เก็บหมายเลขต้นฉบับทั้งหมด
+                    'details': [detail]
+                }
+    
+    # สร้าง OrderItem จาก consolidated data
+    order_items = []
+    for (field, number_norm), item_data in consolidated_items.items():
+        # สำหรับ display: ใช้หมายเลขแรกหรือรวมหมายเลข
+        display_numbers = ', '.join(item_data['numbers'])
+        
+        order_item = OrderItem(
+            order_id=new_order.id,
+            number=display_numbers,  # new field - แสดงหมายเลขทั้งหมดที่รวมมา
+            number_input=display_numbers,  # legacy field (NOT NULL)
+            number_norm=number_norm,  # normalized number
+            field=field,
+            amount=item_data['amount'],  # new field - ยอดรวม
+            buy_amount=item_data['amount'],  # legacy field (NOT NULL) - ยอดรวม
+            validation_factor=item_data['validation_factor'],  # ⭐ สำคัญ!
+            validation_reason=item_data['validation_reason'],
+            current_usage_at_time=item_data['current_usage_at_time'],
+            limit_at_time=item_data['limit_at_time'],
+            is_blocked=item_data['is_blocked'],
+            # ⭐ แก้ปัญหา: ใส่ค่าเริ่มต้นสำหรับ legacy fields (NOT NULL constraint)
+            payout_rate=item_data['validation_factor'],  # ใช้ค่าเดียวกับ validation_factor
+            potential_payout=item_data['potential_payout']  # คำนวณจากข้อมูลจริง
+        )
+        
+        order_items.append(order_item)
+        db.session.add(order_item)
+    
+    # Update NumberTotal for tracking
+    for item in order_items:
+        # Find or create NumberTotal record
+        number_total = NumberTotal.query.filter(
+            NumberTotal.batch_id == batch_id,
+            NumberTotal.field == item.field,
+            NumberTotal.number_norm == item.number_norm
+        ).first()
+        
+        if number_total:
+            number_total.total_amount += item.amount
+            number_total.order_count += 1
+        else:
+            number_total = NumberTotal(
+                batch_id=batch_id,
+                field=item.field,
+                number_norm=item.number_norm,
+                total_amount=item.amount,
+                order_count=1
+            )
+            db.session.add(number_total)
+    
+    # Running per-user statistics (dashboard)
+    UserStatsService.record_order(user_id, batch_id, new_order.status, new_order.total_amount)
+    
+    db.session.flush()  # item ids for the response
+    return _bulk_order_payload(new_order, order_items), 200
+
+def _bulk_order_lookups(order):
+    """
+    Items of one bulk order row
+    
+    Returns:
+        (clean number, [(field, lookup number, amount), ...]); lookup numbers
+        of tote are normalized (123, 231, 312 → 123) like number_totals
+    """
+    clean_number = ''.join(filter(str.isdigit, order.get('number', '').strip()))
+    amount_2_top = Decimal(str(order.get('amount_2_top', 0)))
+    amount_2_bottom = Decimal(str(order.get('amount_2_bottom', 0)))
+    amount_tote = Decimal(str(order.get('amount_tote', 0)))
+    
+    fields_to_check = []
+    if len(clean_number) == 2:
+        if amount_2_top > 0:
+            fields_to_check.append(('2_top', clean_number, amount_2_top))
+        if amount_2_bottom > 0:
+            fields_to_check.append(('2_bottom', clean_number, amount_2_bottom))
+    elif len(clean_number) == 3:
+        if amount_2_top > 0:
+            fields_to_check.append(('3_top', clean_number, amount_2_top))
+        if amount_tote > 0:
+            fields_to_check.append(('tote', generate_tote_number(clean_number), amount_tote))
+    
+    return clean_number, fields_to_check
+
+def _limit_states(batch_id, items, reservation_ref=None):
+    """
+    (current usage, limit, is_blocked) for (field, number_norm, amount) items
+    
+    One limit authority message for all items when it is configured (a
+    reservation when reservation_ref is given), database lookups otherwise.
+    
+    Returns:
+        (states, reserved)
+    """
+    if items and limit_authority.enabled:
+        try:
+            if reservation_ref:
+                return limit_authority.reserve(reservation_ref, batch_id, items), True
+            return limit_authority.check(batch_id, items), False
+        except LimitAuthorityUnavailable as e:
+            current_app.logger.warning(f"Limit authority unavailable, using database: {e}")
+    
+    return [
+        (
+            LimitService.get_current_usage(field, number_norm, batch_id),
+            LimitService.get_individual_limit(field, number_norm),
+            LimitService.is_blocked_number(field, number_norm)
+        )
+        for field, number_norm, _ in items
+    ], False
+
+def _prefetch_limit_states(orders, batch_id):
+    """(field, number_norm) -> state for a whole bulk order from the limit authority ({} if not configured)"""
+    if not limit_authority.enabled:
+        return {}
+    items = []
+    for order in orders:
+        items.extend(_bulk_order_lookups(order)[1])
+    states, _ = _limit_states(batch_id, items)
+    return {(field, number_norm): state for (field, number_norm, _), state in zip(items, states)}
+
+def validate_bulk_order_internal(orders, batch_id, reservation_ref=None):
+    """
+    Internal validation function for reuse
+    
+    Args:
+        orders: Bulk order rows
+        batch_id: Batch to validate against
+        reservation_ref: Hold the amounts under this reference with the
+            limit authority (see app.services.limit_authority)
+    
+    Returns:
+        Dict with 'success', 'validation_results' and 'reserved' (amounts
+        are held by the limit authority)
+    """
     validation_results = []
+    lookups = []  # (row details, (field, number_norm, amount)) in item order
     
     for order in orders:
         number = order.get('number', '').strip()
-        amount_2_top = Decimal(str(order.get('amount_2_top', 0)))
-        amount_2_bottom = Decimal(str(order.get('amount_2_bottom', 0)))
-        amount_tote = Decimal(str(order.get('amount_tote', 0)))
+        clean_number, fields_to_check = _bulk_order_lookups(order)
         
         # Validate number format
-        clean_number = ''.join(filter(str.isdigit, number))
         if not clean_number or len(clean_number) not in [2, 3]:
             validation_results.append({
                 'number': number,
@@ -627,27 +1000,6 @@ def validate_bulk_order_internal(orders, batch_id):
             })
             continue
         
-        row_result = {
-            'number': number,
-            'status': 'success',
-            'message': 'ตรวจสอบเรียบร้อย',
-            'details': []
-        }
-        
-        # Check each field that has amount > 0
-        fields_to_check = []
-        
-        if len(clean_number) == 2:
-            if amount_2_top > 0:
-                fields_to_check.append(('2_top', amount_2_top))
-            if amount_2_bottom > 0:
-                fields_to_check.append(('2_bottom', amount_2_bottom))
-        elif len(clean_number) == 3:
-            if amount_2_top > 0:
-                fields_to_check.append(('3_top', amount_2_top))
-            if amount_tote > 0:
-                fields_to_check.append(('tote', amount_tote))
-        
         if not fields_to_check:
             validation_results.append({
                 'number': number,
@@ -657,42 +1009,49 @@ def validate_bulk_order_internal(orders, batch_id):
             })
             continue
         
-        # Validate each field
-        for field, amount in fields_to_check:
-            current_usage = LimitService.get_current_usage(field, clean_number, batch_id)
-            limit = LimitService.get_individual_limit(field, clean_number)
-            is_blocked = LimitService.is_blocked_number(field, clean_number)
-            
-            new_total = current_usage + amount
-            
-            # Determine validation factor
-            payout_rate = 1.0
-            reason = 'ปกติ'
-            
-            if is_blocked:
-                payout_rate = 0.5
-                reason = 'เลขอั้น - Factor 0.5x'
-            elif new_total > limit:
-                payout_rate = 0.5
-                reason = 'มียอดซื้อเกินโควต้า - Factor 0.5x'
-            
-            row_result['details'].append({
-                'field': field,
-                'field_display': LimitService._get_field_display_name(field),
-                'amount': float(amount),
-                'current_usage': float(current_usage),
-                'new_total': float(new_total),
-                'limit': float(limit),
-                'is_blocked': is_blocked,
-                'payout_rate': payout_rate,  # ⭐ Validation Factor
-                'reason': reason
-            })
-        
+        row_result = {
+            'number': number,
+            'status': 'success',
+            'message': 'ตรวจสอบเรียบร้อย',
+            'details': []
+        }
+        lookups.extend((row_result['details'], item) for item in fields_to_check)
         validation_results.append(row_result)
     
+    # Usage, limits and blocked state for every item at once
+    states, reserved = _limit_states(batch_id, [item for _, item in lookups], reservation_ref)
+    
+    # Validate each item
+    for (details, (field, _, amount)), (current_usage, limit, is_blocked) in zip(lookups, states):
+        new_total = current_usage + amount
+        
+        # Determine validation factor
+        payout_rate = 1.0
+        reason = 'ปกติ'
+        
+        if is_blocked:
+            payout_rate = 0.5
+            reason = 'เลขอั้น - Factor 0.5x'
+        elif new_total > limit:
+            payout_rate = 0.5
+            reason = 'มียอดซื้อเกินโควต้า - Factor 0.5x'
+        
+        details.append({
+            'field': field,
+            'field_display': LimitService._get_field_display_name(field),
+            'amount': float(amount),
+            'current_usage': float(current_usage),
+            'new_total': float(new_total),
+            'limit': float(limit),
+            'is_blocked': is_blocked,
+            'payout_rate': payout_rate,  # ⭐ Validation Factor
+            'reason': reason
+        })
+    
     return {
         'success': True,
-        'validation_results': validation_results
+        'validation_results': validation_results,
+        'reserved': reserved
     }
 
 def get_base_payout_rate(field):
@@ -701,6 +1060,7 @@ def get_base_payout_rate(field):
 
 @api_bp.route('/get_payout_rates')
 @login_required
+@conditional(rules_version)
 def get_payout_rates():
     """Get all base payout rates from database"""
     try:
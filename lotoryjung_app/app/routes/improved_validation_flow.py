@@ -10,10 +10,12 @@ Key Improvements:
 5. Enhanced limit processing
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from app.models import Order, OrderItem, Rule, BlockedNumber, NumberTotal
 from app.services.limit_service import LimitService
+from app.services.rule_snapshot import RuleSnapshot, get_rule_snapshot
+from app.services.quota_allocator import QuotaAllocator, POLICIES, FIRST_COME, canonical_number
 from app import db
 from decimal import Decimal, InvalidOperation
 import json
@@ -32,22 +34,65 @@ class ValidationError(Exception):
         super().__init__(self.message)
 
 class OrderValidator:
-    """Improved order validation class"""
+    """
+    Improved order validation class
+    
+    Rules come from the shared compiled RuleSnapshot (rebuilt only when rules
+    change) and current usage is loaded for all items at once with
+    prefetch_usage(), so validating a request costs a constant number of
+    queries regardless of item count.
+    """
     
-    def __init__(self):
-        self.blocked_numbers = self._load_blocked_numbers()
-        self.payout_rates = LimitService.get_base_payout_rates()
+    def __init__(self, snapshot: Optional[RuleSnapshot] = None):
+        self.snapshot = snapshot or get_rule_snapshot()
+        self.payout_rates = self.snapshot.payout_rates
+        self.batch_id = LimitService._get_current_batch_id()
+        self.usage = {}  # (field, number_norm) -> current usage
     
-    def _load_blocked_numbers(self) -> Dict[str, List[str]]:
-        """Load blocked numbers from database"""
-        blocked = {}
-        for field in ['2_top', '2_bottom', '3_top', 'tote']:
-            blocked_nums = BlockedNumber.query.filter_by(
-                field=field, 
-                is_active=True
-            ).all()
-            blocked[field] = [b.number_norm for b in blocked_nums]
-        return blocked
+    @property
+    def blocked_numbers(self) -> Dict[str, List[str]]:
+        """Blocked numbers per field"""
+        return self.snapshot.blocked_lists()
+    
+    def _fields_for_item(self, item_data: Dict) -> List[Tuple[str, str]]:
+        """(field, canonical number) pairs an item will look up usage for"""
+        is_valid, normalized_number, applicable_fields = self.validate_number_format(
+            item_data.get('number', '') or ''
+        )
+        if not is_valid:
+            return []
+        return [(field, canonical_number(field, normalized_number)) for field in applicable_fields]
+    
+    def prefetch_usage(self, items: List[Dict]) -> None:
+        """Load current usage for every (field, number) in items with one query"""
+        pairs = set()
+        for item_data in items:
+            if isinstance(item_data, dict):
+                pairs.update(self._fields_for_item(item_data))
+        pairs -= self.usage.keys()
+        if not pairs:
+            return
+        
+        for pair in pairs:
+            self.usage[pair] = Decimal('0')
+        
+        rows = db.session.query(
+            NumberTotal.field, NumberTotal.number_norm, NumberTotal.total_amount
+        ).filter(
+            NumberTotal.batch_id == self.batch_id,
+            NumberTotal.number_norm.in_({number for _, number in pairs})
+        ).all()
+        
+        for field, number_norm, total_amount in rows:
+            if (field, number_norm) in pairs:
+                self.usage[(field, number_norm)] = total_amount
+    
+    def get_usage(self, field: str, number: str) -> Decimal:
+        """Current usage (prefetched; loads on demand otherwise)"""
+        key = (field, number)
+        if key not in self.usage:
+            self.usage[key] = LimitService.get_current_usage(field, number, self.batch_id)
+        return self.usage[key]
     
     def validate_number_format(self, number: str) -> Tuple[bool, str, List[str]]:
         """
@@ -83,8 +128,8 @@ class OrderValidator:
             return False, Decimal('0')
     
     def check_blocked_status(self, number: str, field: str) -> bool:
-        """Check if number is blocked for specific field"""
-        return number in self.blocked_numbers.get(field, [])
+        """Check if number is blocked for specific field (tote by its tote key)"""
+        return self.snapshot.is_blocked(field, canonical_number(field, number))
     
     def validate_single_item(self, item_data: Dict) -> Dict[str, Any]:
         """
@@ -186,14 +231,13 @@ class OrderValidator:
     
     def _validate_field_amount(self, number: str, field: str, amount: Decimal) -> Dict[str, Any]:
         """Validate specific field amount"""
-        batch_id = LimitService._get_current_batch_id()
-        
         # Check blocked status
         is_blocked = self.check_blocked_status(number, field)
         
-        # Get current usage and limit
-        current_usage = LimitService.get_current_usage(field, number, batch_id)
-        limit = LimitService.get_individual_limit(field, number)
+        # Get current usage and limit (tote permutations share one key)
+        key_number = canonical_number(field, number)
+        current_usage = self.get_usage(field, key_number)
+        limit = self.snapshot.limit_for(field, key_number)
         
         # Calculate new total
         new_total = current_usage + amount
@@ -243,74 +287,118 @@ class OrderValidator:
 class OrderProcessor:
     """Improved order processing class"""
     
-    def __init__(self):
-        self.validator = OrderValidator()
+    def __init__(self, validator: Optional[OrderValidator] = None, policy: Optional[str] = None):
+        self.validator = validator or OrderValidator()
+        self.allocator = QuotaAllocator(
+            policy or current_app.config.get('QUOTA_ALLOCATION_POLICY', FIRST_COME)
+        )
     
     def process_limit_adjustments(self, validated_items: List[Dict]) -> Dict[str, Any]:
         """
         Process limit adjustments for validated items
         
-        This simulates the limit processing that happens during actual order submission
+        Demand is aggregated per (field, canonical number) across the whole
+        order and the remaining limit of each key is split between its lines
+        by the configured allocation policy (one pass over the items).
+        Usage and limits are read from the validator's prefetched usage and rule snapshot.
+        
+        Returns:
+            Totals, per-item adjustments and 'refund_plan' (per-key allocation)
         """
-        batch_id = LimitService._get_current_batch_id()
-        adjustments = []
-        total_original = Decimal('0')
-        total_adjusted = Decimal('0')
+        lines = []
+        owners = []  # line index -> (item index, detail)
         
-        for item in validated_items:
+        for item_index, item in enumerate(validated_items):
             if item['status'] == 'error':
                 continue
-                
-            number = item['normalized_number']
-            original_amount = item['total_amount']
-            total_original += original_amount
-            
-            # Simulate limit checking for each field
-            item_adjustments = []
-            item_adjusted_amount = Decimal('0')
-            
             for detail in item['details']:
                 field = detail['field']
-                amount = Decimal(str(detail['amount']))
-                
-                # Get current usage (simulate real-time data)
-                current_usage = LimitService.get_current_usage(field, number, batch_id)
-                limit = LimitService.get_individual_limit(field, number)
-                
-                # Calculate maximum allowed amount
-                available_limit = max(Decimal('0'), limit - current_usage)
-                adjusted_amount = min(amount, available_limit)
-                
-                if adjusted_amount < amount:
-                    refund = amount - adjusted_amount
-                    item_adjustments.append({
-                        'field': field,
-                        'field_display': detail['field_display'],
-                        'original_amount': float(amount),
-                        'adjusted_amount': float(adjusted_amount),
-                        'refund': float(refund),
-                        'reason': 'เกินขีดจำกัด'
-                    })
-                
-                item_adjusted_amount += adjusted_amount
-            
-            if item_adjustments:
-                adjustments.append({
-                    'number': number,
-                    'original_amount': float(original_amount),
-                    'adjusted_amount': float(item_adjusted_amount),
-                    'total_refund': float(original_amount - item_adjusted_amount),
-                    'field_adjustments': item_adjustments
+                lines.append({
+                    'field': field,
+                    'number_norm': item['normalized_number'],
+                    'amount': Decimal(str(detail['amount'])),
+                    'payout_per_unit': Decimal(str(self.validator.payout_rates.get(field, 0)))
+                                       * Decimal(str(detail['payout_factor']))
                 })
+                owners.append((item_index, detail))
+        
+        capacity = {}
+        for line in lines:
+            key = (line['field'], canonical_number(line['field'], line['number_norm']))
+            if key not in capacity:
+                capacity[key] = self.validator.snapshot.limit_for(*key) - self.validator.get_usage(*key)
+        
+        allocation = self.allocator.allocate(lines, capacity)
+        
+        # Regroup line results per item (lines are in item order)
+        adjustments = []
+        total_original = Decimal('0')
+        total_adjusted = Decimal('0')
+        current = None
+        
+        for line, (item_index, detail), adjusted_amount in zip(lines, owners, allocation['allocated']):
+            if current is None or current['index'] != item_index:
+                if current is not None and current['field_adjustments']:
+                    adjustments.append(current)
+                item = validated_items[item_index]
+                current = {
+                    'index': item_index,
+                    'number': item['normalized_number'],
+                    'original_amount': item['total_amount'],
+                    'adjusted_amount': Decimal('0'),
+                    'field_adjustments': []
+                }
+                total_original += item['total_amount']
             
-            total_adjusted += item_adjusted_amount
+            amount = line['amount']
+            current['adjusted_amount'] += adjusted_amount
+            total_adjusted += adjusted_amount
+            
+            if adjusted_amount < amount:
+                current['field_adjustments'].append({
+                    'field': line['field'],
+                    'field_display': detail['field_display'],
+                    'original_amount': float(amount),
+                    'adjusted_amount': float(adjusted_amount),
+                    'refund': float(amount - adjusted_amount),
+                    'reason': 'เกินขีดจำกัด'
+                })
+        
+        if current is not None and current['field_adjustments']:
+            adjustments.append(current)
+        
+        adjustments = [
+            {
+                'number': adj['number'],
+                'original_amount': float(adj['original_amount']),
+                'adjusted_amount': float(adj['adjusted_amount']),
+                'total_refund': float(adj['original_amount'] - adj['adjusted_amount']),
+                'field_adjustments': adj['field_adjustments']
+            }
+            for adj in adjustments
+        ]
+        
+        refund_plan = [
+            {
+                'field': key['field'],
+                'number_norm': key['number_norm'],
+                'requested': float(key['requested']),
+                'capacity': float(key['capacity']),
+                'allocated': float(key['allocated']),
+                'refund': float(key['requested'] - key['allocated'])
+            }
+            for key in allocation['keys']
+            if key['allocated'] < key['requested']
+        ]
         
         return {
             'total_original': float(total_original),
             'total_adjusted': float(total_adjusted),
             'total_refund': float(total_original - total_adjusted),
             'adjustments': adjustments,
-            'has_adjustments': len(adjustments) > 0
+            'has_adjustments': len(adjustments) > 0,
+            'policy': self.allocator.policy,
+            'refund_plan': refund_plan
         }
 
 # API Endpoints
@@ -354,8 +442,9 @@ def validate_order():
                 'error': 'รายการเกินจำนวนสูงสุด 20 รายการ'
             }), 400
         
-        # Validate all items
+        # Validate all items (rules from snapshot, usage in one query)
         validator = OrderValidator()
+        validator.prefetch_usage(items)
         validation_results = []
         summary = {
             'total_items': 0,
@@ -407,7 +496,7 @@ def validate_order():
             'success': True,
             'validation_results': results_json,
             'summary': summary_json,
-            'batch_id': LimitService._get_current_batch_id(),
+            'batch_id': validator.batch_id,
             'validated_at': datetime.now().isoformat()
         })
         
@@ -427,7 +516,8 @@ def submit_order():
     {
         "customer_name": "ชื่อลูกค้า",
         "items": [...],  // Same format as validate_order
-        "validation_token": "token_from_validation"  // Optional for extra security
+        "validation_token": "token_from_validation",  // Optional for extra security
+        "allocation_policy": "first_come"  // Optional: first_come, proportional, max_payout_safe
     }
     """
     try:
@@ -438,9 +528,17 @@ def submit_order():
                 'error': 'ข้อมูลไม่ถูกต้อง'
             }), 400
         
+        policy = data.get('allocation_policy')
+        if policy is not None and policy not in POLICIES:
+            return jsonify({
+                'success': False,
+                'error': f'allocation_policy ไม่ถูกต้อง (ใช้ได้: {", ".join(POLICIES)})'
+            }), 400
+        
         # Re-validate items (security measure)
         validator = OrderValidator()
-        processor = OrderProcessor()
+        validator.prefetch_usage(data['items'])
+        processor = OrderProcessor(validator, policy)
         
         validated_items = []
         for item_data in data['items']:
@@ -503,7 +601,7 @@ def get_blocked_numbers():
 def get_payout_rates():
     """Get current payout rates"""
     try:
-        rates = LimitService.get_base_payout_rates()
+        rates = get_rule_snapshot().payout_rates
         return jsonify({
             'success': True,
             'payout_rates': rates,
@@ -2,6 +2,9 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from app.models import Order, OrderItem, User
 from app import db
+from app.services.limit_service import LimitService
+from app.services.user_stats_service import UserStatsService
+from app.utils.pagination import keyset_paginate, InvalidCursor
 from datetime import datetime, timedelta
 
 user_bp = Blueprint('user', __name__)
@@ -13,23 +16,12 @@ def dashboard():
     if current_user.is_admin():
         return redirect(url_for('admin.dashboard'))
     
-    # Get user's recent orders
-    recent_orders = Order.query.filter_by(user_id=current_user.id)\
-                              .order_by(Order.created_at.desc())\
-                              .limit(10).all()
-    
-    # Get statistics
-    total_orders = Order.query.filter_by(user_id=current_user.id).count()
-    total_amount = db.session.query(db.func.sum(Order.total_amount))\
-                            .filter_by(user_id=current_user.id).scalar() or 0
-    
-    # Create stats object for template
-    stats = {
-        'total_orders': total_orders,
-        'total_amount': total_amount,
-        'pending_orders': Order.query.filter_by(user_id=current_user.id, status='pending').count(),
-        'completed_orders': Order.query.filter_by(user_id=current_user.id, status='completed').count()
-    }
+    # Recent orders + running statistics (user_stats) in one query
+    dashboard_data = UserStatsService.get_dashboard_data(
+        current_user.id, LimitService._get_current_batch_id()
+    )
+    recent_orders = dashboard_data['recent_orders']
+    stats = dashboard_data['stats']
     
     # Payout rates for display
     payout_rates = {
@@ -51,10 +43,16 @@ def orders():
     if current_user.is_admin():
         return redirect(url_for('admin.orders'))
     
-    page = request.args.get('page', 1, type=int)
-    orders = Order.query.filter_by(user_id=current_user.id)\
-                       .order_by(Order.created_at.desc())\
-                       .paginate(page=page, per_page=20, error_out=False)
+    # Keyset pagination over idx_order_user_created
+    try:
+        orders = keyset_paginate(
+            Order.query.filter_by(user_id=current_user.id),
+            [Order.created_at, Order.id],
+            cursor=request.args.get('cursor'),
+            per_page=20
+        )
+    except InvalidCursor:
+        return redirect(url_for('user.orders'))
     
     return render_template('user/orders.html', orders=orders)
 
@@ -0,0 +1,522 @@
+"""
+Cold batch archive
+Closed batches are exported from orders / order_items / number_totals to
+fixed-width NumPy column files (one .npy per column, memory-mapped on read)
+plus a manifest, then deleted from the hot tables in chunks. ReportsService
+reads archived batches through ArchivedBatch.
+
+Layout (ARCHIVE_DIR, default <instance>/archive):
+    <batch_id>/manifest.json       schema, row counts, summary, sha256 per file
+    <batch_id>/dictionaries.json   values of dictionary-encoded string columns
+    <batch_id>/<table>.<column>.npy
+
+Amounts are stored as int64 satang, repeated strings as uint32 codes into a
+dictionary and timestamps as datetime64[us]. Files are plain .npy rather
+than compressed .npz because compressed members cannot be memory-mapped.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pytz
+from flask import current_app
+from sqlalchemy import delete
+
+from app import db
+from app.models import Order, OrderItem, NumberTotal, DownloadToken, AuditLog
+from app.services.limit_authority import limit_authority
+from app.utils.change_tracking import EXPOSURE_COUNTER, bump_counter, mark_exposure_reset
+
+BANGKOK_TZ = pytz.timezone('Asia/Bangkok')
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+DICTIONARIES = 'dictionaries.json'
+
+# table -> [(column, kind)]
+#   int / bool / float: numeric array, money: int64 satang,
+#   dict: uint32 codes + dictionary, str: fixed-width bytes,
+#   datetime: datetime64[us], date: datetime64[D]
+SCHEMA = {
+    'orders': [
+        ('id', 'int'), ('order_number', 'str'), ('user_id', 'int'), ('customer_name', 'dict'),
+        ('total_amount', 'money'), ('status', 'dict'), ('lottery_period', 'date'),
+        ('notes', 'dict'), ('created_at', 'datetime'),
+    ],
+    'order_items': [
+        ('id', 'int'), ('order_id', 'int'), ('user_id', 'int'), ('field', 'dict'),
+        ('number', 'dict'), ('number_norm', 'dict'), ('amount', 'money'), ('buy_amount', 'money'),
+        ('validation_factor', 'float'), ('validation_reason', 'dict'),
+        ('current_usage_at_time', 'money'), ('limit_at_time', 'money'), ('is_blocked', 'bool'),
+        ('payout_rate', 'float'), ('potential_payout', 'money'), ('created_at', 'datetime'),
+    ],
+    'number_totals': [
+        ('field', 'dict'), ('number_norm', 'dict'), ('total_amount', 'money'), ('order_count', 'int'),
+    ],
+}
+
+NUMERIC_DTYPES = {'int': np.int64, 'bool': np.bool_, 'float': np.float64, 'money': np.int64}
+
+
+class ArchiveError(Exception):
+    """Raised when a batch cannot be archived"""
+    pass
+
+
+def _to_satang(value) -> int:
+    return int((Decimal(str(value or 0)) * 100).to_integral_value())
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _ColumnWriter:
+    """Collects one table's rows column by column"""
+
+    def __init__(self, table: str):
+        self.table = table
+        self.columns = {name: [] for name, _ in SCHEMA[table]}
+        self.dictionaries = {name: {} for name, kind in SCHEMA[table] if kind == 'dict'}
+
+    def append(self, row: Dict):
+        for name, kind in SCHEMA[self.table]:
+            value = row.get(name)
+            if kind == 'dict':
+                value = '' if value is None else str(value)
+                codes = self.dictionaries[name]
+                value = codes.setdefault(value, len(codes))
+            elif kind == 'money':
+                value = _to_satang(value)
+            elif kind == 'float':
+                value = float('nan') if value is None else float(value)
+            elif kind in ('datetime', 'date') and value is not None and getattr(value, 'tzinfo', None):
+                value = value.replace(tzinfo=None)
+            self.columns[name].append(value)
+
+    def write(self, directory: str) -> Tuple[int, Dict[str, Dict], Dict[str, List[str]]]:
+        """Write column files; returns (rows, column schema, dictionaries)"""
+        schema = {}
+        for name, kind in SCHEMA[self.table]:
+            values = self.columns[name]
+            if kind == 'dict':
+                array = np.asarray(values, dtype=np.uint32)
+            elif kind == 'str':
+                array = np.asarray([(v or '').encode('utf-8') for v in values], dtype=np.bytes_)
+            elif kind == 'datetime':
+                array = np.asarray(values, dtype='datetime64[us]')
+            elif kind == 'date':
+                array = np.asarray(values, dtype='datetime64[D]')
+            else:
+                array = np.asarray(values, dtype=NUMERIC_DTYPES[kind])
+
+            filename = f"{self.table}.{name}.npy"
+            np.save(os.path.join(directory, filename), array, allow_pickle=False)
+            schema[name] = {'file': filename, 'kind': kind, 'dtype': array.dtype.str}
+
+        dictionaries = {
+            f"{self.table}.{name}": sorted(codes, key=codes.get)
+            for name, codes in self.dictionaries.items()
+        }
+        return len(next(iter(self.columns.values()))), schema, dictionaries
+
+
+class ArchivedBatch:
+    """Read access to one archived batch (columns are memory-mapped on first use)"""
+
+    def __init__(self, path: str, manifest: Dict):
+        self.path = path
+        self.manifest = manifest
+        self.batch_id = manifest['batch_id']
+        self._columns = {}
+        self._dictionaries = None
+        self._lock = threading.Lock()
+
+    @property
+    def lottery_period(self):
+        value = self.manifest.get('lottery_period')
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+    def rows(self, table: str) -> int:
+        return self.manifest['tables'][table]['rows']
+
+    def column(self, table: str, name: str) -> np.ndarray:
+        """Raw column array (dictionary codes for 'dict' columns)"""
+        key = (table, name)
+        array = self._columns.get(key)
+        if array is None:
+            info = self.manifest['tables'][table]['columns'][name]
+            path = os.path.join(self.path, info['file'])
+            # Zero-length arrays cannot be memory-mapped
+            array = np.load(path, mmap_mode='r' if self.rows(table) else None, allow_pickle=False)
+            with self._lock:
+                self._columns[key] = array
+        return array
+
+    def dictionary(self, table: str, name: str) -> List[str]:
+        if self._dictionaries is None:
+            with open(os.path.join(self.path, DICTIONARIES), encoding='utf-8') as f:
+                self._dictionaries = json.load(f)
+        return self._dictionaries[f"{table}.{name}"]
+
+    def code_of(self, table: str, name: str, value: str) -> Optional[int]:
+        """Dictionary code for a value (None if the value never occurs)"""
+        try:
+            return self.dictionary(table, name).index(value)
+        except ValueError:
+            return None
+
+    def amount(self, table: str, name: str) -> np.ndarray:
+        """Money column in baht (float64)"""
+        return self.column(table, name) / 100.0
+
+    def item_mask(self, field: str = None, number_norm: str = None,
+                  exclude_cancelled: bool = False) -> np.ndarray:
+        """Boolean mask over order_items (optionally without items of cancelled orders)"""
+        mask = np.ones(self.rows('order_items'), dtype=bool)
+        if exclude_cancelled:
+            code = self.code_of('orders', 'status', 'cancelled')
+            if code is not None:
+                cancelled = np.asarray(self.column('orders', 'id'))[np.asarray(self.column('orders', 'status')) == code]
+                mask &= ~np.isin(np.asarray(self.column('order_items', 'order_id')), cancelled)
+        for name, value in (('field', field), ('number_norm', number_norm)):
+            if value is None:
+                continue
+            code = self.code_of('order_items', name, value)
+            if code is None:
+                return np.zeros_like(mask)
+            mask &= self.column('order_items', name) == code
+        return mask
+
+    def aggregate_items(self, by: Tuple[str, ...], mask: np.ndarray = None) -> List[SimpleNamespace]:
+        """
+        Group order_items and compute report metrics per group
+
+        Args:
+            by: Grouping columns (order_items columns, or 'hour' for created_at
+                truncated to the hour)
+            mask: Optional row filter
+
+        Returns:
+            Rows with the grouping columns (decoded) plus total_amount, count,
+            unique_users, avg_factor, normal_amount (factor 1.0),
+            reduced_amount (factor 0.5), reduced_below_one (factor < 1.0),
+            blocked_amount, first_order, last_order
+        """
+        table = 'order_items'
+        if mask is None:
+            mask = np.ones(self.rows(table), dtype=bool)
+        if not mask.any():
+            return []
+
+        amount = self.amount(table, 'amount')[mask]
+        factor = np.asarray(self.column(table, 'validation_factor'))[mask]
+        blocked = np.asarray(self.column(table, 'is_blocked'))[mask]
+        users = np.asarray(self.column(table, 'user_id'))[mask]
+        created = np.asarray(self.column(table, 'created_at'))[mask]
+
+        keys = []
+        for name in by:
+            if name == 'hour':
+                keys.append(created.astype('datetime64[h]').astype(np.int64))
+            else:
+                keys.append(np.asarray(self.column(table, name))[mask])
+
+        if keys:
+            _, group_index = np.unique(
+                np.rec.fromarrays(keys) if len(keys) > 1 else keys[0], return_inverse=True
+            )
+            group_index = group_index.ravel()
+        else:
+            group_index = np.zeros(len(amount), dtype=np.int64)
+        groups = int(group_index.max()) + 1
+
+        count = np.bincount(group_index, minlength=groups)
+        total = np.bincount(group_index, weights=amount, minlength=groups)
+        valid_factor = ~np.isnan(factor)
+        factor_sum = np.bincount(group_index, weights=np.where(valid_factor, factor, 0), minlength=groups)
+        factor_count = np.bincount(group_index, weights=valid_factor, minlength=groups)
+        normal = np.bincount(group_index, weights=np.where(factor == 1.0, amount, 0), minlength=groups)
+        reduced = np.bincount(group_index, weights=np.where(factor == 0.5, amount, 0), minlength=groups)
+        below_one = np.bincount(group_index, weights=np.where(factor < 1.0, amount, 0), minlength=groups)
+        blocked_total = np.bincount(group_index, weights=np.where(blocked, amount, 0), minlength=groups)
+
+        user_pairs = np.unique(np.stack([group_index, users]), axis=1)
+        unique_users = np.bincount(user_pairs[0], minlength=groups)
+
+        first_index = np.full(groups, -1, dtype=np.int64)
+        last_index = np.full(groups, -1, dtype=np.int64)
+        order = np.argsort(created, kind='stable')
+        first_index[group_index[order[::-1]]] = order[::-1]
+        last_index[group_index[order]] = order
+
+        # Representative row per group to decode its key values
+        representative = first_index
+
+        rows = []
+        for g in range(groups):
+            row = SimpleNamespace(
+                total_amount=float(round(total[g], 2)),
+                count=int(count[g]),
+                unique_users=int(unique_users[g]),
+                avg_factor=float(factor_sum[g] / factor_count[g]) if factor_count[g] else None,
+                normal_amount=float(round(normal[g], 2)),
+                reduced_amount=float(round(reduced[g], 2)),
+                reduced_below_one=float(round(below_one[g], 2)),
+                blocked_amount=float(round(blocked_total[g], 2)),
+                first_order=created[first_index[g]].astype(datetime),
+                last_order=created[last_index[g]].astype(datetime),
+            )
+            for name, key in zip(by, keys):
+                value = key[representative[g]]
+                if name == 'hour':
+                    value = np.datetime64(int(value), 'h').astype(datetime).strftime('%Y-%m-%d %H:00:00')
+                elif dict(SCHEMA[table])[name] == 'dict':
+                    value = self.dictionary(table, name)[int(value)]
+                elif name == 'validation_factor':
+                    # Numeric(3, 2) in the hot table
+                    value = Decimal(str(float(value))).quantize(Decimal('0.01'))
+                else:
+                    value = value.item()
+                setattr(row, name, value)
+            rows.append(row)
+
+        # Same order as GROUP BY in the database
+        rows.sort(key=lambda row: tuple(getattr(row, name) for name in by))
+        return rows
+
+    def order_summary(self) -> SimpleNamespace:
+        """Overview of the batch's orders"""
+        users = np.asarray(self.column('orders', 'user_id'))
+        return SimpleNamespace(
+            batch_id=self.batch_id,
+            lottery_period=self.lottery_period,
+            total_orders=self.rows('orders'),
+            unique_users=int(np.unique(users).size),
+            grand_total=float(self.column('orders', 'total_amount').sum()) / 100.0
+        )
+
+
+class ArchiveService:
+    """Service class for batch archival"""
+
+    _cache: Dict[str, Tuple[float, ArchivedBatch]] = {}
+    _cache_lock = threading.Lock()
+
+    @staticmethod
+    def archive_dir() -> str:
+        return current_app.config.get('ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'archive')
+
+    @staticmethod
+    def open_batch_ids() -> set:
+        """Batch ids still open for orders (never archived)"""
+        from app.services.limit_service import LimitService
+        from app.services.order_service import OrderService
+        return {LimitService._get_current_batch_id(), OrderService.get_current_batch_id()}
+
+    @staticmethod
+    def closed_batch_ids() -> List[str]:
+        """Batches in the hot tables that are no longer open"""
+        open_ids = ArchiveService.open_batch_ids()
+        batch_ids = [row[0] for row in db.session.query(Order.batch_id).distinct()]
+        return sorted(b for b in batch_ids if b not in open_ids)
+
+    @staticmethod
+    def get_archived_batch(batch_id: str) -> Optional[ArchivedBatch]:
+        """Archived batch (cached until its manifest changes), or None"""
+        path = os.path.join(ArchiveService.archive_dir(), batch_id)
+        manifest_path = os.path.join(path, MANIFEST)
+        try:
+            mtime = os.path.getmtime(manifest_path)
+        except OSError:
+            return None
+
+        cached = ArchiveService._cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(manifest_path, encoding='utf-8') as f:
+            archive = ArchivedBatch(path, json.load(f))
+        with ArchiveService._cache_lock:
+            ArchiveService._cache[path] = (mtime, archive)
+        return archive
+
+    @staticmethod
+    def list_archived_batches() -> List[Dict]:
+        """Manifest summaries of every archived batch"""
+        root = ArchiveService.archive_dir()
+        if not os.path.isdir(root):
+            return []
+        batches = []
+        for name in sorted(os.listdir(root)):
+            archive = ArchiveService.get_archived_batch(name)
+            if archive is not None:
+                batches.append(archive.manifest['summary'])
+        return batches
+
+    @staticmethod
+    def _export(batch_id: str, directory: str) -> Dict:
+        """Stream the batch's rows into column files; returns the manifest"""
+        orders = _ColumnWriter('orders')
+        lottery_period = None
+        for order in db.session.query(Order).filter(Order.batch_id == batch_id).order_by(Order.id).yield_per(2000):
+            lottery_period = lottery_period or order.lottery_period
+            orders.append({c: getattr(order, c) for c, _ in SCHEMA['orders']})
+
+        items = _ColumnWriter('order_items')
+        item_query = db.session.query(OrderItem, Order.user_id).join(
+            Order, Order.id == OrderItem.order_id
+        ).filter(Order.batch_id == batch_id).order_by(OrderItem.id).yield_per(5000)
+        for item, user_id in item_query:
+            row = {c: getattr(item, c, None) for c, _ in SCHEMA['order_items']}
+            row['user_id'] = user_id
+            items.append(row)
+
+        totals = _ColumnWriter('number_totals')
+        for total in db.session.query(NumberTotal).filter(NumberTotal.batch_id == batch_id):
+            totals.append({c: getattr(total, c) for c, _ in SCHEMA['number_totals']})
+
+        tables = {}
+        dictionaries = {}
+        for writer in (orders, items, totals):
+            rows, columns, table_dictionaries = writer.write(directory)
+            tables[writer.table] = {'rows': rows, 'columns': columns}
+            dictionaries.update(table_dictionaries)
+
+        with open(os.path.join(directory, DICTIONARIES), 'w', encoding='utf-8') as f:
+            json.dump(dictionaries, f, ensure_ascii=False)
+
+        created = orders.columns['created_at']
+        return {
+            'format_version': FORMAT_VERSION,
+            'batch_id': batch_id,
+            'lottery_period': lottery_period.isoformat() if lottery_period else None,
+            'archived_at': datetime.now(BANGKOK_TZ).isoformat(),
+            'tables': tables,
+            'summary': {
+                'batch_id': batch_id,
+                'lottery_period': lottery_period.isoformat() if lottery_period else None,
+                'order_count': tables['orders']['rows'],
+                'total_amount': sum(orders.columns['total_amount']) / 100.0,
+                'first_order': min(created).isoformat() if created else None,
+                'last_order': max(created).isoformat() if created else None,
+                'archived': True
+            },
+            'checksums': {
+                filename: _sha256(os.path.join(directory, filename))
+                for filename in sorted(os.listdir(directory))
+            }
+        }
+
+    @staticmethod
+    def _delete_hot_rows(order_ids: List[int], batch_id: str, chunk_size: int) -> None:
+        """Delete archived rows from the hot tables, one short transaction per chunk"""
+        from app.utils.db_engine import immediate_transaction
+
+        for start in range(0, len(order_ids), chunk_size):
+            chunk = order_ids[start:start + chunk_size]
+            immediate_transaction(db.session)
+            db.session.execute(delete(DownloadToken).where(DownloadToken.order_id.in_(chunk)))
+            db.session.execute(delete(OrderItem).where(OrderItem.order_id.in_(chunk)))
+            db.session.execute(delete(Order).where(Order.id.in_(chunk)))
+            db.session.commit()
+
+        immediate_transaction(db.session)
+        db.session.execute(delete(NumberTotal).where(NumberTotal.batch_id == batch_id))
+        bump_counter(db.session.connection(), EXPOSURE_COUNTER)
+        mark_exposure_reset(db.session, [batch_id])
+        db.session.commit()
+        limit_authority.resync([batch_id])
+
+    @staticmethod
+    def archive_batch(batch_id: str, delete_hot: bool = True, chunk_size: int = 500,
+                      user_id: int = None, force: bool = False) -> Dict:
+        """
+        Archive one closed batch
+
+        Args:
+            batch_id: Batch to archive
+            delete_hot: Remove the batch from the hot tables after a verified export
+            chunk_size: Orders deleted per transaction
+            user_id: User ID for audit log
+            force: Allow archiving a batch that is still open
+
+        Returns:
+            Manifest summary
+        """
+        if not force and batch_id in ArchiveService.open_batch_ids():
+            raise ArchiveError(f"Batch {batch_id} is still open")
+
+        root = ArchiveService.archive_dir()
+        path = os.path.join(root, batch_id)
+        hot_orders = [row[0] for row in db.session.query(Order.id).filter(
+            Order.batch_id == batch_id
+        ).order_by(Order.id)]
+
+        archive = ArchiveService.get_archived_batch(batch_id)
+        if archive is None:
+            if not hot_orders:
+                raise ArchiveError(f"Batch {batch_id} has no orders")
+
+            os.makedirs(root, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+
+            manifest = ArchiveService._export(batch_id, tmp_path)
+            with open(os.path.join(tmp_path, MANIFEST), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            db.session.rollback()  # end the export's read transaction
+
+            os.replace(tmp_path, path)
+            archive = ArchiveService.get_archived_batch(batch_id)
+
+        # Only delete what the archive provably contains (also resumes an
+        # interrupted run whose export already finished)
+        archived_ids = set(np.asarray(archive.column('orders', 'id')).tolist())
+        missing = [order_id for order_id in hot_orders if order_id not in archived_ids]
+        if missing:
+            raise ArchiveError(
+                f"Batch {batch_id} has {len(missing)} orders that are not in the archive"
+            )
+
+        if delete_hot and hot_orders:
+            ArchiveService._delete_hot_rows(hot_orders, batch_id, chunk_size)
+
+            db.session.add(AuditLog(
+                user_id=user_id,
+                action='archive_batch',
+                resource='batch',
+                resource_id=batch_id,
+                details={
+                    'orders': archive.rows('orders'),
+                    'items': archive.rows('order_items'),
+                    'path': path
+                }
+            ))
+            db.session.commit()
+
+        return archive.manifest['summary']
+
+    @staticmethod
+    def verify(batch_id: str) -> bool:
+        """Check every archived file against its manifest checksum"""
+        archive = ArchiveService.get_archived_batch(batch_id)
+        if archive is None:
+            return False
+        return all(
+            _sha256(os.path.join(archive.path, filename)) == checksum
+            for filename, checksum in archive.manifest['checksums'].items()
+        )
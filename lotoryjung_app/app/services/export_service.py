@@ -0,0 +1,385 @@
+"""
+Streaming report export
+CSV / XLSX downloads of the sales and risk reports. Rows are produced by
+generators over yield_per queries (server-side cursors on PostgreSQL) or
+chunks of an archived batch's memory-mapped columns, so memory stays flat
+however large the batch is.
+
+Reports:
+    sales_summary  - per field / number totals with potential payout
+    top_numbers    - numbers with the highest sales across all fields
+    number_detail  - every order item of one field / number
+    items          - full order item dump of the batch
+
+CSV is written row by row (UTF-8 with BOM so Excel shows Thai correctly).
+XLSX uses openpyxl's write-only mode, which spools rows to a temporary file
+that is then streamed back; a new sheet is started every XLSX_MAX_ROWS rows.
+All text values are passed through CSVSanitizer against formula injection.
+"""
+
+import os
+import tempfile
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import func, desc
+
+from app.models import Order, OrderItem, User
+from app.utils.read_routing import read_session
+from app.utils.security_utils import CSVSanitizer
+from app.services.sales_report_service import SalesReportService
+
+FORMATS = ('csv', 'xlsx')
+FIELDS = ('2_top', '2_bottom', '3_top', 'tote')
+
+FETCH_SIZE = 1000          # rows per database round-trip
+ARCHIVE_CHUNK_SIZE = 10000  # archived rows decoded per step
+CSV_FLUSH_ROWS = 500       # rows per chunk sent to the client
+XLSX_MAX_ROWS = 1048575    # data rows per sheet (plus one header row)
+STREAM_BLOCK_SIZE = 64 * 1024
+
+CENT = Decimal('0.01')
+
+COLUMNS = {
+    'sales_summary': [
+        'field', 'field_label', 'number', 'total_amount', 'order_count', 'unique_users',
+        'avg_factor', 'payout_rate', 'potential_payout',
+    ],
+    'top_numbers': [
+        'rank', 'field', 'field_label', 'number', 'total_amount', 'order_count',
+        'avg_factor', 'payout_rate', 'potential_payout',
+    ],
+    'number_detail': [
+        'order_number', 'created_at', 'user_id', 'username', 'customer_name', 'status',
+        'number', 'amount', 'validation_factor', 'validation_reason', 'is_blocked',
+        'payout_rate', 'potential_payout',
+    ],
+    'items': [
+        'item_id', 'order_number', 'order_status', 'user_id', 'username', 'customer_name',
+        'field', 'number', 'number_norm', 'amount', 'buy_amount', 'validation_factor',
+        'validation_reason', 'is_blocked', 'payout_rate', 'potential_payout', 'created_at',
+    ],
+}
+
+REPORTS = tuple(COLUMNS)
+
+
+class ExportError(Exception):
+    """Raised for invalid export parameters"""
+    pass
+
+
+def _format_datetime(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ExportService:
+    """Service class for streaming report exports"""
+
+    @staticmethod
+    def prepare(report: str, batch_id: str, fmt: str = 'csv', field: str = None,
+                number: str = None, limit: int = 50) -> Tuple[List[str], Iterator[list]]:
+        """
+        Validate export parameters and build the row generator
+
+        Validation happens here rather than inside the generator so errors
+        can still be returned as JSON before the response starts.
+
+        Args:
+            report: One of REPORTS
+            batch_id: Batch to export
+            fmt: 'csv' or 'xlsx'
+            field: Field (number_detail only)
+            number: Normalized number (number_detail only)
+            limit: Number of rows (top_numbers only)
+
+        Returns:
+            Tuple of (header, rows)
+        """
+        if report not in COLUMNS:
+            raise ExportError(f"ไม่รู้จักรายงาน {report}")
+        if fmt not in FORMATS:
+            raise ExportError(f"รองรับเฉพาะ {', '.join(FORMATS)}")
+        if not batch_id:
+            raise ExportError('กรุณาระบุ batch_id')
+
+        from app.services.archive_service import ArchiveService
+        archive = ArchiveService.get_archived_batch(batch_id)
+
+        if report == 'sales_summary':
+            rows = ExportService._sales_summary_rows(batch_id, archive)
+        elif report == 'top_numbers':
+            if limit < 1:
+                raise ExportError('limit ต้องมากกว่า 0')
+            rows = ExportService._top_numbers_rows(batch_id, limit, archive)
+        elif report == 'number_detail':
+            if field not in FIELDS or not number:
+                raise ExportError('กรุณาระบุ field และ number')
+            rows = ExportService._item_rows(batch_id, archive, field=field, number=number, detail=True)
+        else:
+            rows = ExportService._item_rows(batch_id, archive)
+
+        return COLUMNS[report], rows
+
+    @staticmethod
+    def filename(report: str, batch_id: str, fmt: str) -> str:
+        safe_batch = ''.join(c for c in batch_id if c.isalnum() or c in '-_')
+        return f"{report}_{safe_batch}.{fmt}"
+
+    # ------------------------------------------------------------------
+    # Row generators
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _grouped_rows(batch_id: str, archive, order_by_field: bool, limit: int = None) -> Iterator:
+        """(field, number_norm, total_amount, order_count, unique_users, avg_factor) per number (first limit rows)"""
+        if archive is not None:
+            rows = archive.aggregate_items(('field', 'number_norm'))
+            if order_by_field:
+                rows.sort(key=lambda r: (r.field, -r.total_amount))
+            else:
+                rows.sort(key=lambda r: -r.total_amount)
+            for r in rows[:limit]:
+                total_amount = Decimal(str(r.total_amount)).quantize(CENT)
+                yield r.field, r.number_norm, total_amount, r.count, r.unique_users, r.avg_factor
+            return
+
+        total = func.sum(OrderItem.amount)
+        query = read_session().query(
+            OrderItem.field,
+            OrderItem.number_norm,
+            total.label('total_amount'),
+            func.count(OrderItem.id).label('order_count'),
+            func.count(func.distinct(Order.user_id)).label('unique_users'),
+            func.avg(OrderItem.validation_factor).label('avg_factor')
+        ).join(Order, Order.id == OrderItem.order_id).filter(
+            Order.batch_id == batch_id
+        ).group_by(OrderItem.field, OrderItem.number_norm)
+
+        if order_by_field:
+            query = query.order_by(OrderItem.field, desc(total))
+        else:
+            query = query.order_by(desc(total))
+        if limit is not None:
+            query = query.limit(limit)
+
+        for row in query.yield_per(FETCH_SIZE):
+            yield (row.field, row.number_norm, row.total_amount, row.order_count,
+                   row.unique_users, row.avg_factor)
+
+    @staticmethod
+    def _payout_row(field: str, total_amount, avg_factor, rates: dict) -> Tuple[float, float, float]:
+        """(avg_factor, payout_rate, potential_payout) as in SalesReportService"""
+        if field not in rates:
+            rates[field] = SalesReportService._get_payout_rate(field)
+        avg_factor = float(avg_factor) if avg_factor is not None else 1.0
+        potential_payout = float(total_amount) * rates[field] * avg_factor
+        return round(avg_factor, 3), rates[field], round(potential_payout, 2)
+
+    @staticmethod
+    def _sales_summary_rows(batch_id: str, archive) -> Iterator[list]:
+        rates = {}
+        grouped = ExportService._grouped_rows(batch_id, archive, order_by_field=True)
+        for field, number, total_amount, order_count, unique_users, avg_factor in grouped:
+            avg_factor, payout_rate, potential_payout = ExportService._payout_row(
+                field, total_amount, avg_factor, rates
+            )
+            yield [
+                field, SalesReportService._get_field_label(field), number, total_amount,
+                order_count, unique_users, avg_factor, payout_rate, potential_payout
+            ]
+
+    @staticmethod
+    def _top_numbers_rows(batch_id: str, limit: int, archive) -> Iterator[list]:
+        rates = {}
+        grouped = ExportService._grouped_rows(batch_id, archive, order_by_field=False, limit=limit)
+        for rank, (field, number, total_amount, order_count, _, avg_factor) in enumerate(grouped, 1):
+            avg_factor, payout_rate, potential_payout = ExportService._payout_row(
+                field, total_amount, avg_factor, rates
+            )
+            yield [
+                rank, field, SalesReportService._get_field_label(field), number, total_amount,
+                order_count, avg_factor, payout_rate, potential_payout
+            ]
+
+    @staticmethod
+    def _item_rows(batch_id: str, archive, field: str = None, number: str = None,
+                   detail: bool = False) -> Iterator[list]:
+        """Order items of the batch, one output row per item"""
+        if archive is not None:
+            yield from ExportService._archived_item_rows(archive, field, number, detail)
+            return
+
+        query = read_session().query(
+            OrderItem.id, Order.order_number, Order.status, Order.user_id, User.username,
+            Order.customer_name, OrderItem.field, OrderItem.number, OrderItem.number_norm,
+            OrderItem.amount, OrderItem.buy_amount, OrderItem.validation_factor,
+            OrderItem.validation_reason, OrderItem.is_blocked, OrderItem.payout_rate,
+            OrderItem.potential_payout, OrderItem.created_at
+        ).join(
+            Order, Order.id == OrderItem.order_id
+        ).outerjoin(
+            User, User.id == Order.user_id
+        ).filter(Order.batch_id == batch_id)
+
+        if field is not None:
+            query = query.filter(OrderItem.field == field, OrderItem.number_norm == number)
+
+        for row in query.order_by(OrderItem.id).yield_per(FETCH_SIZE):
+            yield ExportService._item_row(
+                detail, row.id, row.order_number, row.status, row.user_id, row.username,
+                row.customer_name, row.field, row.number, row.number_norm, row.amount,
+                row.buy_amount, row.validation_factor, row.validation_reason, row.is_blocked,
+                row.payout_rate, row.potential_payout, _format_datetime(row.created_at)
+            )
+
+    @staticmethod
+    def _item_row(detail: bool, item_id, order_number, status, user_id, username, customer_name,
+                  field, number, number_norm, amount, buy_amount, validation_factor,
+                  validation_reason, is_blocked, payout_rate, potential_payout, created_at) -> list:
+        if detail:
+            return [
+                order_number, created_at, user_id, username, customer_name, status, number,
+                amount, validation_factor, validation_reason, is_blocked, payout_rate,
+                potential_payout
+            ]
+        return [
+            item_id, order_number, status, user_id, username, customer_name, field, number,
+            number_norm, amount, buy_amount, validation_factor, validation_reason, is_blocked,
+            payout_rate, potential_payout, created_at
+        ]
+
+    @staticmethod
+    def _archived_item_rows(archive, field: str, number: str, detail: bool) -> Iterator[list]:
+        """Decode archived order items chunk by chunk (columns stay memory-mapped)"""
+        import numpy as np
+
+        items = 'order_items'
+        if field is not None:
+            indices = np.flatnonzero(archive.item_mask(field, number))
+        else:
+            indices = None
+        total = archive.rows(items) if indices is None else len(indices)
+        if not total:
+            return
+
+        # Orders are small next to items; map order id -> row once
+        order_ids = np.asarray(archive.column('orders', 'id'))
+        order_sorter = np.argsort(order_ids)
+        order_numbers = archive.column('orders', 'order_number')
+        order_status = archive.column('orders', 'status')
+        order_customer = archive.column('orders', 'customer_name')
+
+        user_ids = np.unique(np.asarray(archive.column('orders', 'user_id'))).tolist()
+        usernames = dict(
+            read_session().query(User.id, User.username).filter(User.id.in_(user_ids))
+        ) if user_ids else {}
+
+        def decoded(table, name, codes):
+            values = archive.dictionary(table, name)
+            return [values[c] or None for c in codes.tolist()]
+
+        def money(array):
+            return [Decimal(int(v)).scaleb(-2) for v in array.tolist()]
+
+        def numeric(array):
+            # Numeric(_, 2) columns in the hot tables
+            return [None if np.isnan(v) else Decimal(str(v)).quantize(CENT) for v in array.tolist()]
+
+        for start in range(0, total, ARCHIVE_CHUNK_SIZE):
+            if indices is None:
+                rows = slice(start, min(start + ARCHIVE_CHUNK_SIZE, total))
+            else:
+                rows = indices[start:start + ARCHIVE_CHUNK_SIZE]
+
+            def col(name):
+                return np.asarray(archive.column(items, name)[rows])
+
+            order_rows = order_sorter[np.searchsorted(order_ids, col('order_id'), sorter=order_sorter)]
+            created = np.datetime_as_string(col('created_at').astype('datetime64[s]'))
+
+            chunk = zip(
+                col('id').tolist(),
+                [v.decode('utf-8') for v in np.asarray(order_numbers[order_rows]).tolist()],
+                decoded('orders', 'status', np.asarray(order_status[order_rows])),
+                col('user_id').tolist(),
+                decoded('orders', 'customer_name', np.asarray(order_customer[order_rows])),
+                decoded(items, 'field', col('field')),
+                decoded(items, 'number', col('number')),
+                decoded(items, 'number_norm', col('number_norm')),
+                money(col('amount')),
+                money(col('buy_amount')),
+                numeric(col('validation_factor')),
+                decoded(items, 'validation_reason', col('validation_reason')),
+                col('is_blocked').tolist(),
+                numeric(col('payout_rate')),
+                money(col('potential_payout')),
+                [None if v == 'NaT' else v.replace('T', ' ') for v in created.tolist()],
+            )
+            for (item_id, order_number, status, user_id, customer_name, item_field, item_number,
+                 number_norm, amount, buy_amount, factor, reason, is_blocked, payout_rate,
+                 potential_payout, created_at) in chunk:
+                yield ExportService._item_row(
+                    detail, item_id, order_number, status, user_id, usernames.get(user_id),
+                    customer_name, item_field, item_number, number_norm, amount, buy_amount,
+                    factor, reason, is_blocked, payout_rate, potential_payout, created_at
+                )
+
+    # ------------------------------------------------------------------
+    # Encoders
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def iter_csv(header: List[str], rows: Iterator[list]) -> Iterator[str]:
+        """CSV text chunks (sanitized against formula injection)"""
+        buffer = ['\ufeff' + ','.join(CSVSanitizer.sanitize_csv_row(header)) + '\r\n']
+        for row in rows:
+            buffer.append(','.join(CSVSanitizer.sanitize_csv_row(row)) + '\r\n')
+            if len(buffer) >= CSV_FLUSH_ROWS:
+                yield ''.join(buffer)
+                buffer = []
+        if buffer:
+            yield ''.join(buffer)
+
+    @staticmethod
+    def _xlsx_value(value):
+        if isinstance(value, str):
+            return CSVSanitizer.escape_formula(value)
+        if isinstance(value, (datetime, date)):
+            return value
+        if isinstance(value, Decimal):
+            return float(value)
+        return value
+
+    @staticmethod
+    def iter_xlsx(header: List[str], rows: Iterator[list], title: str = 'export') -> Iterator[bytes]:
+        """XLSX file contents in blocks (rows are spooled to a temporary file first)"""
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = None
+        sheet_rows = XLSX_MAX_ROWS
+        sheets = 0
+        for row in rows:
+            if sheet_rows >= XLSX_MAX_ROWS:
+                sheets += 1
+                sheet = workbook.create_sheet(title[:28] if sheets == 1 else f"{title[:24]}_{sheets}")
+                sheet.append(header)
+                sheet_rows = 0
+            sheet.append([ExportService._xlsx_value(v) for v in row])
+            sheet_rows += 1
+        if sheet is None:
+            workbook.create_sheet(title[:28]).append(header)
+
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            workbook.save(path)
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(STREAM_BLOCK_SIZE), b''):
+                    yield block
+        finally:
+            os.remove(path)
@@ -0,0 +1,68 @@
+"""
+Exposure change feed
+NumberTotal changes of a batch since a sequence, for dashboards and
+terminals that show a whole board of numbers. Every transaction that
+changes number_totals stamps the rows it touches with the next
+'exposure_seq' value (app.utils.change_tracking); a client sends the
+sequence it holds and gets back only the totals changed since, as
+parallel arrays per field.
+
+Removed totals (cancelled down to zero, reconcile, archiving) set the
+batch's reset sequence; a client behind it gets the whole batch again.
+"""
+
+from typing import Dict, Optional
+
+from app import db
+from app.models import NumberTotal
+from app.utils.change_tracking import EXPOSURE_RESET_PREFIX, EXPOSURE_SEQ_COUNTER, get_counter
+
+
+class ExposureFeedService:
+    """Service class for the exposure change feed"""
+
+    @staticmethod
+    def current_seq() -> int:
+        """Sequence a client is compared against (one counter lookup)"""
+        return get_counter(EXPOSURE_SEQ_COUNTER)
+
+    @staticmethod
+    def changes_since(batch_id: str, since: Optional[int] = None) -> Dict:
+        """
+        Number totals of a batch changed after a sequence
+
+        The counter is read before the rows, so rows committed in between
+        may be sent twice but never missed.
+
+        Args:
+            batch_id: Batch ID
+            since: 'seq' from the client's last call (None: whole batch)
+
+        Returns:
+            Dict with 'batch_id', 'seq', 'full' (the totals replace everything
+            the client holds for the batch) and 'totals': field ->
+            {'numbers': [...], 'amounts': [...], 'counts': [...]}
+        """
+        seq = get_counter(EXPOSURE_SEQ_COUNTER)
+        reset = get_counter(f"{EXPOSURE_RESET_PREFIX}{batch_id}")
+        full = since is None or since < reset or since > seq
+
+        if not full and since == seq:
+            return {'batch_id': batch_id, 'seq': seq, 'full': False, 'totals': {}}
+
+        query = db.session.query(
+            NumberTotal.field, NumberTotal.number_norm, NumberTotal.total_amount, NumberTotal.order_count
+        ).filter(NumberTotal.batch_id == batch_id)
+        if not full:
+            query = query.filter(NumberTotal.seq > since)
+
+        totals = {}
+        for field, number_norm, amount, count in query.order_by(NumberTotal.field, NumberTotal.number_norm):
+            columns = totals.get(field)
+            if columns is None:
+                columns = totals[field] = {'numbers': [], 'amounts': [], 'counts': []}
+            columns['numbers'].append(number_norm)
+            columns['amounts'].append(float(amount))
+            columns['counts'].append(count)
+
+        return {'batch_id': batch_id, 'seq': seq, 'full': full, 'totals': totals}
@@ -0,0 +1,619 @@
+"""
+Limit authority
+Optional per-node process that owns the exposure book (usage per batch,
+field and number) and the rule snapshot in memory. Flask workers on the node
+ask it for usage/limit/blocked state - and reserve the amounts they are about
+to write - with one message per order over a Unix socket, instead of three
+queries per item.
+
+The database stays the durable source of truth:
+    - committed usage of a batch is loaded from number_totals on first use
+      and reloaded on resync (periodically and after cancels, reconciles,
+      archiving and orders written without a reservation)
+    - reservations (accepted but not yet committed orders) are written to an
+      append-only journal before they are acknowledged; after a restart the
+      journal is replayed and reservations whose order reached the database
+      are dropped, because the reloaded totals already contain them
+    - a reservation that is neither committed nor released within
+      LIMIT_AUTHORITY_RESERVATION_TTL expires and its batch is reloaded
+    - with WARM_SNAPSHOT_PATH set, the first load of a batch starts from the
+      warm-start snapshot (app.services.warm_snapshot), which the authority
+      also rewrites periodically and at shutdown
+
+Protocol: one JSON object per line, {"ops": [...]} answered by
+{"results": [...]} in the same order. Amounts travel as strings.
+    check    {"op": "check", "batch": b, "items": [[field, number_norm, amount], ...]}
+    reserve  {"op": "reserve", "ref": r, "batch": b, "items": [...]}
+             check + hold the amounts for ref (idempotent per ref)
+    commit   {"op": "commit", "ref": r, "batch": b}   order was written
+    release  {"op": "release", "ref": r}               order was not written
+    resync   {"op": "resync", "batches": [b, ...] | null}
+    stats    {"op": "stats"}
+check and reserve answer {"ok": true, "items": [[usage, limit, blocked], ...]};
+usage does not include the amounts of the message itself, like a database
+lookup made before the order is written.
+
+Settings:
+    LIMIT_AUTHORITY_SOCKET             - socket path; unset disables the client
+    LIMIT_AUTHORITY_JOURNAL            - journal file (default: <instance>/limit_authority.journal)
+    LIMIT_AUTHORITY_FSYNC              - fsync the journal before replying (default on)
+    LIMIT_AUTHORITY_TIMEOUT_MS         - client timeout per message (default 200)
+    LIMIT_AUTHORITY_RESERVATION_TTL    - seconds before a reservation expires (default 60)
+    LIMIT_AUTHORITY_RESYNC_SECONDS     - reload loaded batches from the database (default 30)
+    LIMIT_AUTHORITY_RULES_POLL_SECONDS - rule snapshot refresh interval (default 1)
+
+Run the server with `flask limit_authority`.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Compact the journal when it holds this many lines more than the live reservations
+JOURNAL_COMPACT_SLACK = 10000
+
+# After a failed request the client goes straight to the database for this long
+CLIENT_RETRY_SECONDS = 1.0
+
+
+class LimitAuthorityUnavailable(Exception):
+    """Raised by the client when the authority cannot be reached or fails a request"""
+    pass
+
+
+def _setting(app, name: str, default):
+    value = app.config.get(name)
+    return default if value in (None, '') else value
+
+
+def _flag(value) -> bool:
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+class _Reservation:
+    """Amounts held for one order reference"""
+
+    __slots__ = ('batch', 'items', 'created', 'results')
+
+    def __init__(self, batch: str, items: List[Tuple[str, str, Decimal]], created: float, results=None):
+        self.batch = batch
+        self.items = items
+        self.created = created
+        self.results = results
+
+
+class LimitAuthority:
+    """In-memory exposure book, rule snapshot and reservation journal"""
+
+    def __init__(self, app, journal_path: str, fsync: bool = True, reservation_ttl: float = 60,
+                 resync_seconds: float = 30, rules_poll_seconds: float = 1,
+                 snapshot_path: str = None, snapshot_interval: float = 60):
+        self.app = app
+        self.journal_path = journal_path
+        self.fsync = fsync
+        self.reservation_ttl = reservation_ttl
+        self.resync_seconds = resync_seconds
+        self.rules_poll_seconds = rules_poll_seconds
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        # Warm-start snapshot (app.services.warm_snapshot) for first batch loads
+        self.warm = app.extensions.get('warm_snapshot')
+
+        self._lock = threading.RLock()
+        # batch -> {(field, number_norm): Decimal}, database totals plus commits since load
+        self.committed: Dict[str, Dict[Tuple[str, str], Decimal]] = {}
+        # batch -> {(field, number_norm): Decimal}, sum of live reservations
+        self.reserved: Dict[str, Dict[Tuple[str, str], Decimal]] = {}
+        self.pending: Dict[str, _Reservation] = {}
+        # ref -> time, refs settled by a reload (a late commit must not add them again)
+        self.recent: Dict[str, float] = {}
+        self.stale = set()
+        self.rules = None
+        self.journal = None
+        self.journal_lines = 0
+        self.counters = {'messages': 0, 'loads': 0, 'warm_loads': 0, 'expired': 0}
+
+    # ------------------------------------------------------------------
+    # Journal
+
+    def open_journal(self):
+        """Replay the journal, keep live reservations and rewrite it compacted"""
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line of a crash: the reservation was never acknowledged
+                        continue
+                    if entry['t'] == 'R':
+                        items = [(f, n, Decimal(a)) for f, n, a in entry['items']]
+                        self.pending[entry['ref']] = _Reservation(entry['batch'], items, entry['ts'])
+                    else:
+                        self.pending.pop(entry['ref'], None)
+
+        for reservation in self.pending.values():
+            self._hold(reservation, 1)
+        self._compact()
+        logger.info("Limit authority journal %s: %d live reservations", self.journal_path, len(self.pending))
+
+    def _compact(self):
+        tmp_path = f"{self.journal_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as journal:
+            for ref, reservation in self.pending.items():
+                journal.write(self._reservation_line(ref, reservation))
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        self.journal_lines = len(self.pending)
+
+    @staticmethod
+    def _reservation_line(ref: str, reservation: _Reservation) -> str:
+        return json.dumps({
+            't': 'R', 'ref': ref, 'batch': reservation.batch, 'ts': reservation.created,
+            'items': [[f, n, str(a)] for f, n, a in reservation.items]
+        }, separators=(',', ':')) + '\n'
+
+    def _log(self, line: str):
+        self.journal.write(line)
+        self.journal_lines += 1
+
+    def _sync_journal(self):
+        """One flush (and fsync) per message, before the reply is sent"""
+        self.journal.flush()
+        if self.fsync:
+            os.fsync(self.journal.fileno())
+
+    # ------------------------------------------------------------------
+    # Book
+
+    def _hold(self, reservation: _Reservation, sign: int):
+        book = self.reserved.setdefault(reservation.batch, {})
+        for field, number, amount in reservation.items:
+            key = (field, number)
+            value = book.get(key, Decimal('0')) + sign * amount
+            if value:
+                book[key] = value
+            else:
+                book.pop(key, None)
+
+    def _load_batch(self, batch: str):
+        """Read committed totals (and which pending refs already reached the database) in one transaction"""
+        from app import db
+        from app.models import NumberTotal, Order
+
+        refs = [ref for ref, reservation in self.pending.items() if reservation.batch == batch]
+        try:
+            if self.app.config.get('DB_PROFILE') == 'postgresql':
+                # Both reads must see the same snapshot
+                db.session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+            rows = self._warm_rows(batch)
+            if rows is None:
+                rows = db.session.query(NumberTotal.field, NumberTotal.number_norm, NumberTotal.total_amount).filter(
+                    NumberTotal.batch_id == batch
+                ).all()
+            written = set()
+            for start in range(0, len(refs), 500):
+                written.update(number for (number,) in db.session.query(Order.order_number).filter(
+                    Order.order_number.in_(refs[start:start + 500])
+                ))
+        finally:
+            db.session.remove()
+
+        self.committed[batch] = {(field, number): Decimal(amount) for field, number, amount in rows}
+        now = time.time()
+        for ref in written:
+            self._drop(ref)
+            self.recent[ref] = now
+        self.stale.discard(batch)
+        self.counters['loads'] += 1
+
+    def _warm_rows(self, batch: str) -> Optional[List[Tuple[str, str, Decimal]]]:
+        """First load of a batch: warm snapshot totals plus orders written since (None if unusable)"""
+        from sqlalchemy import func
+
+        from app import db
+        from app.models import Order, OrderItem
+        from app.utils.change_tracking import EXPOSURE_COUNTER, get_counter
+
+        warm = self.warm
+        if warm is None or batch in self.committed or self.app.config.get('DB_PROFILE') != 'sqlite':
+            return None
+        totals = warm.exposure(batch)
+        if totals is None or get_counter(EXPOSURE_COUNTER) != warm.exposure_version:
+            return None
+
+        totals = {key: amount for key, (amount, _) in totals.items()}
+        amount = func.coalesce(OrderItem.buy_amount, OrderItem.amount, 0)
+        caught_up = db.session.query(OrderItem.field, OrderItem.number_norm, func.sum(amount)).join(
+            Order, Order.id == OrderItem.order_id
+        ).filter(
+            Order.id > warm.order_hwm,
+            Order.batch_id == batch,
+            Order.status != 'cancelled'
+        ).group_by(OrderItem.field, OrderItem.number_norm)
+        for field, number, total in caught_up:
+            totals[(field, number)] = totals.get((field, number), Decimal('0')) + Decimal(str(total))
+
+        self.counters['warm_loads'] += 1
+        return [(field, number, total) for (field, number), total in totals.items()]
+
+    def _book(self, batch: str) -> Dict[Tuple[str, str], Decimal]:
+        if batch not in self.committed or batch in self.stale:
+            self._load_batch(batch)
+        return self.committed[batch]
+
+    def _drop(self, ref: str) -> Optional[_Reservation]:
+        """Forget a reservation (journaled)"""
+        reservation = self.pending.pop(ref, None)
+        if reservation is not None:
+            self._hold(reservation, -1)
+            self._log(json.dumps({'t': 'X', 'ref': ref}, separators=(',', ':')) + '\n')
+        return reservation
+
+    def _states(self, batch: str, items: List[Tuple[str, str, Decimal]]) -> List[list]:
+        committed = self._book(batch)
+        reserved = self.reserved.get(batch, {})
+        rules = self.rules
+        zero = Decimal('0')
+        return [
+            [
+                str(committed.get((field, number), zero) + reserved.get((field, number), zero)),
+                str(rules.limit_for(field, number)),
+                rules.is_blocked(field, number)
+            ]
+            for field, number, _ in items
+        ]
+
+    # ------------------------------------------------------------------
+    # Operations
+
+    @staticmethod
+    def _items(raw) -> List[Tuple[str, str, Decimal]]:
+        return [(str(field), str(number), Decimal(str(amount))) for field, number, amount in raw]
+
+    def _op_check(self, op):
+        return {'ok': True, 'items': self._states(op['batch'], self._items(op['items'])),
+                'rules_version': self.rules.version}
+
+    def _op_reserve(self, op):
+        ref = op['ref']
+        existing = self.pending.get(ref)
+        if existing is not None:
+            # Retried message: answer as the first time
+            if existing.results is None:
+                # Replayed from the journal - the first answer was not kept
+                self._hold(existing, -1)
+                existing.results = self._states(existing.batch, existing.items)
+                self._hold(existing, 1)
+            return {'ok': True, 'items': existing.results, 'rules_version': self.rules.version}
+        if ref in self.recent:
+            return {'ok': False, 'error': 'reference already committed'}
+
+        batch = op['batch']
+        items = self._items(op['items'])
+        results = self._states(batch, items)
+        reservation = _Reservation(batch, items, time.time(), results)
+        self._log(self._reservation_line(ref, reservation))
+        self.pending[ref] = reservation
+        self._hold(reservation, 1)
+        return {'ok': True, 'items': results, 'rules_version': self.rules.version}
+
+    def _op_commit(self, op):
+        ref = op['ref']
+        reservation = self.pending.pop(ref, None)
+        if reservation is not None:
+            self._hold(reservation, -1)
+            self._log(json.dumps({'t': 'C', 'ref': ref}, separators=(',', ':')) + '\n')
+            committed = self.committed.get(reservation.batch)
+            if committed is not None:
+                for field, number, amount in reservation.items:
+                    committed[(field, number)] = committed.get((field, number), Decimal('0')) + amount
+            self.recent[ref] = time.time()
+        elif ref not in self.recent:
+            # Written without a reservation (authority was unreachable at reserve time)
+            if op.get('batch'):
+                self.stale.add(op['batch'])
+        return {'ok': True}
+
+    def _op_release(self, op):
+        self._drop(op['ref'])
+        return {'ok': True}
+
+    def _op_resync(self, op):
+        batches = op.get('batches')
+        self.stale.update(self.committed if batches is None else batches)
+        self._refresh_rules()
+        return {'ok': True}
+
+    def _op_stats(self, op):
+        return {
+            'ok': True,
+            'batches': sorted(self.committed),
+            'pending': len(self.pending),
+            'journal_lines': self.journal_lines,
+            'rules_version': self.rules.version,
+            **self.counters
+        }
+
+    def _op_ping(self, op):
+        return {'ok': True}
+
+    def handle(self, message: Dict) -> Dict:
+        """Apply all ops of one message, sync the journal once, return the results"""
+        results = []
+        with self._lock:
+            self.counters['messages'] += 1
+            journal_lines = self.journal_lines
+            for op in message.get('ops', []):
+                handler = getattr(self, f"_op_{op.get('op')}", None)
+                if handler is None:
+                    results.append({'ok': False, 'error': f"unknown op: {op.get('op')}"})
+                    continue
+                try:
+                    results.append(handler(op))
+                except Exception as e:
+                    logger.exception("Limit authority op %s failed", op.get('op'))
+                    results.append({'ok': False, 'error': str(e)})
+            if self.journal_lines != journal_lines:
+                self._sync_journal()
+        return {'results': results}
+
+    # ------------------------------------------------------------------
+    # Background work
+
+    def _refresh_rules(self):
+        from app import db
+        from app.services.rule_snapshot import get_rule_snapshot
+
+        try:
+            self.rules = get_rule_snapshot()
+        finally:
+            db.session.remove()
+
+    def _sweep(self):
+        """Expire old reservations, forget old settled refs, compact the journal"""
+        now = time.time()
+        with self._lock:
+            expired = [ref for ref, reservation in self.pending.items()
+                       if now - reservation.created > self.reservation_ttl]
+            for ref in expired:
+                # The worker died or lost the reply; the database decides
+                self.stale.add(self.pending[ref].batch)
+                self._drop(ref)
+            self.counters['expired'] += len(expired)
+
+            horizon = now - 2 * self.reservation_ttl
+            for ref in [ref for ref, settled in self.recent.items() if settled < horizon]:
+                del self.recent[ref]
+
+            if self.journal_lines > len(self.pending) + JOURNAL_COMPACT_SLACK:
+                self._compact()
+            elif expired:
+                self._sync_journal()
+
+    def _write_snapshot(self):
+        from app.services.warm_snapshot import write_warm_snapshot
+
+        try:
+            with self.app.app_context():
+                write_warm_snapshot(self.snapshot_path)
+        except Exception:
+            logger.exception("Writing warm snapshot %s failed", self.snapshot_path)
+
+    def _background(self):
+        last_resync = last_snapshot = time.monotonic()
+        while True:
+            time.sleep(self.rules_poll_seconds)
+            try:
+                with self.app.app_context():
+                    with self._lock:
+                        self._refresh_rules()
+                        if time.monotonic() - last_resync >= self.resync_seconds:
+                            self.stale.update(self.committed)
+                            last_resync = time.monotonic()
+                    self._sweep()
+            except Exception:
+                logger.exception("Limit authority background refresh failed")
+
+            if self.snapshot_path and time.monotonic() - last_snapshot >= self.snapshot_interval:
+                self._write_snapshot()
+                last_snapshot = time.monotonic()
+
+    def serve(self, socket_path: str):
+        """Run the authority until interrupted"""
+        with self.app.app_context():
+            self.open_journal()
+            self._refresh_rules()
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        authority = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with authority.app.app_context():
+                    for line in self.rfile:
+                        try:
+                            message = json.loads(line)
+                        except ValueError:
+                            reply = {'results': [], 'error': 'invalid message'}
+                        else:
+                            reply = authority.handle(message)
+                        self.wfile.write(json.dumps(reply, separators=(',', ':')).encode('utf-8') + b'\n')
+                        self.wfile.flush()
+
+        server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        server.daemon_threads = True
+        os.chmod(socket_path, 0o660)
+        threading.Thread(target=self._background, name='limit-authority-refresh', daemon=True).start()
+
+        logger.info("Limit authority listening on %s", socket_path)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            with self._lock:
+                self._sync_journal()
+                self.journal.close()
+            if self.snapshot_path:
+                self._write_snapshot()
+
+    @classmethod
+    def from_app(cls, app) -> 'LimitAuthority':
+        return cls(
+            app,
+            journal_path=_setting(app, 'LIMIT_AUTHORITY_JOURNAL',
+                                  os.path.join(app.instance_path, 'limit_authority.journal')),
+            fsync=_flag(_setting(app, 'LIMIT_AUTHORITY_FSYNC', 'on')),
+            reservation_ttl=float(_setting(app, 'LIMIT_AUTHORITY_RESERVATION_TTL', 60)),
+            resync_seconds=float(_setting(app, 'LIMIT_AUTHORITY_RESYNC_SECONDS', 30)),
+            rules_poll_seconds=float(_setting(app, 'LIMIT_AUTHORITY_RULES_POLL_SECONDS', 1)),
+            snapshot_path=app.config.get('WARM_SNAPSHOT_PATH') or None,
+            snapshot_interval=float(_setting(app, 'WARM_SNAPSHOT_INTERVAL', 60))
+        )
+
+
+class LimitAuthorityClient:
+    """Worker side of the limit authority protocol (one connection per thread)"""
+
+    def __init__(self):
+        self.socket_path = None
+        self.timeout = 0.2
+        self._reset()
+
+        if hasattr(os, 'register_at_fork'):
+            # Connections must not be shared with forked workers
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+
+    def init_app(self, app):
+        self.socket_path = app.config.get('LIMIT_AUTHORITY_SOCKET') or None
+        self.timeout = int(_setting(app, 'LIMIT_AUTHORITY_TIMEOUT_MS', 200)) / 1000.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.socket_path is not None
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            connection = (sock, sock.makefile('rb'))
+            self._local.connection = connection
+        return connection
+
+    def _disconnect(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection[1].close()
+                connection[0].close()
+            except OSError:
+                pass
+
+    def request(self, ops: List[Dict]) -> List[Dict]:
+        """
+        Send one message and return the per-op results
+
+        Every op is safe to resend (reserve is idempotent per ref), so a
+        broken connection is retried once on a fresh one.
+
+        Raises:
+            LimitAuthorityUnavailable
+        """
+        if not self.enabled:
+            raise LimitAuthorityUnavailable('limit authority is not configured')
+
+        if time.monotonic() < getattr(self._local, 'retry_at', 0):
+            raise LimitAuthorityUnavailable('limit authority unavailable (retrying shortly)')
+
+        payload = json.dumps({'ops': ops}, separators=(',', ':')).encode('utf-8') + b'\n'
+        for attempt in range(2):
+            try:
+                sock, reader = self._connection()
+                sock.sendall(payload)
+                line = reader.readline()
+                if not line:
+                    raise ConnectionError('connection closed by limit authority')
+                return json.loads(line)['results']
+            except socket.timeout as e:
+                # A late reply would be read by the next request: start over
+                self._disconnect()
+                self._local.retry_at = time.monotonic() + CLIENT_RETRY_SECONDS
+                raise LimitAuthorityUnavailable(f'limit authority timed out: {e}')
+            except (OSError, ValueError, KeyError) as e:
+                self._disconnect()
+                if attempt:
+                    self._local.retry_at = time.monotonic() + CLIENT_RETRY_SECONDS
+                    raise LimitAuthorityUnavailable(f'limit authority unavailable: {e}')
+
+    @staticmethod
+    def _wire_items(items: Iterable[Tuple[str, str, Decimal]]) -> List[list]:
+        return [[field, number, str(amount)] for field, number, amount in items]
+
+    @staticmethod
+    def _states(result: Dict) -> List[Tuple[Decimal, Decimal, bool]]:
+        if not result.get('ok'):
+            raise LimitAuthorityUnavailable(result.get('error', 'limit authority error'))
+        return [(Decimal(usage), Decimal(limit), bool(blocked)) for usage, limit, blocked in result['items']]
+
+    def check(self, batch_id: str, items) -> List[Tuple[Decimal, Decimal, bool]]:
+        """(usage, limit, is_blocked) per (field, number_norm, amount) item"""
+        result = self.request([{'op': 'check', 'batch': batch_id, 'items': self._wire_items(items)}])[0]
+        return self._states(result)
+
+    def reserve(self, ref: str, batch_id: str, items) -> List[Tuple[Decimal, Decimal, bool]]:
+        """Like check, and hold the amounts under ref until commit/release"""
+        result = self.request([{'op': 'reserve', 'ref': ref, 'batch': batch_id,
+                                'items': self._wire_items(items)}])[0]
+        return self._states(result)
+
+    def commit(self, ref: str, batch_id: str) -> bool:
+        """Reserved order was written (best effort; an unsettled reservation expires)"""
+        return self._notify({'op': 'commit', 'ref': ref, 'batch': batch_id})
+
+    def release(self, ref: str) -> bool:
+        """Reserved order was not written (best effort)"""
+        return self._notify({'op': 'release', 'ref': ref})
+
+    def resync(self, batch_ids: Optional[Iterable[str]] = None) -> bool:
+        """Reload batches from the database after an out-of-band change (best effort)"""
+        if not self.enabled:
+            return False
+        batches = None if batch_ids is None else sorted(set(batch_ids))
+        return self._notify({'op': 'resync', 'batches': batches})
+
+    def _notify(self, op: Dict) -> bool:
+        try:
+            return bool(self.request([op])[0].get('ok'))
+        except LimitAuthorityUnavailable as e:
+            logger.warning("Limit authority %s not delivered: %s", op['op'], e)
+            return False
+
+
+limit_authority = LimitAuthorityClient()
@@ -313,14 +313,17 @@ class LimitService:
         
         default_limits = LimitService.get_default_group_limits()
         
+        from app.services.top_numbers import top_numbers as hot_numbers
+        from app.services.rule_snapshot import get_rule_snapshot
+        
+        # Individual limits from the compiled rules (no query per number)
+        rules = get_rule_snapshot()
+        
         # Get usage summary by field - focus on individual numbers
         dashboard_data = {}
         for field in ['2_top', '2_bottom', '3_top', 'tote']:
-            # Get all numbers with totals for this field
-            totals = NumberTotal.query.filter(
-                NumberTotal.batch_id == batch_id,
-                NumberTotal.field == field
-            ).order_by(NumberTotal.total_amount.desc()).all()
+            # All numbers with totals for this field, highest first (in-process ranking)
+            totals = hot_numbers.ranked(batch_id, field)
             
             # Get default limit for this field (used as individual limit too)
             default_limit = default_limits.get(field, Decimal('700'))
@@ -330,21 +333,22 @@ class LimitService:
             risky_numbers = []    # Numbers 90%+ of limit
             top_numbers = []      # Top 10 by amount
             
-            for total in totals:
+            for _, number_norm, amount, order_count in totals:
+                amount = Decimal(str(amount)).quantize(Decimal('0.01'))
                 # Get individual limit (could be custom or default)
-                individual_limit = LimitService.get_individual_limit(field, total.number_norm)
-                usage_percent = float((total.total_amount / individual_limit) * 100) if individual_limit > 0 else 0
+                individual_limit = rules.limit_for(field, number_norm)
+                usage_percent = float((amount / individual_limit) * 100) if individual_limit > 0 else 0
                 
                 number_info = {
-                    'number': total.number_norm,
-                    'amount': total.total_amount,
+                    'number': number_norm,
+                    'amount': amount,
                     'limit': individual_limit,
                     'usage_percent': round(usage_percent, 1),
-                    'order_count': total.order_count
+                    'order_count': order_count
                 }
                 
                 # Categorize numbers
-                if total.total_amount > individual_limit:
+                if amount > individual_limit:
                     exceeded_numbers.append(number_info)
                 elif usage_percent >= 90:
                     risky_numbers.append(number_info)
@@ -354,7 +358,7 @@ class LimitService:
                     top_numbers.append(number_info)
             
             # Calculate totals for reference
-            total_orders = sum(t.order_count for t in totals)
+            total_orders = sum(order_count for _, _, _, order_count in totals)
             numbers_count = len(totals)
             
             dashboard_data[field] = {
@@ -395,7 +399,62 @@ class LimitService:
             })
         
         return result
-    
+
+    @staticmethod
+    def get_individual_limits_page(field: str = None, cursor: str = None, per_page: int = 50,
+                                   batch_id: str = None) -> Tuple[List[Dict], 'KeysetPage']:
+        """
+        Get one page of individual number limits with current usage
+
+        Keyset-paginated by (field, number_norm, id) over idx_rule_lookup;
+        usage for the whole page is read with a single NumberTotal query.
+
+        Args:
+            field: Optional field filter
+            cursor: Cursor from previous page (None for first page)
+            per_page: Page size
+            batch_id: Batch for current usage (default: current batch)
+
+        Returns:
+            Tuple of (limit dicts, KeysetPage)
+        """
+        from app.utils.pagination import keyset_paginate
+
+        if not batch_id:
+            batch_id = LimitService._get_current_batch_id()
+
+        query = Rule.query.filter(
+            Rule.rule_type == 'number_limit',
+            Rule.is_active == True
+        )
+        if field:
+            query = query.filter(Rule.field == field)
+
+        page = keyset_paginate(
+            query, [Rule.field, Rule.number_norm, Rule.id],
+            cursor=cursor, per_page=per_page, descending=False
+        )
+
+        usage = {}
+        if page.items:
+            totals = db.session.query(
+                NumberTotal.field, NumberTotal.number_norm, NumberTotal.total_amount
+            ).filter(
+                NumberTotal.batch_id == batch_id,
+                NumberTotal.number_norm.in_({rule.number_norm for rule in page.items})
+            ).all()
+            usage = {(f, n): amount for f, n, amount in totals}
+
+        result = [{
+            'field': rule.field,
+            'number_norm': rule.number_norm,
+            'limit': rule.value,
+            'current_usage': usage.get((rule.field, rule.number_norm), Decimal('0')),
+            'created_at': rule.created_at
+        } for rule in page.items]
+
+        return result, page
+
     @staticmethod
     def _get_field_display_name(field: str) -> str:
         """Get display name for field"""
@@ -0,0 +1,220 @@
+"""
+Number total reconciliation
+Recomputes NumberTotal from order_items (non-cancelled orders) with one
+grouped query, reports drift against the stored totals and optionally
+applies the fixes in bulk.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from decimal import Decimal
+from datetime import datetime
+import pytz
+
+from flask import current_app
+from sqlalchemy import bindparam, delete, func, insert, update
+
+from app import db
+from app.models import Order, OrderItem, NumberTotal, AuditLog
+from app.utils.db_engine import immediate_transaction
+from app.utils.change_tracking import EXPOSURE_COUNTER, bump_counter, exposure_seq, mark_exposure_reset
+from app.services.limit_authority import limit_authority
+
+BANGKOK_TZ = pytz.timezone('Asia/Bangkok')
+
+FIELDS = ('2_top', '2_bottom', '3_top', 'tote')
+
+Key = Tuple[str, str, str]  # (batch_id, field, number_norm)
+
+class NumberTotalService:
+    """Service class for NumberTotal reconciliation"""
+
+    @staticmethod
+    def _expected_totals(batch_id: Optional[str], fields: Optional[List[str]] = None) -> Dict[Key, Tuple[Decimal, int]]:
+        """Totals recomputed from order_items (one grouped query)"""
+        amount = func.coalesce(OrderItem.buy_amount, OrderItem.amount, 0)
+        query = db.session.query(
+            Order.batch_id, OrderItem.field, OrderItem.number_norm,
+            func.sum(amount), func.count(OrderItem.id)
+        ).join(Order, Order.id == OrderItem.order_id).filter(
+            Order.status != 'cancelled'
+        )
+        if batch_id is not None:
+            query = query.filter(Order.batch_id == batch_id)
+        if fields is not None:
+            query = query.filter(OrderItem.field.in_(fields))
+
+        # Totals at or below zero are not kept (same as order cancellation)
+        query = query.group_by(
+            Order.batch_id, OrderItem.field, OrderItem.number_norm
+        ).having(func.sum(amount) > 0)
+
+        return {
+            (b, field, number_norm): (Decimal(str(total)), count)
+            for b, field, number_norm, total, count in query
+        }
+
+    @staticmethod
+    def _expected_totals_parallel(batch_id: Optional[str], workers: int) -> Dict[Key, Tuple[Decimal, int]]:
+        """Same as _expected_totals, one query per field on worker threads"""
+        app = current_app._get_current_object()
+
+        def run(field):
+            with app.app_context():
+                return NumberTotalService._expected_totals(batch_id, [field])
+
+        expected = {}
+        with ThreadPoolExecutor(max_workers=min(workers, len(FIELDS))) as executor:
+            for part in executor.map(run, FIELDS):
+                expected.update(part)
+        return expected
+
+    @staticmethod
+    def _stored_totals(batch_id: Optional[str]) -> Dict[Key, Tuple[int, Decimal, int]]:
+        """Current NumberTotal rows: key -> (id, total_amount, order_count)"""
+        query = db.session.query(
+            NumberTotal.id, NumberTotal.batch_id, NumberTotal.field, NumberTotal.number_norm,
+            NumberTotal.total_amount, NumberTotal.order_count
+        )
+        if batch_id is not None:
+            query = query.filter(NumberTotal.batch_id == batch_id)
+        return {
+            (b, field, number_norm): (row_id, Decimal(str(total)), count)
+            for row_id, b, field, number_norm, total, count in query
+        }
+
+    @staticmethod
+    def reconcile(batch_id: str = None, apply: bool = False, workers: int = 1,
+                  user_id: int = None) -> Dict:
+        """
+        Compare NumberTotal with order_items and optionally fix drift
+
+        Args:
+            batch_id: Batch to check (default: all batches)
+            apply: Write fixes (bulk insert / update / delete in one transaction)
+            workers: Recompute per field on this many threads (report only;
+                with apply the recompute runs under the write lock)
+            user_id: User ID for audit log (apply only)
+
+        Returns:
+            Dict with 'checked', 'missing', 'mismatched', 'extra' counts,
+            'drift' entries and 'applied'
+        """
+        if apply:
+            # Block writers so the recompute and the fix see the same orders
+            immediate_transaction(db.session)
+            expected = NumberTotalService._expected_totals(batch_id)
+        elif workers > 1:
+            expected = NumberTotalService._expected_totals_parallel(batch_id, workers)
+        else:
+            expected = NumberTotalService._expected_totals(batch_id)
+
+        stored = NumberTotalService._stored_totals(batch_id)
+
+        missing = []     # in order_items, no NumberTotal row
+        mismatched = []  # row exists with different amount/count
+        extra = []       # row without any live order items
+        drift = []
+
+        for key, (amount, count) in expected.items():
+            row = stored.get(key)
+            if row is None:
+                missing.append(key)
+            elif row[1] != amount or row[2] != count:
+                mismatched.append(key)
+            else:
+                continue
+            drift.append({
+                'batch_id': key[0],
+                'field': key[1],
+                'number_norm': key[2],
+                'expected_amount': float(amount),
+                'expected_count': count,
+                'stored_amount': float(row[1]) if row else None,
+                'stored_count': row[2] if row else None
+            })
+
+        for key, (row_id, amount, count) in stored.items():
+            if key not in expected:
+                extra.append(key)
+                drift.append({
+                    'batch_id': key[0],
+                    'field': key[1],
+                    'number_norm': key[2],
+                    'expected_amount': 0.0,
+                    'expected_count': 0,
+                    'stored_amount': float(amount),
+                    'stored_count': count
+                })
+
+        result = {
+            'batch_id': batch_id,
+            'checked': len(expected.keys() | stored.keys()),
+            'missing': len(missing),
+            'mismatched': len(mismatched),
+            'extra': len(extra),
+            'drift': drift,
+            'applied': False
+        }
+
+        if not apply:
+            return result
+
+        if drift:
+            now = datetime.now(BANGKOK_TZ)
+            totals = NumberTotal.__table__
+            seq = exposure_seq(db.session)
+
+            if missing:
+                db.session.execute(insert(totals), [
+                    {
+                        'batch_id': b,
+                        'field': field,
+                        'number_norm': number_norm,
+                        'total_amount': expected[(b, field, number_norm)][0],
+                        'order_count': expected[(b, field, number_norm)][1],
+                        'last_updated': now,
+                        'seq': seq
+                    }
+                    for b, field, number_norm in missing
+                ])
+
+            if mismatched:
+                db.session.execute(
+                    update(totals)
+                    .where(totals.c.id == bindparam('b_id'))
+                    .values(
+                        total_amount=bindparam('b_amount'),
+                        order_count=bindparam('b_count'),
+                        last_updated=now,
+                        seq=seq
+                    ),
+                    [
+                        {
+                            'b_id': stored[key][0],
+                            'b_amount': expected[key][0],
+                            'b_count': expected[key][1]
+                        }
+                        for key in mismatched
+                    ]
+                )
+
+            if extra:
+                db.session.execute(
+                    delete(totals).where(totals.c.id.in_([stored[key][0] for key in extra]))
+                )
+                mark_exposure_reset(db.session, {key[0] for key in extra})
+
+            bump_counter(db.session.connection(), EXPOSURE_COUNTER)
+            db.session.add(AuditLog(
+                user_id=user_id,
+                action='reconcile_number_totals',
+                resource='number_total',
+                details={k: v for k, v in result.items() if k not in ('drift', 'applied')}
+            ))
+
+        db.session.commit()
+        result['applied'] = True
+        limit_authority.resync([batch_id] if batch_id else None)
+
+        return result
@@ -2,11 +2,13 @@
 Order service for handling lottery orders
 """
 
-from typing import List, Dict, Tuple, Optional
+from typing import Iterable, List, Dict, Tuple, Optional
 from decimal import Decimal
 from datetime import datetime, date
 import pytz
 
+from sqlalchemy import func
+
 from app import db
 from app.models import Order, OrderItem, Rule, BlockedNumber, NumberTotal, AuditLog
 from app.utils.number_utils import (
@@ -14,9 +16,16 @@ from app.utils.number_utils import (
     calculate_payout, generate_order_number, calculate_lottery_period,
     generate_batch_id, parse_amount
 )
+from app.utils.db_engine import immediate_transaction
+from app.utils.change_tracking import EXPOSURE_COUNTER, bump_counter, exposure_seq, mark_exposure_reset
+from app.services.user_stats_service import UserStatsService
+from app.services.limit_authority import limit_authority
 
 BANGKOK_TZ = pytz.timezone('Asia/Bangkok')
 
+# Statuses of live orders (submitted bulk orders are 'confirmed')
+CANCELLABLE_STATUSES = ('pending', 'confirmed')
+
 class OrderValidationError(Exception):
     """Custom exception for order validation errors"""
     pass
@@ -165,6 +174,9 @@ class OrderService:
         lottery_period = calculate_lottery_period()
         batch_id = generate_batch_id(lottery_period)
         
+        # Validation reads totals that we are about to update - lock first
+        immediate_transaction(db.session)
+        
         # Validate all items first
         validated_items = []
         total_amount = Decimal('0')
@@ -224,7 +236,11 @@ class OrderService:
                 float(item_data['buy_amount'])
             )
         
+        UserStatsService.record_order(user_id, batch_id, order.status, total_amount)
+        
         db.session.commit()
+        # Written without a reservation - the limit authority reloads the batch
+        limit_authority.resync([batch_id])
         
         # Log order creation
         audit_log = AuditLog(
@@ -279,6 +295,8 @@ class OrderService:
         Returns:
             True if successful
         """
+        immediate_transaction(db.session)
+        
         order = Order.query.filter_by(id=order_id, user_id=user_id).first()
         if not order:
             raise OrderValidationError("ไม่พบรายการสั่งซื้อ")
@@ -286,51 +304,200 @@ class OrderService:
         if order.status != 'pending':
             raise OrderValidationError("ไม่สามารถยกเลิกรายการที่ไม่ใช่สถานะรอดำเนินการได้")
         
-        # Update order status
-        order.status = 'cancelled'
-        order.notes = f"{order.notes or ''}\nยกเลิก: {reason or 'ไม่ระบุเหตุผล'}"
+        OrderService._cancel_orders(
+            [(order.id, order.user_id, order.batch_id, order.status, order.total_amount)],
+            reason=reason,
+            actor_id=user_id,
+            action='cancel_order',
+            resource_id=str(order.id),
+            details={'order_number': order.order_number, 'reason': reason}
+        )
+        db.session.commit()
+        limit_authority.resync([order.batch_id])
         
-        # Reverse number totals
-        for item in order.items:
-            OrderService._reverse_number_total(
-                order.batch_id, item.field, item.number_norm, float(item.buy_amount)
-            )
+        return True
+    
+    @staticmethod
+    def parse_order_ids(value) -> Optional[List[int]]:
+        """order_ids from a JSON body as a non-empty list of ints (None if invalid)"""
+        if not isinstance(value, list) or not value:
+            return None
+        try:
+            return [int(order_id) for order_id in value]
+        except (TypeError, ValueError):
+            return None
+    
+    @staticmethod
+    def cancel_orders(actor_id: int, order_ids: List[int] = None, user_id: int = None,
+                      batch_id: str = None, statuses: Tuple[str, ...] = CANCELLABLE_STATUSES,
+                      reason: str = None, batch_ids: Iterable[str] = None) -> Dict:
+        """
+        Cancel many orders in one transaction
         
-        db.session.commit()
+        Orders are selected by id list and/or owner and batch. Number totals
+        are reversed with one aggregated UPDATE per affected (batch, field,
+        number), orders are marked cancelled in one statement and a single
+        audit entry is written.
         
-        # Log cancellation
-        audit_log = AuditLog(
-            user_id=user_id,
-            action='cancel_order',
-            resource='order',
-            resource_id=str(order.id),
+        Args:
+            actor_id: User performing the cancellation (audit log)
+            order_ids: Optional order IDs
+            user_id: Optional owner filter (agent)
+            batch_id: Optional batch filter
+            statuses: Statuses that may be cancelled
+            reason: Cancellation reason
+            batch_ids: Optional batches the orders must belong to (e.g. open batches)
+        
+        Returns:
+            Dict with 'cancelled', 'total_amount', 'numbers_updated' and 'order_ids'
+        """
+        if order_ids is None and user_id is None and batch_id is None:
+            raise OrderValidationError("ต้องระบุรายการสั่งซื้อ ผู้ใช้ หรือ batch")
+        
+        immediate_transaction(db.session)
+        
+        query = db.session.query(
+            Order.id, Order.user_id, Order.batch_id, Order.status, Order.total_amount
+        ).filter(Order.status.in_(statuses))
+        if order_ids is not None:
+            query = query.filter(Order.id.in_(order_ids))
+        if user_id is not None:
+            query = query.filter(Order.user_id == user_id)
+        if batch_id is not None:
+            query = query.filter(Order.batch_id == batch_id)
+        if batch_ids is not None:
+            query = query.filter(Order.batch_id.in_(list(batch_ids)))
+        orders = query.all()
+        
+        if not orders:
+            db.session.rollback()
+            return {'cancelled': 0, 'total_amount': 0.0, 'numbers_updated': 0, 'order_ids': []}
+        
+        result = OrderService._cancel_orders(
+            orders,
+            reason=reason,
+            actor_id=actor_id,
+            action='bulk_cancel_orders',
             details={
-                'order_number': order.order_number,
+                'user_id': user_id,
+                'batch_id': batch_id,
+                'statuses': list(statuses),
                 'reason': reason
             }
         )
-        db.session.add(audit_log)
         db.session.commit()
+        limit_authority.resync({order[2] for order in orders})
         
-        return True
+        return result
     
     @staticmethod
-    def _reverse_number_total(batch_id: str, field: str, number_norm: str, amount: float):
-        """Reverse number total when cancelling order"""
-        number_total = NumberTotal.query.filter_by(
-            batch_id=batch_id,
-            field=field,
-            number_norm=number_norm
-        ).first()
+    def _cancel_orders(orders: List[Tuple], reason: Optional[str], actor_id: int, action: str,
+                       resource_id: str = None, details: Dict = None) -> Dict:
+        """
+        Cancel selected orders inside the caller's transaction (no commit)
         
-        if number_total:
-            number_total.total_amount -= Decimal(str(amount))
-            number_total.order_count -= 1
-            number_total.last_updated = datetime.now(BANGKOK_TZ)
-            
-            # Remove if total becomes zero
-            if number_total.total_amount <= 0:
-                db.session.delete(number_total)
+        Args:
+            orders: (id, user_id, batch_id, status, total_amount) rows
+            reason: Cancellation reason (appended to notes)
+            actor_id: User for the audit entry
+            action: Audit action name
+            resource_id: Audit resource id (single order)
+            details: Extra audit details
+        
+        Returns:
+            Dict with 'cancelled', 'total_amount', 'numbers_updated' and 'order_ids'
+        """
+        from sqlalchemy import bindparam, delete, update
+        
+        now = datetime.now(BANGKOK_TZ)
+        order_ids = [row[0] for row in orders]
+        
+        # Amount/count to reverse per number total (one grouped query)
+        amount = func.coalesce(OrderItem.buy_amount, OrderItem.amount, 0)
+        reversals = db.session.query(
+            Order.batch_id, OrderItem.field, OrderItem.number_norm,
+            func.sum(amount), func.count(OrderItem.id)
+        ).join(Order, Order.id == OrderItem.order_id).filter(
+            OrderItem.order_id.in_(order_ids)
+        ).group_by(Order.batch_id, OrderItem.field, OrderItem.number_norm).all()
+        
+        totals = NumberTotal.__table__
+        if reversals:
+            seq = exposure_seq(db.session)
+            keys = (
+                totals.c.batch_id == bindparam('b_batch_id'),
+                totals.c.field == bindparam('b_field'),
+                totals.c.number_norm == bindparam('b_number_norm')
+            )
+            params = [
+                {
+                    'b_batch_id': batch_id,
+                    'b_field': field,
+                    'b_number_norm': number_norm,
+                    'b_amount': total,
+                    'b_count': count
+                }
+                for batch_id, field, number_norm, total, count in reversals
+            ]
+            db.session.execute(
+                update(totals)
+                .where(*keys)
+                .values(
+                    total_amount=totals.c.total_amount - bindparam('b_amount'),
+                    order_count=totals.c.order_count - bindparam('b_count'),
+                    last_updated=now,
+                    seq=seq
+                ),
+                params
+            )
+            # Remove the reversed totals that dropped to zero (only the keys
+            # updated above - other rows belong to other writers)
+            removed = db.session.execute(
+                delete(totals).where(*keys, totals.c.total_amount <= 0),
+                [{key: value for key, value in row.items() if key not in ('b_amount', 'b_count')} for row in params]
+            )
+            if removed.rowcount:
+                mark_exposure_reset(db.session, {row[0] for row in reversals})
+            bump_counter(db.session.connection(), EXPOSURE_COUNTER)
+        
+        note = f"\nยกเลิก: {reason or 'ไม่ระบุเหตุผล'}"
+        db.session.execute(
+            update(Order)
+            .where(Order.id.in_(order_ids))
+            .values(status='cancelled', notes=func.coalesce(Order.notes, '') + note, updated_at=now)
+            .execution_options(synchronize_session='fetch')
+        )
+        
+        # Running per-user statistics, one move per (user, batch, status)
+        moved = {}
+        for _, owner_id, batch_id, status, total_amount in orders:
+            key = (owner_id, batch_id, status)
+            amount_sum, count = moved.get(key, (Decimal('0'), 0))
+            moved[key] = (amount_sum + Decimal(str(total_amount)), count + 1)
+        for (owner_id, batch_id, status), (amount_sum, count) in moved.items():
+            UserStatsService.move_order(owner_id, batch_id, status, 'cancelled', amount_sum, count)
+        
+        total_amount = sum((Decimal(str(row[4])) for row in orders), Decimal('0'))
+        result = {
+            'cancelled': len(order_ids),
+            'total_amount': float(total_amount),
+            'numbers_updated': len(reversals),
+            'order_ids': order_ids
+        }
+        
+        audit_details = dict(details or {})
+        if resource_id is None:
+            audit_details.update({k: v for k, v in result.items() if k != 'order_ids'})
+            audit_details['order_ids'] = order_ids
+        db.session.add(AuditLog(
+            user_id=actor_id,
+            action=action,
+            resource='order',
+            resource_id=resource_id,
+            details=audit_details
+        ))
+        
+        return result
     
     @staticmethod
     def get_current_batch_id() -> str:
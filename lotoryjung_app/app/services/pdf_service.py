@@ -8,14 +8,6 @@ from datetime import datetime, timedelta
 import secrets
 import pytz
 
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-
 from app import db
 from app.models import Order, DownloadToken
 from app.utils.number_utils import format_currency
@@ -36,6 +28,13 @@ class PDFService:
         Returns:
             PDF file path
         """
+        # ReportLab is only needed here; importing it lazily keeps it out
+        # of worker boot and CLI commands
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+        from reportlab.lib import colors
+
         # Create receipts directory if not exists
         receipts_dir = os.path.join('static', 'receipts', str(order.user_id))
         os.makedirs(receipts_dir, exist_ok=True)
@@ -0,0 +1,132 @@
+"""
+Quota allocation
+Splits the remaining limit of each (field, canonical number) between the
+order lines that ask for it. Demand is aggregated per key across the whole
+order first, so two lines hitting the same tote key share one capacity.
+"""
+
+from decimal import Decimal, ROUND_DOWN
+from typing import Dict, List, Tuple
+
+from app.utils.number_utils import generate_tote_number
+
+CENT = Decimal('0.01')
+
+FIRST_COME = 'first_come'
+PROPORTIONAL = 'proportional'
+MAX_PAYOUT_SAFE = 'max_payout_safe'
+
+POLICIES = (FIRST_COME, PROPORTIONAL, MAX_PAYOUT_SAFE)
+
+
+class QuotaAllocationError(Exception):
+    """Raised for an unknown allocation policy"""
+    pass
+
+
+def canonical_number(field: str, number_norm: str) -> str:
+    """Key that shares one limit: tote numbers use the sorted-digit tote key"""
+    if field == 'tote':
+        return generate_tote_number(number_norm)
+    return number_norm
+
+
+class QuotaAllocator:
+    """Allocates remaining capacity per key to order lines"""
+
+    def __init__(self, policy: str = FIRST_COME):
+        if policy not in POLICIES:
+            raise QuotaAllocationError(f"Unknown allocation policy: {policy}")
+        self.policy = policy
+
+    def allocate(self, lines: List[Dict], capacity: Dict[Tuple[str, str], Decimal]) -> Dict:
+        """
+        Allocate capacity to order lines
+
+        Args:
+            lines: Order lines in submission order, dicts with
+                'field', 'number_norm', 'amount' and optional 'payout_per_unit'
+                (base rate x payout factor, used by max_payout_safe)
+            capacity: (field, canonical number) -> remaining limit
+
+        Returns:
+            Dict with 'allocated' (amount per line, same order as lines) and
+            'keys' (per-key requested / capacity / allocated summary)
+        """
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for index, line in enumerate(lines):
+            key = (line['field'], canonical_number(line['field'], line['number_norm']))
+            groups.setdefault(key, []).append(index)
+
+        allocated = [Decimal('0')] * len(lines)
+        keys = []
+
+        for key, indices in groups.items():
+            remaining = max(Decimal('0'), Decimal(str(capacity.get(key, Decimal('0')))))
+            amounts = [Decimal(str(lines[i]['amount'])) for i in indices]
+            requested = sum(amounts, Decimal('0'))
+
+            if requested <= remaining:
+                shares = amounts
+            elif self.policy == PROPORTIONAL:
+                shares = self._proportional(amounts, requested, remaining)
+            elif self.policy == MAX_PAYOUT_SAFE:
+                rates = [Decimal(str(lines[i].get('payout_per_unit', 0))) for i in indices]
+                shares = self._max_payout_safe(amounts, rates, remaining)
+            else:
+                shares = self._first_come(amounts, remaining)
+
+            for i, share in zip(indices, shares):
+                allocated[i] = share
+
+            keys.append({
+                'field': key[0],
+                'number_norm': key[1],
+                'requested': requested,
+                'capacity': remaining,
+                'allocated': sum(shares, Decimal('0'))
+            })
+
+        return {'allocated': allocated, 'keys': keys}
+
+    @staticmethod
+    def _first_come(amounts: List[Decimal], remaining: Decimal) -> List[Decimal]:
+        """Fill lines in submission order until capacity runs out"""
+        shares = []
+        for amount in amounts:
+            share = min(amount, remaining)
+            shares.append(share)
+            remaining -= share
+        return shares
+
+    @staticmethod
+    def _proportional(amounts: List[Decimal], requested: Decimal, remaining: Decimal) -> List[Decimal]:
+        """Scale every line by capacity / demand; leftover cents go first-come"""
+        ratio = remaining / requested
+        shares = [(amount * ratio).quantize(CENT, rounding=ROUND_DOWN) for amount in amounts]
+
+        leftover = remaining - sum(shares, Decimal('0'))
+        for i, amount in enumerate(amounts):
+            if leftover < CENT:
+                break
+            extra = min(amount - shares[i], leftover).quantize(CENT, rounding=ROUND_DOWN)
+            shares[i] += extra
+            leftover -= extra
+        return shares
+
+    @staticmethod
+    def _max_payout_safe(amounts: List[Decimal], rates: List[Decimal], remaining: Decimal) -> List[Decimal]:
+        """
+        Fill lines with the lowest payout per unit first
+
+        Capacity is used where it adds the least potential payout, so the
+        worst-case payout of the trimmed order is as small as possible.
+        Ties keep submission order.
+        """
+        order = sorted(range(len(amounts)), key=lambda i: rates[i])
+        shares = [Decimal('0')] * len(amounts)
+        for i in order:
+            share = min(amounts[i], remaining)
+            shares[i] = share
+            remaining -= share
+        return shares
@@ -4,6 +4,7 @@ Reports Service - ระบบรายงานภาพรวมการซ
 
 from sqlalchemy import func, text, and_, or_, desc, case
 from app import db
+from app.utils.read_routing import read_session
 from app.models import Order, OrderItem, User, Rule
 from datetime import datetime, date
 import pytz
@@ -12,9 +13,32 @@ from decimal import Decimal
 
 BANGKOK_TZ = pytz.timezone('Asia/Bangkok')
 
+FIELD_NAMES = {
+    '2_top': '2 ตัวบน',
+    '2_bottom': '2 ตัวล่าง',
+    '3_top': '3 ตัวบน',
+    'tote': 'โต๊ด'
+}
+
+FIELD_COLORS = {
+    '2_top': '#007bff',
+    '2_bottom': '#28a745',
+    '3_top': '#ffc107',
+    'tote': '#dc3545'
+}
+
+# ส่วนของ get_dashboard (เลือกได้ผ่าน sections)
+DASHBOARD_SECTIONS = ('summary', 'charts', 'risk_analysis', 'batches')
+
 class ReportsService:
     """Service สำหรับสร้างรายงานและวิเคราะห์ข้อมูล"""
     
+    @staticmethod
+    def _archived(batch_id: str):
+        """ArchivedBatch ถ้า batch ถูกย้ายไปเก็บใน archive แล้ว (ไม่งั้น None)"""
+        from app.services.archive_service import ArchiveService
+        return ArchiveService.get_archived_batch(batch_id)
+    
     @staticmethod
     def get_batch_summary(batch_id: str) -> Dict:
         """
@@ -27,8 +51,12 @@ class ReportsService:
             Dict: ข้อมูลสรุปภาพรวม
         """
         try:
+            archive = ReportsService._archived(batch_id)
+            if archive is not None:
+                return ReportsService._archived_batch_summary(archive)
+            
             # ข้อมูลพื้นฐานของ batch
-            batch_info = db.session.query(
+            batch_info = read_session().query(
                 Order.batch_id,
                 Order.lottery_period,
                 func.count(Order.id).label('total_orders'),
@@ -40,7 +68,7 @@ class ReportsService:
                 return {"success": False, "error": "ไม่พบข้อมูล batch"}
             
             # สรุปตามประเภทสลาก
-            field_summary = db.session.query(
+            field_summary = read_session().query(
                 OrderItem.field,
                 func.sum(OrderItem.amount).label('total_amount'),
                 func.count(OrderItem.id).label('total_items'),
@@ -57,21 +85,7 @@ class ReportsService:
                 ).label('blocked_amount')
             ).join(Order).filter(Order.batch_id == batch_id).group_by(OrderItem.field).all()
             
-            # Top 20 เลขที่มียอดสูงสุด
-            top_numbers = db.session.query(
-                OrderItem.field,
-                OrderItem.number_norm,
-                func.sum(OrderItem.amount).label('total_amount'),
-                func.count(OrderItem.id).label('order_count'),
-                func.count(func.distinct(Order.user_id)).label('buyer_count'),
-                func.avg(OrderItem.validation_factor).label('avg_factor')
-            ).join(Order).filter(
-                Order.batch_id == batch_id
-            ).group_by(
-                OrderItem.field, OrderItem.number_norm
-            ).order_by(
-                desc(func.sum(OrderItem.amount))
-            ).limit(20).all()
+            top_numbers_list = ReportsService._top_numbers(batch_id, 20)
             
             # จัดรูปแบบข้อมูล
             summary_by_field = {}
@@ -86,17 +100,6 @@ class ReportsService:
                     'blocked_amount': float(field.blocked_amount or 0)
                 }
             
-            top_numbers_list = []
-            for num in top_numbers:
-                top_numbers_list.append({
-                    'field': num.field,
-                    'number': num.number_norm,
-                    'total_amount': float(num.total_amount),
-                    'order_count': num.order_count,
-                    'buyer_count': num.buyer_count,
-                    'avg_factor': round(float(num.avg_factor), 3)
-                })
-            
             return {
                 "success": True,
                 "data": {
@@ -115,6 +118,58 @@ class ReportsService:
         except Exception as e:
             return {"success": False, "error": f"เกิดข้อผิดพลาด: {str(e)}"}
     
+    @staticmethod
+    def _top_numbers(batch_id: str, limit: int) -> List[Dict]:
+        """
+        เลขที่มียอดสูงสุด limit อันดับ (จาก ranking ที่อัปเดตตาม exposure feed; ถ้า limit เกิน TOP_NUMBERS_K ใช้ query)
+        
+        ไม่นับคำสั่งซื้อที่ยกเลิก (เหมือน number_totals) ทั้ง ranking, query และ batch ที่ archive แล้ว
+        """
+        from app.services.top_numbers import top_numbers, item_stats
+        
+        ranked = top_numbers.top_all(batch_id, limit)
+        if ranked is not None:
+            stats = item_stats(read_session(), batch_id, ((field, number) for field, number, _, _ in ranked))
+            return [
+                {
+                    'field': field,
+                    'number': number,
+                    'total_amount': amount,
+                    'order_count': order_count,
+                    'buyer_count': stats.get((field, number), (1.0, 0))[1],
+                    'avg_factor': round(stats.get((field, number), (1.0, 0))[0], 3)
+                }
+                for field, number, amount, order_count in ranked
+            ]
+        
+        rows = read_session().query(
+            OrderItem.field,
+            OrderItem.number_norm,
+            func.sum(OrderItem.amount).label('total_amount'),
+            func.count(OrderItem.id).label('order_count'),
+            func.count(func.distinct(Order.user_id)).label('buyer_count'),
+            func.avg(OrderItem.validation_factor).label('avg_factor')
+        ).join(Order).filter(
+            Order.batch_id == batch_id,
+            Order.status != 'cancelled'
+        ).group_by(
+            OrderItem.field, OrderItem.number_norm
+        ).order_by(
+            desc(func.sum(OrderItem.amount))
+        ).limit(limit).all()
+        
+        return [
+            {
+                'field': num.field,
+                'number': num.number_norm,
+                'total_amount': float(num.total_amount),
+                'order_count': num.order_count,
+                'buyer_count': num.buyer_count,
+                'avg_factor': round(float(num.avg_factor), 3)
+            }
+            for num in rows
+        ]
+    
     @staticmethod
     def get_number_analysis(field: str, number: str, batch_id: str) -> Dict:
         """
@@ -129,8 +184,12 @@ class ReportsService:
             Dict: ข้อมูลวิเคราะห์เลขนั้น
         """
         try:
+            archive = ReportsService._archived(batch_id)
+            if archive is not None:
+                return ReportsService._archived_number_analysis(archive, field, number)
+            
             # ข้อมูลรวมของเลขนี้
-            total_data = db.session.query(
+            total_data = read_session().query(
                 func.sum(OrderItem.amount).label('total_amount'),
                 func.count(OrderItem.id).label('total_orders'),
                 func.count(func.distinct(Order.user_id)).label('unique_users'),
@@ -149,7 +208,7 @@ class ReportsService:
                 return {"success": False, "error": "ไม่พบข้อมูลเลขนี้"}
             
             # การกระจายตัวของ validation factor
-            factor_breakdown = db.session.query(
+            factor_breakdown = read_session().query(
                 OrderItem.validation_factor,
                 OrderItem.validation_reason,
                 func.sum(OrderItem.amount).label('amount'),
@@ -165,7 +224,7 @@ class ReportsService:
             ).all()
             
             # รายละเอียดผู้ซื้อ
-            user_details = db.session.query(
+            user_details = read_session().query(
                 User.username,
                 User.name,
                 func.sum(OrderItem.amount).label('total_amount'),
@@ -182,7 +241,7 @@ class ReportsService:
             ).limit(10).all()
             
             # Timeline การสั่งซื้อ (รายชั่วโมง)
-            timeline = db.session.query(
+            timeline = read_session().query(
                 func.strftime('%Y-%m-%d %H:00:00', OrderItem.created_at).label('hour'),
                 func.sum(OrderItem.amount).label('amount'),
                 func.count(OrderItem.id).label('orders')
@@ -260,8 +319,12 @@ class ReportsService:
             Dict: ข้อมูลวิเคราะห์ความเสี่ยง
         """
         try:
+            archive = ReportsService._archived(batch_id)
+            if archive is not None:
+                return ReportsService._archived_risk_analysis(archive, concentration_threshold)
+            
             # ยอดรวมทั้งหมด
-            grand_total = db.session.query(
+            grand_total = read_session().query(
                 func.sum(OrderItem.amount).label('total')
             ).join(Order).filter(Order.batch_id == batch_id).scalar() or 0
             
@@ -269,7 +332,7 @@ class ReportsService:
                 return {"success": False, "error": "ไม่พบข้อมูลการซื้อ"}
             
             # เลขที่มีการกระจุกตัวสูง
-            high_concentration = db.session.query(
+            high_concentration = read_session().query(
                 OrderItem.field,
                 OrderItem.number_norm,
                 func.sum(OrderItem.amount).label('total_amount'),
@@ -285,7 +348,7 @@ class ReportsService:
             ).all()
             
             # ความเสี่ยงตาม validation factor
-            factor_risk = db.session.query(
+            factor_risk = read_session().query(
                 OrderItem.field,
                 func.sum(
                     case((OrderItem.validation_factor < 1.0, OrderItem.amount), else_=0)
@@ -295,43 +358,13 @@ class ReportsService:
                 Order.batch_id == batch_id
             ).group_by(OrderItem.field).all()
             
-            # จัดรูปแบบข้อมูล
-            high_risk_numbers = []
-            for item in high_concentration:
-                risk_level = "HIGH" if item.percentage > 20 else "MEDIUM" if item.percentage > 10 else "LOW"
-                high_risk_numbers.append({
-                    'field': item.field,
-                    'number': item.number_norm,
-                    'total_amount': float(item.total_amount),
-                    'percentage': round(float(item.percentage), 2),
-                    'risk_level': risk_level
-                })
-            
-            field_risks = {}
-            for risk in factor_risk:
-                reduced_percentage = (float(risk.reduced_amount) / float(risk.total_amount) * 100) if risk.total_amount > 0 else 0
-                field_risks[risk.field] = {
-                    'total_amount': float(risk.total_amount),
-                    'reduced_amount': float(risk.reduced_amount),
-                    'reduced_percentage': round(reduced_percentage, 2)
-                }
-            
             return {
                 "success": True,
-                "data": {
-                    "batch_id": batch_id,
-                    "grand_total": float(grand_total),
-                    "concentration_threshold": concentration_threshold * 100,
-                    "high_risk_numbers": high_risk_numbers,
-                    "field_risks": field_risks,
-                    "summary": {
-                        "high_risk_count": len(high_risk_numbers),
-                        "total_high_risk_amount": sum([item['total_amount'] for item in high_risk_numbers]),
-                        "high_risk_percentage": round(
-                            sum([item['total_amount'] for item in high_risk_numbers]) / float(grand_total) * 100, 2
-                        )
-                    }
-                }
+                "data": ReportsService._risk_data(
+                    batch_id, float(grand_total), concentration_threshold,
+                    [(item.field, item.number_norm, float(item.total_amount)) for item in high_concentration],
+                    [(risk.field, float(risk.reduced_amount), float(risk.total_amount)) for risk in factor_risk]
+                )
             }
             
         except Exception as e:
@@ -350,9 +383,13 @@ class ReportsService:
             Dict: ข้อมูลสำหรับกราฟ
         """
         try:
+            archive = ReportsService._archived(batch_id)
+            if archive is not None:
+                return ReportsService._archived_chart_data(archive, chart_type)
+            
             if chart_type == "field_distribution":
                 # กราฟแสดงการกระจายตามประเภทสลาก
-                data = db.session.query(
+                data = read_session().query(
                     OrderItem.field,
                     func.sum(OrderItem.amount).label('total_amount'),
                     func.count(OrderItem.id).label('total_orders')
@@ -360,81 +397,23 @@ class ReportsService:
                     Order.batch_id == batch_id
                 ).group_by(OrderItem.field).all()
                 
-                labels = []
-                amounts = []
-                counts = []
-                
-                field_names = {
-                    '2_top': '2 ตัวบน',
-                    '2_bottom': '2 ตัวล่าง', 
-                    '3_top': '3 ตัวบน',
-                    'tote': 'โต๊ด'
-                }
-                
-                for item in data:
-                    labels.append(field_names.get(item.field, item.field))
-                    amounts.append(float(item.total_amount))
-                    counts.append(item.total_orders)
-                
                 return {
                     "success": True,
-                    "chart_data": {
-                        "type": "pie",
-                        "labels": labels,
-                        "datasets": [{
-                            "label": "ยอดซื้อ (บาท)",
-                            "data": amounts,
-                            "backgroundColor": ["#007bff", "#28a745", "#ffc107", "#dc3545"]
-                        }]
-                    }
+                    "chart_data": ReportsService._field_distribution_chart(
+                        (item.field, float(item.total_amount)) for item in data
+                    )
                 }
                 
             elif chart_type == "top_numbers":
                 # กราฟแสดง Top 10 เลขยอดสูงสุด
-                data = db.session.query(
-                    OrderItem.field,
-                    OrderItem.number_norm,
-                    func.sum(OrderItem.amount).label('total_amount')
-                ).join(Order).filter(
-                    Order.batch_id == batch_id
-                ).group_by(
-                    OrderItem.field, OrderItem.number_norm
-                ).order_by(
-                    desc(func.sum(OrderItem.amount))
-                ).limit(10).all()
-                
-                labels = []
-                amounts = []
-                colors = []
-                
-                color_map = {
-                    '2_top': '#007bff',
-                    '2_bottom': '#28a745',
-                    '3_top': '#ffc107', 
-                    'tote': '#dc3545'
-                }
-                
-                for item in data:
-                    labels.append(f"{item.number_norm} ({item.field})")
-                    amounts.append(float(item.total_amount))
-                    colors.append(color_map.get(item.field, '#6c757d'))
-                
                 return {
                     "success": True,
-                    "chart_data": {
-                        "type": "bar",
-                        "labels": labels,
-                        "datasets": [{
-                            "label": "ยอดซื้อ (บาท)",
-                            "data": amounts,
-                            "backgroundColor": colors
-                        }]
-                    }
+                    "chart_data": ReportsService._top_numbers_chart(ReportsService._top_numbers(batch_id, 10))
                 }
                 
             elif chart_type == "factor_analysis":
                 # กราฟแสดงการกระจายของ validation factor
-                data = db.session.query(
+                data = read_session().query(
                     OrderItem.validation_factor,
                     OrderItem.validation_reason,
                     func.sum(OrderItem.amount).label('total_amount'),
@@ -445,34 +424,11 @@ class ReportsService:
                     OrderItem.validation_factor, OrderItem.validation_reason
                 ).order_by(OrderItem.validation_factor.desc()).all()
                 
-                labels = []
-                amounts = []
-                colors = []
-                
-                for item in data:
-                    factor_text = f"Factor {item.validation_factor}"
-                    if item.validation_reason != 'ปกติ':
-                        factor_text += f" ({item.validation_reason})"
-                    
-                    labels.append(factor_text)
-                    amounts.append(float(item.total_amount))
-                    
-                    if item.validation_factor == 1.0:
-                        colors.append('#28a745')  # เขียว - ปกติ
-                    else:
-                        colors.append('#ffc107')  # เหลือง - ลดครึ่ง
-                
                 return {
                     "success": True,
-                    "chart_data": {
-                        "type": "doughnut",
-                        "labels": labels,
-                        "datasets": [{
-                            "label": "ยอดซื้อ (บาท)",
-                            "data": amounts,
-                            "backgroundColor": colors
-                        }]
-                    }
+                    "chart_data": ReportsService._factor_chart(
+                        (item.validation_factor, item.validation_reason, float(item.total_amount)) for item in data
+                    )
                 }
             
             else:
@@ -481,6 +437,260 @@ class ReportsService:
         except Exception as e:
             return {"success": False, "error": f"เกิดข้อผิดพลาด: {str(e)}"}
     
+    @staticmethod
+    def get_dashboard(batch_id: str, sections=DASHBOARD_SECTIONS, concentration_threshold: float = 0.1) -> Dict:
+        """
+        ข้อมูลทุก widget ของหน้ารายงานในครั้งเดียว
+        
+        สรุป กราฟ และความเสี่ยงคำนวณจาก aggregate ของ batch ชุดเดียว
+        (GROUP BY field, เลข, factor, เหตุผล, blocked) แทนการ aggregate
+        แยกทีละ endpoint; Top เลขมาจาก ranking เดียวกับ get_batch_summary
+        
+        Args:
+            batch_id: รหัส batch
+            sections: ส่วนที่ต้องการ (summary, charts, risk_analysis, batches)
+            concentration_threshold: เกณฑ์การกระจุกตัวของ risk_analysis
+            
+        Returns:
+            Dict: data มีเฉพาะส่วนที่ขอ แต่ละส่วนรูปแบบเดียวกับ endpoint เดิม
+            (summary = data ของ get_batch_summary, charts = chart_data ตาม
+            ประเภท, risk_analysis = data ของ get_risk_analysis หรือ None ถ้า
+            ไม่มียอดซื้อ, batches = get_available_batches)
+        """
+        try:
+            sections = set(sections)
+            data = {"batch_id": batch_id}
+            
+            if 'batches' in sections:
+                data['batches'] = ReportsService.get_available_batches()
+            if not sections & {'summary', 'charts', 'risk_analysis'}:
+                return {"success": True, "data": data}
+            
+            archive = ReportsService._archived(batch_id)
+            if archive is not None:
+                return ReportsService._archived_dashboard(archive, sections, concentration_threshold, data)
+            
+            # aggregate เดียวของ batch: ทุกส่วนรวมยอดต่อจากตรงนี้
+            cube = read_session().query(
+                OrderItem.field,
+                OrderItem.number_norm,
+                OrderItem.validation_factor,
+                OrderItem.validation_reason,
+                OrderItem.is_blocked,
+                func.sum(OrderItem.amount),
+                func.count(OrderItem.id)
+            ).join(Order).filter(
+                Order.batch_id == batch_id
+            ).group_by(
+                OrderItem.field, OrderItem.number_norm, OrderItem.validation_factor,
+                OrderItem.validation_reason, OrderItem.is_blocked
+            ).all()
+            
+            fields = {}
+            numbers = {}
+            factors = {}
+            grand_total = 0.0
+            for field, number_norm, factor, reason, is_blocked, amount, count in cube:
+                amount = float(amount or 0)
+                grand_total += amount
+                totals = fields.setdefault(field, {
+                    'total_amount': 0.0, 'total_items': 0, 'factor_sum': 0.0, 'factor_count': 0,
+                    'normal_amount': 0.0, 'reduced_amount': 0.0, 'reduced_below_one': 0.0, 'blocked_amount': 0.0
+                })
+                totals['total_amount'] += amount
+                totals['total_items'] += count
+                if factor is not None:
+                    totals['factor_sum'] += float(factor) * count
+                    totals['factor_count'] += count
+                    if factor == 1.0:
+                        totals['normal_amount'] += amount
+                    elif factor == 0.5:
+                        totals['reduced_amount'] += amount
+                    if factor < 1.0:
+                        totals['reduced_below_one'] += amount
+                if is_blocked:
+                    totals['blocked_amount'] += amount
+                numbers[(field, number_norm)] = numbers.get((field, number_norm), 0.0) + amount
+                factor_total, factor_count = factors.get((factor, reason), (0.0, 0))
+                factors[(factor, reason)] = (factor_total + amount, factor_count + count)
+            
+            top_numbers_list = None
+            if sections & {'summary', 'charts'}:
+                top_numbers_list = ReportsService._top_numbers(batch_id, 20)
+            
+            if 'summary' in sections:
+                batch_info = read_session().query(
+                    Order.lottery_period,
+                    func.count(Order.id).label('total_orders'),
+                    func.count(func.distinct(Order.user_id)).label('unique_users'),
+                    func.sum(Order.total_amount).label('grand_total')
+                ).filter(Order.batch_id == batch_id).first()
+                field_users = dict(read_session().query(
+                    OrderItem.field, func.count(func.distinct(Order.user_id))
+                ).join(Order).filter(Order.batch_id == batch_id).group_by(OrderItem.field).all())
+                
+                data['summary'] = {
+                    "batch_id": batch_id,
+                    "lottery_period": batch_info.lottery_period.isoformat() if batch_info and batch_info.lottery_period else None,
+                    "overview": {
+                        "total_orders": batch_info.total_orders if batch_info else 0,
+                        "unique_users": batch_info.unique_users if batch_info else 0,
+                        "grand_total": float(batch_info.grand_total or 0) if batch_info else 0.0
+                    },
+                    "summary_by_field": {
+                        field: {
+                            'total_amount': round(totals['total_amount'], 2),
+                            'total_items': totals['total_items'],
+                            'unique_users': field_users.get(field, 0),
+                            'avg_factor': round(totals['factor_sum'] / totals['factor_count'], 3) if totals['factor_count'] else 1.0,
+                            'normal_amount': round(totals['normal_amount'], 2),
+                            'reduced_amount': round(totals['reduced_amount'], 2),
+                            'blocked_amount': round(totals['blocked_amount'], 2)
+                        }
+                        for field, totals in sorted(fields.items())
+                    },
+                    "top_numbers": top_numbers_list
+                }
+            
+            if 'charts' in sections:
+                data['charts'] = {
+                    'field_distribution': ReportsService._field_distribution_chart(
+                        (field, round(totals['total_amount'], 2)) for field, totals in sorted(fields.items())
+                    ),
+                    'top_numbers': ReportsService._top_numbers_chart(top_numbers_list[:10]),
+                    'factor_analysis': ReportsService._factor_chart(
+                        (factor, reason, round(total, 2))
+                        for (factor, reason), (total, _) in sorted(
+                            factors.items(), key=lambda item: (item[0][0] is not None, item[0][0] or 0), reverse=True
+                        )
+                    )
+                }
+            
+            if 'risk_analysis' in sections:
+                data['risk_analysis'] = ReportsService._risk_data(
+                    batch_id, round(grand_total, 2), concentration_threshold,
+                    ((field, number, round(total, 2)) for (field, number), total in numbers.items()),
+                    ((field, round(totals['reduced_below_one'], 2), round(totals['total_amount'], 2))
+                     for field, totals in sorted(fields.items()))
+                ) if grand_total > 0 else None
+            
+            return {"success": True, "data": data}
+            
+        except Exception as e:
+            return {"success": False, "error": f"เกิดข้อผิดพลาด: {str(e)}"}
+    
+    @staticmethod
+    def _archived_dashboard(archive, sections, concentration_threshold: float, data: Dict) -> Dict:
+        """get_dashboard สำหรับ batch ที่ archive แล้ว (คำนวณจากไฟล์ column ในหน่วยความจำ)"""
+        if 'summary' in sections:
+            data['summary'] = ReportsService._archived_batch_summary(archive)['data']
+        if 'charts' in sections:
+            data['charts'] = {
+                chart_type: ReportsService._archived_chart_data(archive, chart_type)['chart_data']
+                for chart_type in ('field_distribution', 'top_numbers', 'factor_analysis')
+            }
+        if 'risk_analysis' in sections:
+            risk = ReportsService._archived_risk_analysis(archive, concentration_threshold)
+            data['risk_analysis'] = risk['data'] if risk['success'] else None
+        data['archived'] = True
+        return {"success": True, "data": data}
+    
+    @staticmethod
+    def _field_distribution_chart(rows) -> Dict:
+        """chart_data กราฟวงกลมตามประเภทสลาก จาก (field, ยอดซื้อ)"""
+        rows = list(rows)
+        return {
+            "type": "pie",
+            "labels": [FIELD_NAMES.get(field, field) for field, _ in rows],
+            "datasets": [{
+                "label": "ยอดซื้อ (บาท)",
+                "data": [amount for _, amount in rows],
+                "backgroundColor": ["#007bff", "#28a745", "#ffc107", "#dc3545"]
+            }]
+        }
+    
+    @staticmethod
+    def _top_numbers_chart(top_numbers_list: List[Dict]) -> Dict:
+        """chart_data กราฟแท่ง Top เลข จากรายการของ _top_numbers"""
+        return {
+            "type": "bar",
+            "labels": [f"{item['number']} ({item['field']})" for item in top_numbers_list],
+            "datasets": [{
+                "label": "ยอดซื้อ (บาท)",
+                "data": [item['total_amount'] for item in top_numbers_list],
+                "backgroundColor": [FIELD_COLORS.get(item['field'], '#6c757d') for item in top_numbers_list]
+            }]
+        }
+    
+    @staticmethod
+    def _factor_chart(rows) -> Dict:
+        """chart_data กราฟโดนัทตาม validation factor จาก (factor, เหตุผล, ยอดซื้อ)"""
+        labels = []
+        amounts = []
+        colors = []
+        for factor, reason, amount in rows:
+            factor_text = f"Factor {factor}"
+            if reason != 'ปกติ':
+                factor_text += f" ({reason})"
+            labels.append(factor_text)
+            amounts.append(amount)
+            colors.append('#28a745' if factor == 1.0 else '#ffc107')  # เขียว - ปกติ / เหลือง - ลดครึ่ง
+        return {
+            "type": "doughnut",
+            "labels": labels,
+            "datasets": [{
+                "label": "ยอดซื้อ (บาท)",
+                "data": amounts,
+                "backgroundColor": colors
+            }]
+        }
+    
+    @staticmethod
+    def _risk_data(batch_id: str, grand_total: float, concentration_threshold: float,
+                   numbers, field_totals) -> Dict:
+        """
+        data ของ get_risk_analysis
+        
+        Args:
+            numbers: (field, เลข, ยอดซื้อ) - เก็บเฉพาะที่เกินเกณฑ์การกระจุกตัว
+            field_totals: (field, ยอดที่ factor < 1.0, ยอดรวม)
+        """
+        high_risk_numbers = []
+        for field, number, total_amount in sorted(numbers, key=lambda item: item[2], reverse=True):
+            if total_amount / grand_total <= concentration_threshold:
+                continue
+            percentage = total_amount / grand_total * 100
+            risk_level = "HIGH" if percentage > 20 else "MEDIUM" if percentage > 10 else "LOW"
+            high_risk_numbers.append({
+                'field': field,
+                'number': number,
+                'total_amount': total_amount,
+                'percentage': round(percentage, 2),
+                'risk_level': risk_level
+            })
+        
+        field_risks = {}
+        for field, reduced_amount, total_amount in field_totals:
+            field_risks[field] = {
+                'total_amount': total_amount,
+                'reduced_amount': reduced_amount,
+                'reduced_percentage': round(reduced_amount / total_amount * 100, 2) if total_amount > 0 else 0
+            }
+        
+        total_high_risk = sum(item['total_amount'] for item in high_risk_numbers)
+        return {
+            "batch_id": batch_id,
+            "grand_total": grand_total,
+            "concentration_threshold": concentration_threshold * 100,
+            "high_risk_numbers": high_risk_numbers,
+            "field_risks": field_risks,
+            "summary": {
+                "high_risk_count": len(high_risk_numbers),
+                "total_high_risk_amount": total_high_risk,
+                "high_risk_percentage": round(total_high_risk / grand_total * 100, 2)
+            }
+        }
+    
     @staticmethod
     def get_available_batches() -> List[Dict]:
         """
@@ -490,7 +700,7 @@ class ReportsService:
             List[Dict]: รายการ batch
         """
         try:
-            batches = db.session.query(
+            batches = read_session().query(
                 Order.batch_id,
                 Order.lottery_period,
                 func.count(Order.id).label('order_count'),
@@ -514,7 +724,168 @@ class ReportsService:
                     'last_order': batch.last_order.isoformat() if batch.last_order else None
                 })
             
+            # batch ที่ย้ายไป archive แล้ว
+            from app.services.archive_service import ArchiveService
+            hot_ids = {batch['batch_id'] for batch in batch_list}
+            batch_list.extend(
+                summary for summary in ArchiveService.list_archived_batches()
+                if summary['batch_id'] not in hot_ids
+            )
+            batch_list.sort(key=lambda batch: batch['lottery_period'] or '', reverse=True)
+            
             return batch_list
             
         except Exception as e:
             return []
+    
+    # ------------------------------------------------------------------
+    # รายงานจาก batch ที่ archive แล้ว (อ่านจากไฟล์ column แบบ mmap)
+    # ผลลัพธ์มีรูปแบบเดียวกับรายงานจากฐานข้อมูล
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _archived_batch_summary(archive) -> Dict:
+        """get_batch_summary สำหรับ batch ที่ archive แล้ว"""
+        overview = archive.order_summary()
+        
+        summary_by_field = {}
+        for row in archive.aggregate_items(('field',)):
+            summary_by_field[row.field] = {
+                'total_amount': row.total_amount,
+                'total_items': row.count,
+                'unique_users': row.unique_users,
+                'avg_factor': round(row.avg_factor or 1.0, 3),
+                'normal_amount': row.normal_amount,
+                'reduced_amount': row.reduced_amount,
+                'blocked_amount': row.blocked_amount
+            }
+        
+        numbers = ReportsService._archived_top_numbers(archive, 20)
+        top_numbers_list = [{
+            'field': row.field,
+            'number': row.number_norm,
+            'total_amount': row.total_amount,
+            'order_count': row.count,
+            'buyer_count': row.unique_users,
+            'avg_factor': round(row.avg_factor or 1.0, 3)
+        } for row in numbers]
+        
+        return {
+            "success": True,
+            "data": {
+                "batch_id": archive.batch_id,
+                "lottery_period": overview.lottery_period.isoformat() if overview.lottery_period else None,
+                "overview": {
+                    "total_orders": overview.total_orders,
+                    "unique_users": overview.unique_users,
+                    "grand_total": overview.grand_total
+                },
+                "summary_by_field": summary_by_field,
+                "top_numbers": top_numbers_list,
+                "archived": True
+            }
+        }
+    
+    @staticmethod
+    def _archived_top_numbers(archive, limit: int) -> List:
+        """เลขยอดสูงสุดของ batch ที่ archive แล้ว (ไม่นับคำสั่งซื้อที่ยกเลิก เหมือน _top_numbers)"""
+        return sorted(archive.aggregate_items(('field', 'number_norm'), archive.item_mask(exclude_cancelled=True)),
+                      key=lambda row: row.total_amount, reverse=True)[:limit]
+    
+    @staticmethod
+    def _archived_number_analysis(archive, field: str, number: str) -> Dict:
+        """get_number_analysis สำหรับ batch ที่ archive แล้ว"""
+        mask = archive.item_mask(field, number)
+        totals = archive.aggregate_items((), mask)
+        if not totals or not totals[0].total_amount:
+            return {"success": False, "error": "ไม่พบข้อมูลเลขนี้"}
+        total_data = totals[0]
+        
+        breakdown_list = [{
+            'validation_factor': float(row.validation_factor),
+            'validation_reason': row.validation_reason,
+            'amount': row.total_amount,
+            'count': row.count
+        } for row in archive.aggregate_items(('validation_factor', 'validation_reason'), mask)]
+        
+        user_rows = sorted(archive.aggregate_items(('user_id',), mask),
+                           key=lambda row: row.total_amount, reverse=True)[:10]
+        users = {
+            user.id: user for user in read_session().query(User.id, User.username, User.name).filter(
+                User.id.in_([row.user_id for row in user_rows])
+            )
+        }
+        user_list = [{
+            'username': users[row.user_id].username if row.user_id in users else None,
+            'name': users[row.user_id].name if row.user_id in users else None,
+            'total_amount': row.total_amount,
+            'order_count': row.count,
+            'avg_factor': round(row.avg_factor or 1.0, 3)
+        } for row in user_rows]
+        
+        timeline_list = [{
+            'hour': row.hour,
+            'amount': row.total_amount,
+            'orders': row.count
+        } for row in sorted(archive.aggregate_items(('hour',), mask), key=lambda row: row.hour)]
+        
+        return {
+            "success": True,
+            "data": {
+                "field": field,
+                "number": number,
+                "batch_id": archive.batch_id,
+                "summary": {
+                    "total_amount": total_data.total_amount,
+                    "total_orders": total_data.count,
+                    "unique_users": total_data.unique_users,
+                    "avg_factor": round(total_data.avg_factor or 1.0, 3),
+                    "first_order": total_data.first_order.isoformat() if total_data.first_order else None,
+                    "last_order": total_data.last_order.isoformat() if total_data.last_order else None
+                },
+                "factor_breakdown": breakdown_list,
+                "top_users": user_list,
+                "timeline": timeline_list,
+                "archived": True
+            }
+        }
+    
+    @staticmethod
+    def _archived_risk_analysis(archive, concentration_threshold: float) -> Dict:
+        """get_risk_analysis สำหรับ batch ที่ archive แล้ว"""
+        grand_total = float(archive.amount('order_items', 'amount').sum())
+        if grand_total == 0:
+            return {"success": False, "error": "ไม่พบข้อมูลการซื้อ"}
+        
+        data = ReportsService._risk_data(
+            archive.batch_id, grand_total, concentration_threshold,
+            ((row.field, row.number_norm, row.total_amount) for row in archive.aggregate_items(('field', 'number_norm'))),
+            ((row.field, row.reduced_below_one, row.total_amount) for row in archive.aggregate_items(('field',)))
+        )
+        return {"success": True, "data": {**data, "archived": True}}
+    
+    @staticmethod
+    def _archived_chart_data(archive, chart_type: str) -> Dict:
+        """get_chart_data สำหรับ batch ที่ archive แล้ว"""
+        if chart_type == "field_distribution":
+            chart_data = ReportsService._field_distribution_chart(
+                (row.field, row.total_amount) for row in archive.aggregate_items(('field',))
+            )
+            return {"success": True, "chart_data": chart_data}
+        
+        if chart_type == "top_numbers":
+            rows = ReportsService._archived_top_numbers(archive, 10)
+            chart_data = ReportsService._top_numbers_chart([
+                {'field': row.field, 'number': row.number_norm, 'total_amount': row.total_amount} for row in rows
+            ])
+            return {"success": True, "chart_data": chart_data}
+        
+        if chart_type == "factor_analysis":
+            rows = sorted(archive.aggregate_items(('validation_factor', 'validation_reason')),
+                          key=lambda row: row.validation_factor, reverse=True)
+            chart_data = ReportsService._factor_chart(
+                (row.validation_factor, row.validation_reason, row.total_amount) for row in rows
+            )
+            return {"success": True, "chart_data": chart_data}
+        
+        return {"success": False, "error": "ประเภทกราฟไม่ถูกต้อง"}
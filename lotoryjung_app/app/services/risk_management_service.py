@@ -5,6 +5,7 @@ Risk Management Service - ระบบบริหารความเสี่
 
 from sqlalchemy import func, text, and_, or_, desc, case
 from app import db
+from app.utils.read_routing import read_session
 from app.models import Order, OrderItem, User, Rule
 from datetime import datetime, date
 import pytz
@@ -87,7 +88,7 @@ class RiskManagementService:
         """ดึงข้อมูลพื้นฐานสำหรับการคำนวณ"""
         try:
             # ยอดรวมทั้งหมด
-            grand_total = db.session.query(
+            grand_total = read_session().query(
                 func.sum(OrderItem.amount).label('total')
             ).join(Order).filter(Order.batch_id == batch_id).scalar() or 0
             
@@ -107,7 +108,7 @@ class RiskManagementService:
         """คำนวณความเสี่ยงแบบครบถ้วนสำหรับแต่ละเลข"""
         
         # ข้อมูลรวมของแต่ละเลข
-        number_data = db.session.query(
+        number_data = read_session().query(
             OrderItem.field,
             OrderItem.number_norm,
             func.sum(OrderItem.amount).label('total_amount'),
@@ -133,7 +134,7 @@ class RiskManagementService:
         ).subquery()
         
         # ดึงข้อมูลผู้ใช้ที่ซื้อมากที่สุดในแต่ละเลข
-        user_concentration_data = db.session.query(
+        user_concentration_data = read_session().query(
             OrderItem.field,
             OrderItem.number_norm,
             func.sum(OrderItem.amount).label('user_total'),
@@ -145,7 +146,7 @@ class RiskManagementService:
         ).subquery()
         
         # รวมข้อมูลและคำนวณ max user amount ต่อเลข
-        user_max_query = db.session.query(
+        user_max_query = read_session().query(
             user_concentration_data.c.field,
             user_concentration_data.c.number_norm,
             func.max(user_concentration_data.c.user_total).label('max_user_amount')
@@ -160,7 +161,7 @@ class RiskManagementService:
             user_max_dict[key] = float(row.max_user_amount)
         
         # ดึงข้อมูลหลักและรวมกับข้อมูลผู้ใช้
-        main_query = db.session.query(number_data).all()
+        main_query = read_session().query(number_data).all()
         
         risk_analysis = []
         
@@ -236,7 +237,7 @@ class RiskManagementService:
         }
         
         try:
-            rate = db.session.query(Rule.value).filter(
+            rate = read_session().query(Rule.value).filter(
                 and_(Rule.rule_type == 'payout', Rule.field == field, Rule.is_active == True)
             ).scalar()
             return float(rate) if rate else default_rates.get(field, 90)
@@ -406,7 +407,7 @@ class RiskManagementService:
                 return {"success": False, "error": "ไม่พบข้อมูลเลขที่ระบุ"}
             
             # ดึงข้อมูลผู้ใช้ที่ซื้อเลขนี้
-            user_details = db.session.query(
+            user_details = read_session().query(
                 User.username,
                 User.name,
                 func.sum(OrderItem.amount).label('total_amount'),
@@ -8,6 +8,29 @@ from decimal import Decimal
 from app import db
 from app.models import Rule, BlockedNumber, AuditLog
 
+FIELDS = ('2_top', '2_bottom', '3_top', 'tote')
+
+# Rule types accepted by import_rules -> whether number_norm is required
+# (True), optional (None) or not allowed (False)
+IMPORT_RULE_TYPES = {
+    'number_limit': True,
+    'default_limit': False,
+    'payout': None,
+    'limit': None,
+}
+
+# Largest value that fits rules.value (Numeric(10, 2))
+MAX_RULE_VALUE = Decimal('99999999.99')
+
+
+class RuleImportError(Exception):
+    """Raised when an import has invalid rows (nothing is written)"""
+
+    def __init__(self, errors: List[Dict]):
+        self.errors = errors
+        super().__init__(f"{len(errors)} invalid rule rows")
+
+
 class RuleService:
     """Service class for rule operations"""
     
@@ -341,7 +364,329 @@ class RuleService:
             }
             for blocked in blocked_numbers
         ]
-    
+
+    @staticmethod
+    def sync_blocked_numbers(records: List[Dict], reason: str = None, is_active: bool = True,
+                             user_id: int = None) -> Dict:
+        """
+        Make the blocked-number table match a desired set (set-diff sync)
+
+        Compares the desired (field, number_norm) set with the table and issues
+        one bulk INSERT for new numbers, one UPDATE to (re)activate existing
+        rows and one UPDATE to deactivate numbers no longer in the set.
+        Unchanged rows are not touched. Everything is committed in a single
+        transaction, so validators never see a partially applied list, and
+        recorded as one 'rules' version listing the changed numbers.
+
+        Args:
+            records: Desired records, dicts with 'field' and 'number_norm'
+            reason: Reason stored on inserted/reactivated rows
+            is_active: Desired active state for the numbers in the set
+            user_id: User ID for audit log
+
+        Returns:
+            Dict with 'added', 'activated', 'deactivated', 'unchanged' counts
+        """
+        from sqlalchemy import insert, update
+        from datetime import datetime
+        from app.models import BANGKOK_TZ
+        from app.utils.db_engine import immediate_transaction
+        from app.utils.change_tracking import (
+            RULES_COUNTER, UNTRACKED_OPTION, bump_counter, record_rule_changes
+        )
+
+        desired = {(r['field'], r['number_norm']) for r in records}
+
+        immediate_transaction(db.session)
+
+        existing = {
+            (field, number_norm): (row_id, active)
+            for row_id, field, number_norm, active in db.session.query(
+                BlockedNumber.id, BlockedNumber.field, BlockedNumber.number_norm, BlockedNumber.is_active
+            )
+        }
+
+        to_add = desired - existing.keys()
+        to_set = [existing[key][0] for key in desired & existing.keys() if existing[key][1] != is_active]
+        to_deactivate = [row_id for key, (row_id, active) in existing.items() if active and key not in desired]
+
+        # The statements below are recorded together once they are done
+        untracked = {UNTRACKED_OPTION: True}
+
+        if to_add:
+            now = datetime.now(BANGKOK_TZ)
+            db.session.execute(insert(BlockedNumber).execution_options(**untracked), [
+                {
+                    'field': field,
+                    'number_norm': number_norm,
+                    'reason': reason or '',
+                    'is_active': is_active,
+                    'created_at': now
+                }
+                for field, number_norm in sorted(to_add)
+            ])
+
+        if to_set:
+            db.session.execute(
+                update(BlockedNumber)
+                .where(BlockedNumber.id.in_(to_set))
+                .values(is_active=is_active, reason=reason or BlockedNumber.reason)
+                .execution_options(synchronize_session=False, **untracked)
+            )
+
+        if to_deactivate:
+            db.session.execute(
+                update(BlockedNumber)
+                .where(BlockedNumber.id.in_(to_deactivate))
+                .values(is_active=False)
+                .execution_options(synchronize_session=False, **untracked)
+            )
+
+        changed_ids = set(to_set) | set(to_deactivate)
+        changed = to_add | {key for key, (row_id, _) in existing.items() if row_id in changed_ids}
+        if changed:
+            connection = db.session.connection()
+            version = bump_counter(connection, RULES_COUNTER)
+            record_rule_changes(connection, version, [
+                ('blocked_number', None, field, number_norm) for field, number_norm in changed
+            ])
+
+        result = {
+            'added': len(to_add),
+            'activated': len(to_set),
+            'deactivated': len(to_deactivate),
+            'unchanged': len(desired) - len(to_add) - len(to_set)
+        }
+
+        if user_id and (to_add or to_set or to_deactivate):
+            db.session.add(AuditLog(
+                user_id=user_id,
+                action='sync_blocked_numbers',
+                resource='blocked_number',
+                details=result
+            ))
+
+        db.session.commit()
+
+        return result
+
+    @staticmethod
+    def parse_rules_csv(text: str) -> List[Dict]:
+        """
+        Read import rows from CSV text
+
+        Columns: field, number (or number_norm), value and optionally
+        rule_type (default number_limit); the header row is required.
+
+        Raises:
+            RuleImportError: Missing columns
+        """
+        import csv
+        import io
+
+        reader = csv.DictReader(io.StringIO(text.lstrip('\ufeff')))
+        columns = {name.strip().lower() for name in reader.fieldnames or [] if name}
+        missing = {'field', 'value'} - columns
+        if missing:
+            raise RuleImportError([{
+                'row': 1,
+                'error': f"หัวตารางต้องมีคอลัมน์ field, number, value (ขาด: {', '.join(sorted(missing))})"
+            }])
+
+        records = []
+        for row in reader:
+            # Cells beyond the header (key None) are ignored
+            row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+            if not any(row.values()):
+                continue
+            records.append({
+                'rule_type': row.get('rule_type') or 'number_limit',
+                'field': row.get('field'),
+                'number_norm': row.get('number_norm') or row.get('number') or None,
+                'value': row.get('value')
+            })
+        return records
+
+    @staticmethod
+    def _validate_import(records: List[Dict]) -> Dict[Tuple[str, str, Optional[str]], Decimal]:
+        """
+        Validate and normalize import rows
+
+        Returns:
+            (rule_type, field, number_norm) -> value
+
+        Raises:
+            RuleImportError: Every invalid row (row numbers are 1-based)
+        """
+        from decimal import InvalidOperation
+        from app.utils.number_utils import normalize_number, validate_number_format
+
+        rules = {}
+        errors = []
+        for row_number, record in enumerate(records, start=1):
+            if not isinstance(record, dict):
+                errors.append({'row': row_number, 'error': 'รูปแบบข้อมูลไม่ถูกต้อง'})
+                continue
+
+            rule_type = record.get('rule_type') or 'number_limit'
+            field = record.get('field')
+            number = record.get('number_norm', record.get('number'))
+            number = str(number).strip() if number not in (None, '') else None
+
+            if rule_type not in IMPORT_RULE_TYPES:
+                errors.append({'row': row_number, 'error': f'ประเภทกฎไม่ถูกต้อง: {rule_type}'})
+                continue
+            if field not in FIELDS:
+                errors.append({'row': row_number, 'error': f'ประเภทเลขไม่ถูกต้อง: {field}'})
+                continue
+
+            number_rule = IMPORT_RULE_TYPES[rule_type]
+            if number is None and number_rule:
+                errors.append({'row': row_number, 'error': 'กรุณาใส่เลข'})
+                continue
+            if number is not None and number_rule is False:
+                errors.append({'row': row_number, 'error': f'{rule_type} ใช้กับทั้งประเภท ไม่ต้องใส่เลข'})
+                continue
+            if number is not None:
+                if not number.isdigit():
+                    errors.append({'row': row_number, 'error': f'เลขไม่ถูกต้อง: {number}'})
+                    continue
+                is_valid, message = validate_number_format(number, field)
+                if not is_valid:
+                    errors.append({'row': row_number, 'error': message})
+                    continue
+                number = normalize_number(number, field)
+
+            try:
+                value = Decimal(str(record.get('value')).replace(',', '')).quantize(Decimal('0.01'))
+            except (InvalidOperation, ValueError):
+                errors.append({'row': row_number, 'error': f"จำนวนไม่ถูกต้อง: {record.get('value')}"})
+                continue
+            if not value.is_finite() or value < 0 or value > MAX_RULE_VALUE:
+                errors.append({'row': row_number, 'error': f'จำนวนต้องอยู่ระหว่าง 0 ถึง {MAX_RULE_VALUE}'})
+                continue
+
+            key = (rule_type, field, number)
+            if key in rules and rules[key] != value:
+                errors.append({'row': row_number, 'error': f'กฎซ้ำแต่ค่าไม่ตรงกัน: {field} {number or ""}'.strip()})
+                continue
+            rules[key] = value
+
+        if errors:
+            raise RuleImportError(errors)
+        return rules
+
+    @staticmethod
+    def import_rules(records: List[Dict], user_id: int = None, source: str = 'json',
+                     dry_run: bool = False) -> Dict:
+        """
+        Validate and upsert many limit/payout rules in one transaction
+
+        Every row is validated first; if any is invalid nothing is written.
+        Rows are then compared with the table: one multi-row INSERT for new
+        rules and one executemany UPDATE for rules whose value changed or
+        that were inactive. The rule version is bumped once for the whole
+        import (rule_changes gets the exact keys, so terminals still receive
+        a delta) and a single audit entry is written.
+
+        Args:
+            records: Dicts with 'rule_type' (default number_limit), 'field',
+                'number_norm' (or 'number') and 'value'
+            user_id: User ID for audit log
+            source: Recorded in the audit entry (json, csv)
+            dry_run: Validate and count only, write nothing
+
+        Returns:
+            Dict with 'total', 'inserted', 'updated', 'unchanged', 'dry_run'
+            and 'version' (rules version after the import)
+
+        Raises:
+            RuleImportError: Invalid rows
+        """
+        from sqlalchemy import bindparam, insert, update
+        from datetime import datetime
+        from app.models import BANGKOK_TZ
+        from app.utils.db_engine import immediate_transaction
+        from app.utils.change_tracking import RULES_COUNTER, bump_counter, get_counter, record_rule_changes
+
+        rules = RuleService._validate_import(records)
+
+        if not dry_run:
+            immediate_transaction(db.session)
+
+        existing = {
+            (rule_type, field, number_norm): (row_id, value, active)
+            for row_id, rule_type, field, number_norm, value, active in db.session.query(
+                Rule.id, Rule.rule_type, Rule.field, Rule.number_norm, Rule.value, Rule.is_active
+            ).filter(
+                Rule.rule_type.in_({key[0] for key in rules}),
+                Rule.field.in_({key[1] for key in rules})
+            )
+        }
+
+        to_insert = sorted((key for key in rules if key not in existing), key=str)
+        to_update = sorted((
+            key for key in rules
+            if key in existing and (existing[key][1] != rules[key] or not existing[key][2])
+        ), key=str)
+
+        result = {
+            'total': len(rules),
+            'inserted': len(to_insert),
+            'updated': len(to_update),
+            'unchanged': len(rules) - len(to_insert) - len(to_update),
+            'dry_run': dry_run
+        }
+
+        if dry_run or not (to_insert or to_update):
+            result['version'] = get_counter(RULES_COUNTER)
+            db.session.rollback()
+            return result
+
+        # Core statements on the table: the change-tracking listener only
+        # sees ORM statements, so the version is bumped once below
+        table = Rule.__table__
+        now = datetime.now(BANGKOK_TZ)
+        if to_insert:
+            db.session.execute(insert(table), [
+                {
+                    'rule_type': rule_type,
+                    'field': field,
+                    'number_norm': number_norm,
+                    'value': rules[(rule_type, field, number_norm)],
+                    'is_active': True,
+                    'created_at': now
+                }
+                for rule_type, field, number_norm in to_insert
+            ])
+        if to_update:
+            db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam('b_id'))
+                .values(value=bindparam('b_value'), is_active=True, updated_at=now),
+                [{'b_id': existing[key][0], 'b_value': rules[key]} for key in to_update]
+            )
+
+        connection = db.session.connection()
+        result['version'] = bump_counter(connection, RULES_COUNTER)
+        record_rule_changes(connection, result['version'], [('rule', *key) for key in to_insert + to_update])
+
+        if user_id:
+            db.session.add(AuditLog(
+                user_id=user_id,
+                action='import_rules',
+                resource='rule',
+                details={
+                    'source': source,
+                    **{k: v for k, v in result.items() if k != 'dry_run'},
+                    'rule_types': sorted({key[0] for key in to_insert + to_update})
+                }
+            ))
+
+        db.session.commit()
+
+        return result
+
     @staticmethod
     def get_all_rules(rule_type: str = None, field: str = None) -> List[Dict]:
         """
@@ -389,13 +734,11 @@ class RuleService:
         Returns:
             Number of rules updated
         """
-        updated_count = 0
-        
-        for field, rate in rates.items():
-            RuleService.set_payout_rate(field, rate, user_id=user_id)
-            updated_count += 1
-        
-        return updated_count
+        RuleService.import_rules(
+            [{'rule_type': 'payout', 'field': field, 'value': rate} for field, rate in rates.items()],
+            user_id=user_id
+        )
+        return len(rates)
     
     @staticmethod
     def bulk_update_limits(limits: Dict[str, float], user_id: int = None) -> int:
@@ -409,11 +752,9 @@ class RuleService:
         Returns:
             Number of rules updated
         """
-        updated_count = 0
-        
-        for field, limit in limits.items():
-            RuleService.set_limit_amount(field, limit, user_id=user_id)
-            updated_count += 1
-        
-        return updated_count
+        RuleService.import_rules(
+            [{'rule_type': 'limit', 'field': field, 'value': limit} for field, limit in limits.items()],
+            user_id=user_id
+        )
+        return len(limits)
 
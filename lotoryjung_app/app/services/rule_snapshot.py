@@ -0,0 +1,162 @@
+"""
+Rule snapshot
+Immutable, compiled view of the active rules (payout rates, limits, blocked
+numbers) reused across requests until the 'rules' change counter moves.
+"""
+
+import threading
+from decimal import Decimal
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from app import db
+from app.models import Rule, BlockedNumber
+from app.utils.change_tracking import RULES_COUNTER, get_counter
+
+FIELDS = ('2_top', '2_bottom', '3_top', 'tote')
+
+# Number of digits per field - dense arrays are indexed by int(number)
+FIELD_DIGITS = {'2_top': 2, '2_bottom': 2, '3_top': 3, 'tote': 3}
+
+# Same fallbacks as LimitService
+DEFAULT_PAYOUT_RATES = {'2_top': 90, '2_bottom': 90, '3_top': 900, 'tote': 150}
+DEFAULT_LIMITS = {
+    '2_top': Decimal('700.00'),
+    '2_bottom': Decimal('600.00'),
+    '3_top': Decimal('500.00'),
+    'tote': Decimal('400.00')
+}
+
+
+class RuleSnapshot:
+    """
+    Compiled rules for one rules version
+
+    Attributes:
+        version: 'rules' change counter value the snapshot was built from
+        payout_rates: field -> base payout rate
+        default_limits: field -> default limit
+        blocked: field -> frozenset of blocked number_norm
+        limits: field -> tuple of limits indexed by int(number_norm)
+    """
+
+    def __init__(self, version: int, payout_rates: Dict[str, int], default_limits: Dict[str, Decimal],
+                 blocked: Dict[str, FrozenSet[str]], limits: Dict[str, Tuple[Decimal, ...]],
+                 extra_limits: Dict[Tuple[str, str], Decimal]):
+        self.version = version
+        self.payout_rates = payout_rates
+        self.default_limits = default_limits
+        self.blocked = blocked
+        self.limits = limits
+        self._extra_limits = extra_limits
+
+    def is_blocked(self, field: str, number_norm: str) -> bool:
+        blocked = self.blocked.get(field)
+        return blocked is not None and number_norm in blocked
+
+    def limit_for(self, field: str, number_norm: str) -> Decimal:
+        """Individual limit for a number, falling back to the field default"""
+        digits = FIELD_DIGITS.get(field)
+        if digits and len(number_norm) == digits and number_norm.isdigit():
+            return self.limits[field][int(number_norm)]
+        return self._extra_limits.get(
+            (field, number_norm), self.default_limits.get(field, Decimal('0'))
+        )
+
+    @property
+    def extra_limits(self) -> Dict[Tuple[str, str], Decimal]:
+        """Individual limits that do not fit the dense arrays"""
+        return self._extra_limits
+
+    def blocked_lists(self) -> Dict[str, List[str]]:
+        """Blocked numbers as sorted lists (JSON friendly)"""
+        return {field: sorted(self.blocked.get(field, ())) for field in FIELDS}
+
+    @classmethod
+    def build(cls, version: int) -> 'RuleSnapshot':
+        """Load active rules and blocked numbers (two queries) and compile them"""
+        payout_rates = {}
+        default_limits = {}
+        number_limits = {}
+
+        rules = db.session.query(Rule.rule_type, Rule.field, Rule.number_norm, Rule.value).filter(
+            Rule.is_active == True,
+            Rule.rule_type.in_(['payout', 'default_limit', 'number_limit'])
+        ).all()
+
+        for rule_type, field, number_norm, value in rules:
+            if rule_type == 'payout' and number_norm is None:
+                payout_rates[field] = int(value)
+            elif rule_type == 'default_limit' and number_norm is None:
+                default_limits[field] = value
+            elif rule_type == 'number_limit' and number_norm is not None:
+                number_limits[(field, number_norm)] = value
+
+        for field, rate in DEFAULT_PAYOUT_RATES.items():
+            payout_rates.setdefault(field, rate)
+        for field, limit in DEFAULT_LIMITS.items():
+            default_limits.setdefault(field, limit)
+
+        limits = {}
+        extra_limits = {}
+        for field in FIELDS:
+            dense = [default_limits[field]] * (10 ** FIELD_DIGITS[field])
+            limits[field] = dense
+        for (field, number_norm), value in number_limits.items():
+            digits = FIELD_DIGITS.get(field)
+            if digits and len(number_norm) == digits and number_norm.isdigit():
+                limits[field][int(number_norm)] = value
+            else:
+                extra_limits[(field, number_norm)] = value
+
+        blocked_sets = {field: set() for field in FIELDS}
+        for field, number_norm in db.session.query(BlockedNumber.field, BlockedNumber.number_norm).filter(
+            BlockedNumber.is_active == True
+        ):
+            blocked_sets.setdefault(field, set()).add(number_norm)
+
+        return cls(
+            version=version,
+            payout_rates=payout_rates,
+            default_limits=default_limits,
+            blocked={field: frozenset(numbers) for field, numbers in blocked_sets.items()},
+            limits={field: tuple(values) for field, values in limits.items()},
+            extra_limits=extra_limits
+        )
+
+
+_snapshot: Optional[RuleSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_rule_snapshot() -> RuleSnapshot:
+    """
+    Return the compiled rule snapshot, rebuilding it when rules have changed
+
+    Costs one counter lookup per call; the rebuild (two queries) only runs
+    after a Rule/BlockedNumber change.
+    """
+    global _snapshot
+
+    version = get_counter(RULES_COUNTER)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = RuleSnapshot.build(version)
+        return _snapshot
+
+
+def seed_rule_snapshot(snapshot: RuleSnapshot) -> None:
+    """
+    Install a snapshot built elsewhere (warm start) if none is loaded yet
+
+    Its version is still checked against the 'rules' counter on the next
+    get_rule_snapshot() call, so a stale seed is simply rebuilt.
+    """
+    global _snapshot
+
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = snapshot
@@ -0,0 +1,173 @@
+"""
+Rule delta sync
+Versioned change feed of Rule and BlockedNumber rows for order terminals.
+The version is the 'rules' change counter; rule_changes records which rows
+changed at each version (app.utils.change_tracking). A terminal sends the
+version it holds and gets back only the rows changed since, or a full
+snapshot when its version is no longer covered by the change log.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, tuple_
+
+from app import db
+from app.models import Rule, BlockedNumber, RuleChange
+from app.utils.change_tracking import RULES_COUNTER, get_counter
+
+# More changed rows than this are sent as a full snapshot
+MAX_DELTA_ROWS = 2000
+
+RuleKey = Tuple[str, str, Optional[str]]      # (rule_type, field, number_norm)
+BlockedKey = Tuple[str, str]                  # (field, number_norm)
+
+
+def _rule_row(rule_type: str, field: str, number_norm: Optional[str], value) -> Dict:
+    return {'rule_type': rule_type, 'field': field, 'number_norm': number_norm, 'value': float(value)}
+
+
+def _blocked_row(field: str, number_norm: str) -> Dict:
+    return {'field': field, 'number_norm': number_norm}
+
+
+class RuleSyncService:
+    """Service class for rule delta sync"""
+
+    @staticmethod
+    def current_version() -> int:
+        """Version a terminal is compared against (one counter lookup)"""
+        return get_counter(RULES_COUNTER)
+
+    @staticmethod
+    def changes_since(since: Optional[int] = None) -> Dict:
+        """
+        Rule and blocked-number changes after a version
+
+        Args:
+            since: Version from the terminal's last sync (None: full snapshot)
+
+        Returns:
+            Dict with 'version', 'full', 'rules' and 'blocked_numbers' (active
+            rows to add or replace) and 'deleted_rules' / 'deleted_blocked_numbers'
+            (keys to drop; empty for a full snapshot, which replaces everything)
+        """
+        # Counter, change log and rows from one transaction
+        version = get_counter(RULES_COUNTER)
+        if since is not None and since == version:
+            return RuleSyncService._result(version, False)
+
+        keys = None
+        if since is not None and since < version:
+            keys = RuleSyncService._changed_keys(since, version)
+        if keys is None:
+            return RuleSyncService._full_snapshot(version)
+
+        rule_keys, blocked_keys = keys
+        rules = RuleSyncService._active_rules(rule_keys)
+        blocked = RuleSyncService._active_blocked(blocked_keys)
+
+        return RuleSyncService._result(
+            version, False,
+            rules=[_rule_row(*key, value) for key, value in sorted(rules.items(), key=str)],
+            blocked_numbers=[_blocked_row(*key) for key in sorted(blocked)],
+            deleted_rules=[
+                {'rule_type': rule_type, 'field': field, 'number_norm': number_norm}
+                for rule_type, field, number_norm in sorted(rule_keys - rules.keys(), key=str)
+            ],
+            deleted_blocked_numbers=[_blocked_row(*key) for key in sorted(blocked_keys - blocked)]
+        )
+
+    @staticmethod
+    def _result(version: int, full: bool, rules: List[Dict] = None, blocked_numbers: List[Dict] = None,
+                deleted_rules: List[Dict] = None, deleted_blocked_numbers: List[Dict] = None) -> Dict:
+        return {
+            'version': version,
+            'full': full,
+            'rules': rules or [],
+            'blocked_numbers': blocked_numbers or [],
+            'deleted_rules': deleted_rules or [],
+            'deleted_blocked_numbers': deleted_blocked_numbers or []
+        }
+
+    @staticmethod
+    def _changed_keys(since: int, version: int):
+        """
+        Row keys changed in (since, version]
+
+        Returns:
+            (rule keys, blocked keys), or None when the change log cannot
+            answer (pruned, bulk change, or too many rows)
+        """
+        oldest = db.session.query(func.min(RuleChange.version)).scalar()
+        # Versions before the oldest logged one are not covered
+        # (log pruned, or changes made before the log existed)
+        if oldest is None or since < oldest - 1:
+            return None
+
+        rows = db.session.query(
+            RuleChange.entity, RuleChange.rule_type, RuleChange.field, RuleChange.number_norm
+        ).filter(
+            RuleChange.version > since,
+            RuleChange.version <= version
+        ).distinct().limit(MAX_DELTA_ROWS + 1).all()
+        if len(rows) > MAX_DELTA_ROWS:
+            return None
+
+        rule_keys = set()
+        blocked_keys = set()
+        for entity, rule_type, field, number_norm in rows:
+            if entity == 'rule':
+                rule_keys.add((rule_type, field, number_norm))
+            elif entity == 'blocked_number':
+                blocked_keys.add((field, number_norm))
+            else:
+                # Bulk statement: changed rows unknown
+                return None
+        return rule_keys, blocked_keys
+
+    @staticmethod
+    def _active_rules(keys) -> Dict[RuleKey, object]:
+        """Current value of the active rules among keys"""
+        found = {}
+        columns = (Rule.rule_type, Rule.field, Rule.number_norm, Rule.value)
+        with_number = [key for key in keys if key[2] is not None]
+        without_number = [key[:2] for key in keys if key[2] is None]
+        if with_number:
+            for rule_type, field, number_norm, value in db.session.query(*columns).filter(
+                Rule.is_active == True,
+                tuple_(Rule.rule_type, Rule.field, Rule.number_norm).in_(with_number)
+            ):
+                found[(rule_type, field, number_norm)] = value
+        if without_number:
+            for rule_type, field, number_norm, value in db.session.query(*columns).filter(
+                Rule.is_active == True,
+                Rule.number_norm.is_(None),
+                tuple_(Rule.rule_type, Rule.field).in_(without_number)
+            ):
+                found[(rule_type, field, number_norm)] = value
+        return found
+
+    @staticmethod
+    def _active_blocked(keys) -> set:
+        """Keys among keys that are active blocked numbers"""
+        if not keys:
+            return set()
+        return set(db.session.query(BlockedNumber.field, BlockedNumber.number_norm).filter(
+            BlockedNumber.is_active == True,
+            tuple_(BlockedNumber.field, BlockedNumber.number_norm).in_(list(keys))
+        ).all())
+
+    @staticmethod
+    def _full_snapshot(version: int) -> Dict:
+        rules = db.session.query(Rule.rule_type, Rule.field, Rule.number_norm, Rule.value).filter(
+            Rule.is_active == True
+        ).order_by(Rule.rule_type, Rule.field, Rule.number_norm).all()
+        blocked = db.session.query(BlockedNumber.field, BlockedNumber.number_norm).filter(
+            BlockedNumber.is_active == True
+        ).order_by(BlockedNumber.field, BlockedNumber.number_norm).all()
+
+        return RuleSyncService._result(
+            version, True,
+            rules=[_rule_row(*row) for row in rules],
+            blocked_numbers=[_blocked_row(*row) for row in blocked]
+        )
@@ -5,6 +5,7 @@ Simple Sales Report Service - รายงานยอดขายและย
 
 from sqlalchemy import func, and_, desc, case
 from app import db
+from app.utils.read_routing import read_session
 from app.models import Order, OrderItem, Rule
 from typing import Dict, List, Optional
 from decimal import Decimal
@@ -26,7 +27,7 @@ class SalesReportService:
         """
         try:
             # ดึงข้อมูลยอดรวมทั้งหมด
-            grand_total = db.session.query(
+            grand_total = read_session().query(
                 func.sum(OrderItem.amount).label('total')
             ).join(Order).filter(Order.batch_id == batch_id).scalar() or 0
             
@@ -70,7 +71,7 @@ class SalesReportService:
         """ดึงข้อมูลเลขสำหรับประเภทเฉพาะ เรียงตามยอดขายสูงสุด"""
         
         # ดึงข้อมูลยอดรวมของแต่ละเลข
-        numbers_query = db.session.query(
+        numbers_query = read_session().query(
             OrderItem.number_norm,
             func.sum(OrderItem.amount).label('total_amount'),
             func.count(OrderItem.id).label('order_count'),
@@ -124,7 +125,7 @@ class SalesReportService:
         }
         
         try:
-            rate = db.session.query(Rule.value).filter(
+            rate = read_session().query(Rule.value).filter(
                 and_(Rule.rule_type == 'payout', Rule.field == field, Rule.is_active == True)
             ).scalar()
             return float(rate) if rate else default_rates.get(field, 90)
@@ -144,38 +145,53 @@ class SalesReportService:
             Dict: รายการเลขที่มียอดขายสูงสุด
         """
         try:
-            # ดึงข้อมูลทุกเลขทุกประเภท เรียงตามยอดขาย
-            top_numbers = db.session.query(
-                OrderItem.field,
-                OrderItem.number_norm,
-                func.sum(OrderItem.amount).label('total_amount'),
-                func.count(OrderItem.id).label('order_count'),
-                func.avg(OrderItem.validation_factor).label('avg_factor')
-            ).join(Order).filter(
-                Order.batch_id == batch_id
-            ).group_by(
-                OrderItem.field, OrderItem.number_norm
-            ).order_by(
-                desc(func.sum(OrderItem.amount))
-            ).limit(limit).all()
+            from app.services.top_numbers import top_numbers as hot_numbers, item_stats
+            
+            # ranking ที่อัปเดตตาม exposure feed (O(K)); limit เกิน TOP_NUMBERS_K ใช้ query เดิม
+            ranked = hot_numbers.top_all(batch_id, limit)
+            if ranked is not None:
+                stats = item_stats(read_session(), batch_id, ((field, number) for field, number, _, _ in ranked))
+                top_numbers = [
+                    (field, number, amount, order_count, stats.get((field, number), (1.0, 0))[0])
+                    for field, number, amount, order_count in ranked
+                ]
+            else:
+                # ดึงข้อมูลทุกเลขทุกประเภท เรียงตามยอดขาย
+                top_numbers = read_session().query(
+                    OrderItem.field,
+                    OrderItem.number_norm,
+                    func.sum(OrderItem.amount).label('total_amount'),
+                    func.count(OrderItem.id).label('order_count'),
+                    func.avg(OrderItem.validation_factor).label('avg_factor')
+                ).join(Order).filter(
+                    Order.batch_id == batch_id,
+                    Order.status != 'cancelled'  # เหมือน ranking (number_totals)
+                ).group_by(
+                    OrderItem.field, OrderItem.number_norm
+                ).order_by(
+                    desc(func.sum(OrderItem.amount))
+                ).limit(limit).all()
             
             if not top_numbers:
                 return {"success": False, "error": "ไม่พบข้อมูล"}
             
             # คำนวณยอดที่คาดว่าจะจ่าย
             results = []
-            for row in top_numbers:
-                payout_rate = SalesReportService._get_payout_rate(row.field)
-                total_amount = float(row.total_amount)
-                avg_factor = float(row.avg_factor)
+            payout_rates = {}  # อ่านอัตราจ่ายครั้งเดียวต่อประเภท
+            for field, number_norm, row_amount, order_count, row_factor in top_numbers:
+                if field not in payout_rates:
+                    payout_rates[field] = SalesReportService._get_payout_rate(field)
+                payout_rate = payout_rates[field]
+                total_amount = float(row_amount)
+                avg_factor = float(row_factor)
                 potential_payout = total_amount * payout_rate * avg_factor
                 
                 results.append({
-                    'field': row.field,
-                    'field_label': SalesReportService._get_field_label(row.field),
-                    'number': row.number_norm,
+                    'field': field,
+                    'field_label': SalesReportService._get_field_label(field),
+                    'number': number_norm,
                     'total_amount': total_amount,
-                    'order_count': row.order_count,
+                    'order_count': order_count,
                     'avg_factor': round(avg_factor, 3),
                     'payout_rate': payout_rate,
                     'potential_payout': round(potential_payout, 2)
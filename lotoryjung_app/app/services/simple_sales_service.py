@@ -4,6 +4,8 @@ Simple Sales Report Service - รายงานยอดขายแบบง
 
 from sqlalchemy import func, desc, and_
 from app import db
+from app.utils.read_routing import read_session
+from app.utils.number_utils import generate_tote_number
 from app.models import Order, OrderItem, Rule
 from typing import Dict, List
 from decimal import Decimal
@@ -19,7 +21,7 @@ class SimpleSalesService:
         """
         try:
             # ดึงข้อมูลยอดขายรวมของแต่ละเลข
-            sales_data = db.session.query(
+            sales_data = read_session().query(
                 OrderItem.field,
                 OrderItem.number_norm,
                 func.sum(OrderItem.amount).label('total_sales'),
@@ -39,7 +41,6 @@ class SimpleSalesService:
             for item in sales_data:
                 if item.field == 'tote':
                     # สำหรับโต๊ด: ใช้ normalized key
-                    from app.utils.number_utils import generate_tote_number
                     normalized_key = generate_tote_number(item.number_norm)
                     
                     if normalized_key not in tote_groups:
@@ -167,7 +168,7 @@ class SimpleSalesService:
             
             for field in fields:
                 # ดึงข้อมูล top sales ของแต่ละประเภท
-                field_data = db.session.query(
+                field_data = read_session().query(
                     OrderItem.number_norm,
                     func.sum(OrderItem.amount).label('total_sales'),
                     func.count(OrderItem.id).label('order_count'),
@@ -211,7 +212,7 @@ class SimpleSalesService:
         """ดึงอัตราการจ่ายของแต่ละประเภทจากฐานข้อมูล"""
         try:
             # ดึงจาก database ก่อน
-            rate = db.session.query(Rule.value).filter(
+            rate = read_session().query(Rule.value).filter(
                 and_(Rule.rule_type == 'payout', Rule.field == field, Rule.is_active == True)
             ).scalar()
             
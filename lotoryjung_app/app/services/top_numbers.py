@@ -0,0 +1,146 @@
+"""
+Hot numbers (incremental top-K)
+Per-process ranking of the number totals of each batch and field, kept
+current from the exposure change feed (app.services.exposure_feed): a read
+applies only the totals changed since the sequence the ranking is at, so
+no GROUP BY / ORDER BY over the batch is run and serving the top K numbers
+is O(K) however many numbers have been sold.
+
+Rankings follow number_totals, so cancelled orders are not counted.
+
+Settings:
+    TOP_NUMBERS_K - longest list served from the ranking (default 50);
+                    longer requests fall back to the report query
+"""
+
+import bisect
+import heapq
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, tuple_
+
+# Batches ranked per process (least recently read are dropped)
+MAX_BATCHES = 8
+
+# (field, number_norm, total amount, order count)
+Ranked = Tuple[str, str, float, int]
+
+
+class _BatchRanking:
+    """Totals of one batch with a sorted (-amount, number) list per field"""
+
+    def __init__(self):
+        self.seq = None
+        self.totals: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self.ranked: Dict[str, List[Tuple[float, str]]] = {}
+
+    def apply(self, payload: Dict) -> None:
+        """Apply an ExposureFeedService.changes_since() result"""
+        if payload['full']:
+            self.totals = {}
+            self.ranked = {}
+        for field, columns in payload['totals'].items():
+            ranked = self.ranked.setdefault(field, [])
+            for number, amount, count in zip(columns['numbers'], columns['amounts'], columns['counts']):
+                previous = self.totals.pop((field, number), None)
+                if previous is not None:
+                    del ranked[bisect.bisect_left(ranked, (-previous[0], number))]
+                if amount > 0:
+                    self.totals[(field, number)] = (amount, count)
+                    bisect.insort(ranked, (-amount, number))
+        self.seq = payload['seq']
+
+    def top(self, field: str, k: Optional[int]) -> List[Ranked]:
+        ranked = self.ranked.get(field, ())
+        entries = ranked[:k] if k is not None else ranked
+        return [(field, number, -amount, self.totals[(field, number)][1]) for amount, number in entries]
+
+
+class TopNumbers:
+    """Per-process hot-number rankings"""
+
+    def __init__(self):
+        self.k = 50
+        self._reset()
+
+        if hasattr(os, 'register_at_fork'):
+            # The lock may be held by another thread at fork
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._batches: 'OrderedDict[str, _BatchRanking]' = OrderedDict()
+
+    def init_app(self, app):
+        self.k = int(app.config.get('TOP_NUMBERS_K') or 50)
+
+    def _read(self, batch_id: str, read):
+        """
+        Bring the batch ranking up to date and call read(ranking) under the lock
+
+        The feed is queried outside the lock. Its totals are absolute values,
+        so a result is applied unless another thread already applied a newer
+        one while the query ran.
+        """
+        from app.services.exposure_feed import ExposureFeedService
+
+        with self._lock:
+            ranking = self._batches.pop(batch_id, None) or _BatchRanking()
+            self._batches[batch_id] = ranking
+            while len(self._batches) > MAX_BATCHES:
+                self._batches.popitem(last=False)
+            seq = ranking.seq
+        payload = ExposureFeedService.changes_since(batch_id, seq)
+        with self._lock:
+            if ranking.seq is None or payload['seq'] >= ranking.seq:
+                ranking.apply(payload)
+            return read(ranking)
+
+    def top(self, batch_id: str, field: str, k: int) -> Optional[List[Ranked]]:
+        """Top k numbers of a field by total amount (None when k exceeds TOP_NUMBERS_K)"""
+        if k > self.k:
+            return None
+        return self._read(batch_id, lambda ranking: ranking.top(field, k))
+
+    def top_all(self, batch_id: str, k: int) -> Optional[List[Ranked]]:
+        """Top k numbers over all fields (None when k exceeds TOP_NUMBERS_K)"""
+        if k > self.k:
+            return None
+        return self._read(batch_id, lambda ranking: heapq.nsmallest(
+            k,
+            (entry for field in sorted(ranking.ranked) for entry in ranking.top(field, k)),
+            key=lambda entry: (-entry[2], entry[0], entry[1])
+        ))
+
+    def ranked(self, batch_id: str, field: str) -> List[Ranked]:
+        """Every total of a field, highest first"""
+        return self._read(batch_id, lambda ranking: ranking.top(field, None))
+
+
+def item_stats(session, batch_id: str, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[float, int]]:
+    """
+    Average validation factor and buyer count of a few numbers (one grouped query)
+
+    Returns:
+        (field, number_norm) -> (avg factor, distinct buyers)
+    """
+    from app.models import Order, OrderItem
+
+    keys = list(keys)
+    if not keys:
+        return {}
+    rows = session.query(
+        OrderItem.field, OrderItem.number_norm,
+        func.avg(OrderItem.validation_factor), func.count(func.distinct(Order.user_id))
+    ).join(Order).filter(
+        Order.batch_id == batch_id,
+        Order.status != 'cancelled',
+        tuple_(OrderItem.field, OrderItem.number_norm).in_(keys)
+    ).group_by(OrderItem.field, OrderItem.number_norm)
+    return {(field, number): (float(avg or 1.0), buyers) for field, number, avg, buyers in rows}
+
+
+top_numbers = TopNumbers()
@@ -0,0 +1,250 @@
+"""
+User statistics service
+Maintains per-user running order statistics (count/amount by batch and status)
+so dashboards never have to aggregate over the orders table.
+"""
+
+from typing import Dict, List, Optional
+from decimal import Decimal
+from datetime import datetime
+import pytz
+
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Order, UserStat
+
+BANGKOK_TZ = pytz.timezone('Asia/Bangkok')
+
+class UserStatsService:
+    """Service class for per-user running statistics"""
+
+    @staticmethod
+    def _increment(user_id: int, batch_id: str, status: str, count: int, amount: Decimal):
+        """Add count/amount to one (user, batch, status) row, creating it if missing"""
+        stmt = (
+            update(UserStat)
+            .where(
+                UserStat.user_id == user_id,
+                UserStat.batch_id == batch_id,
+                UserStat.status == status
+            )
+            .values(
+                order_count=UserStat.order_count + count,
+                total_amount=UserStat.total_amount + amount,
+                last_updated=datetime.now(BANGKOK_TZ)
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        if db.session.execute(stmt).rowcount:
+            return
+
+        try:
+            with db.session.begin_nested():
+                db.session.add(UserStat(
+                    user_id=user_id,
+                    batch_id=batch_id,
+                    status=status,
+                    order_count=count,
+                    total_amount=amount
+                ))
+        except IntegrityError:
+            # Another writer created the row first
+            db.session.execute(stmt)
+
+    @staticmethod
+    def record_order(user_id: int, batch_id: str, status: str, amount, count: int = 1):
+        """
+        Add a new order to the user's running statistics
+
+        Call inside the transaction that creates the order.
+
+        Args:
+            user_id: Order owner
+            batch_id: Order batch
+            status: Order status at creation
+            amount: Order total amount
+            count: Number of orders (negative to remove)
+        """
+        amount = Decimal(str(amount))
+        UserStatsService._increment(user_id, UserStat.ALL_BATCHES, status, count, amount)
+        UserStatsService._increment(user_id, batch_id, status, count, amount)
+
+    @staticmethod
+    def move_order(user_id: int, batch_id: str, old_status: str, new_status: str, amount, count: int = 1):
+        """
+        Move order(s) from one status to another in the running statistics
+
+        Args:
+            user_id: Order owner
+            batch_id: Order batch
+            old_status: Previous status
+            new_status: New status
+            amount: Total amount of the moved orders
+            count: Number of orders moved
+        """
+        if old_status == new_status:
+            return
+        amount = Decimal(str(amount))
+        UserStatsService.record_order(user_id, batch_id, old_status, -amount, -count)
+        UserStatsService.record_order(user_id, batch_id, new_status, amount, count)
+
+    @staticmethod
+    def _stat_subquery(user_id: int, column, batch_id: str, statuses: Optional[List[str]] = None):
+        """Scalar subquery summing one user_stats column"""
+        query = select(func.coalesce(func.sum(column), 0)).where(
+            UserStat.user_id == user_id,
+            UserStat.batch_id == batch_id
+        )
+        if statuses:
+            query = query.where(UserStat.status.in_(statuses))
+        return query.scalar_subquery()
+
+    @staticmethod
+    def get_dashboard_data(user_id: int, current_batch_id: str, recent_limit: int = 10) -> Dict:
+        """
+        Get recent orders and running statistics in a single query
+
+        The statistics are attached to each recent-order row as scalar
+        subqueries on user_stats (a handful of rows per user), so the cost does
+        not grow with the number of orders the user has placed.
+
+        Args:
+            user_id: User ID
+            current_batch_id: Batch used for "today" figures
+            recent_limit: Number of recent orders
+
+        Returns:
+            Dict with 'recent_orders' and 'stats'
+        """
+        sq = UserStatsService._stat_subquery
+        all_batches = UserStat.ALL_BATCHES
+
+        rows = db.session.query(
+            Order,
+            sq(user_id, UserStat.order_count, all_batches).label('total_orders'),
+            sq(user_id, UserStat.total_amount, all_batches).label('total_amount'),
+            sq(user_id, UserStat.order_count, all_batches, ['pending']).label('pending_orders'),
+            sq(user_id, UserStat.order_count, all_batches, ['confirmed']).label('completed_orders'),
+            sq(user_id, UserStat.order_count, current_batch_id, ['pending', 'confirmed']).label('today_orders')
+        ).filter(
+            Order.user_id == user_id
+        ).order_by(
+            Order.created_at.desc(), Order.id.desc()
+        ).limit(recent_limit).all()
+
+        stats = {
+            'total_orders': 0,
+            'total_amount': 0,
+            'pending_orders': 0,
+            'completed_orders': 0,
+            'today_orders': 0
+        }
+
+        # No orders means all statistics are zero
+        if rows:
+            first = rows[0]
+            stats = {
+                'total_orders': int(first.total_orders),
+                'total_amount': float(first.total_amount),
+                'pending_orders': int(first.pending_orders),
+                'completed_orders': int(first.completed_orders),
+                'today_orders': int(first.today_orders)
+            }
+
+        return {
+            'recent_orders': [row[0] for row in rows],
+            'stats': stats
+        }
+
+    @staticmethod
+    def get_user_stats(user_id: int, batch_ids: List[str] = None) -> Dict:
+        """
+        Get running statistics for a user
+
+        Args:
+            user_id: User ID
+            batch_ids: Batches to include per-batch figures for
+
+        Returns:
+            Dict with totals, per-status and per-batch figures
+        """
+        batch_ids = list(batch_ids or [])
+        rows = UserStat.query.filter(
+            UserStat.user_id == user_id,
+            UserStat.batch_id.in_([UserStat.ALL_BATCHES] + batch_ids)
+        ).all()
+
+        result = {
+            'total_orders': 0,
+            'total_amount': 0.0,
+            'by_status': {},
+            'by_batch': {batch_id: {'orders': 0, 'amount': 0.0} for batch_id in batch_ids}
+        }
+
+        for row in rows:
+            if row.batch_id == UserStat.ALL_BATCHES:
+                result['total_orders'] += row.order_count
+                result['total_amount'] += float(row.total_amount)
+                result['by_status'][row.status] = {
+                    'orders': row.order_count,
+                    'amount': float(row.total_amount)
+                }
+            elif row.status != 'cancelled':
+                batch = result['by_batch'][row.batch_id]
+                batch['orders'] += row.order_count
+                batch['amount'] += float(row.total_amount)
+
+        return result
+
+    @staticmethod
+    def rebuild(user_id: int = None) -> int:
+        """
+        Recompute statistics from the orders table
+
+        Args:
+            user_id: Rebuild one user only (default: all users)
+
+        Returns:
+            Number of user_stats rows written
+        """
+        delete_query = UserStat.query
+        order_query = db.session.query(
+            Order.user_id,
+            Order.batch_id,
+            Order.status,
+            func.count(Order.id),
+            func.coalesce(func.sum(Order.total_amount), 0)
+        )
+        if user_id is not None:
+            delete_query = delete_query.filter(UserStat.user_id == user_id)
+            order_query = order_query.filter(Order.user_id == user_id)
+
+        delete_query.delete(synchronize_session=False)
+
+        totals = {}
+        for uid, batch_id, status, count, amount in order_query.group_by(
+            Order.user_id, Order.batch_id, Order.status
+        ):
+            for key in ((uid, UserStat.ALL_BATCHES, status), (uid, batch_id, status)):
+                entry = totals.setdefault(key, [0, Decimal('0')])
+                entry[0] += count
+                entry[1] += Decimal(str(amount))
+
+        now = datetime.now(BANGKOK_TZ)
+        db.session.bulk_insert_mappings(UserStat, [
+            {
+                'user_id': uid,
+                'batch_id': batch_id,
+                'status': status,
+                'order_count': count,
+                'total_amount': amount,
+                'last_updated': now
+            }
+            for (uid, batch_id, status), (count, amount) in totals.items()
+        ])
+        db.session.commit()
+
+        return len(totals)
@@ -0,0 +1,279 @@
+"""
+Warm-start snapshot
+Compact binary copy of the compiled rule snapshot and the exposure totals
+(number_totals) of open batches, so a restarted worker or limit authority
+starts warm instead of sending every cold query at once.
+
+File layout (little-endian), written atomically (temp file + rename):
+    header   magic 'LJWS', format version, created_at, rules version,
+             exposure version, order high-water mark, meta length, CRC-32
+             of everything after the header
+    limits   int64 cents per number, one dense array per field (8-aligned)
+    exposure 16-byte records (field code, number, order count, cents)
+    meta     JSON at the end of the file: payout rates, default limits,
+             blocked numbers, extra limits, array offsets and per-batch
+             exposure record ranges
+
+The arrays are read straight from a memory map; nothing is copied until a
+consumer asks for a field or a batch.
+
+Catching up after load:
+    rules     the snapshot carries the 'rules' change counter it was built
+              from; get_rule_snapshot() rebuilds only if the counter moved
+    exposure  valid while the 'exposure' change counter (bumped by cancels,
+              reconciles and archiving) is unchanged; totals are then the
+              snapshot plus the items of orders above the high-water mark.
+              SQLite only - PostgreSQL ids are not assigned in commit order,
+              so batches are loaded from number_totals there.
+
+Settings:
+    WARM_SNAPSHOT_PATH      - snapshot file; unset disables warm start
+    WARM_SNAPSHOT_INTERVAL  - seconds between snapshots written by the limit
+                              authority (default 60; it also writes one at
+                              shutdown). `flask warm_snapshot` writes one on demand.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Optional, Tuple
+
+from app.services.rule_snapshot import FIELDS, FIELD_DIGITS, RuleSnapshot
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LJWS'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<4sHHdqqqII')
+# field code, pad, number, order count, amount in cents
+RECORD = struct.Struct('<BxHiq')
+FIELD_CODES = {field: code for code, field in enumerate(FIELDS)}
+
+ExposureTotals = Dict[Tuple[str, str], Tuple[Decimal, int]]
+
+
+class WarmSnapshotError(Exception):
+    """Raised for a snapshot file that is missing, corrupt or of another format"""
+    pass
+
+
+def _cents(value: Decimal) -> int:
+    return int(Decimal(value).scaleb(2))
+
+
+def _decimal(cents: int, cache: Dict[int, Decimal] = None) -> Decimal:
+    if cache is None:
+        return Decimal(cents).scaleb(-2)
+    value = cache.get(cents)
+    if value is None:
+        value = cache[cents] = Decimal(cents).scaleb(-2)
+    return value
+
+
+class WarmSnapshot:
+    """Read-only view of a snapshot file"""
+
+    def __init__(self, path: str, buffer, created_at: float, rules_version: int,
+                 exposure_version: int, order_hwm: int, meta: Dict):
+        self.path = path
+        self._buffer = buffer
+        self.created_at = created_at
+        self.rules_version = rules_version
+        self.exposure_version = exposure_version
+        self.order_hwm = order_hwm
+        self._meta = meta
+
+    @classmethod
+    def load(cls, path: str) -> 'WarmSnapshot':
+        """
+        Map a snapshot file and verify it
+
+        Raises:
+            WarmSnapshotError
+        """
+        try:
+            with open(path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise WarmSnapshotError(f"Cannot open warm snapshot {path}: {e}")
+
+        if len(buffer) < HEADER.size:
+            raise WarmSnapshotError(f"Warm snapshot {path} is truncated")
+        magic, version, _, created_at, rules_version, exposure_version, order_hwm, meta_length, crc = \
+            HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise WarmSnapshotError(f"Warm snapshot {path} has an unsupported format")
+        if zlib.crc32(memoryview(buffer)[HEADER.size:]) != crc:
+            raise WarmSnapshotError(f"Warm snapshot {path} failed its checksum")
+
+        meta = json.loads(bytes(buffer[len(buffer) - meta_length:]))
+        return cls(path, buffer, created_at, rules_version, exposure_version, order_hwm, meta)
+
+    @property
+    def batch_ids(self):
+        return sorted(self._meta['batches'])
+
+    def rule_snapshot(self) -> RuleSnapshot:
+        """Rebuild the compiled rules (no database access)"""
+        meta = self._meta
+        decimals: Dict[int, Decimal] = {}
+        limits = {}
+        for field in FIELDS:
+            offset, count = meta['limits'][field]
+            cents = struct.unpack_from(f'<{count}q', self._buffer, offset)
+            limits[field] = tuple(_decimal(value, decimals) for value in cents)
+
+        return RuleSnapshot(
+            version=self.rules_version,
+            payout_rates=dict(meta['payout_rates']),
+            default_limits={field: _decimal(cents) for field, cents in meta['default_limits'].items()},
+            blocked={field: frozenset(numbers) for field, numbers in meta['blocked'].items()},
+            limits=limits,
+            extra_limits={(field, number): _decimal(cents) for field, number, cents in meta['extra_limits']}
+        )
+
+    def exposure(self, batch_id: str) -> Optional[ExposureTotals]:
+        """(field, number_norm) -> (total amount, order count) for a batch, None if not in the snapshot"""
+        entry = self._meta['batches'].get(batch_id)
+        if entry is None:
+            return None
+        offset, count = entry
+        totals = {}
+        for code, number, order_count, cents in RECORD.iter_unpack(
+                self._buffer[offset:offset + count * RECORD.size]):
+            field = FIELDS[code]
+            totals[(field, str(number).zfill(FIELD_DIGITS[field]))] = (_decimal(cents), order_count)
+        return totals
+
+    def close(self):
+        self._buffer.close()
+
+    @staticmethod
+    def write(path: str, rules: RuleSnapshot, exposure: Dict[str, ExposureTotals],
+              exposure_version: int, order_hwm: int) -> int:
+        """
+        Write a snapshot atomically
+
+        Batches with a number that does not fit the record layout are left
+        out (they are loaded from the database instead).
+
+        Returns:
+            File size in bytes
+        """
+        meta = {
+            'payout_rates': rules.payout_rates,
+            'default_limits': {field: _cents(value) for field, value in rules.default_limits.items()},
+            'blocked': rules.blocked_lists(),
+            'extra_limits': [[field, number, _cents(value)] for (field, number), value in rules.extra_limits.items()],
+            'limits': {},
+            'batches': {}
+        }
+
+        arrays = []
+        for field in FIELDS:
+            arrays.append(('limits', field, struct.pack(f'<{len(rules.limits[field])}q',
+                                                        *(_cents(value) for value in rules.limits[field]))))
+        for batch_id, totals in sorted(exposure.items()):
+            records = []
+            for (field, number), (amount, order_count) in sorted(totals.items()):
+                if field not in FIELD_CODES or len(number) != FIELD_DIGITS[field] or not number.isdigit():
+                    break
+                records.append(RECORD.pack(FIELD_CODES[field], int(number), order_count, _cents(amount)))
+            else:
+                arrays.append(('batches', batch_id, b''.join(records)))
+
+        body = bytearray()
+        for section, key, data in arrays:
+            meta[section][key] = [HEADER.size + len(body), len(data) // (8 if section == 'limits' else RECORD.size)]
+            body += data
+            body += b'\0' * (-len(data) % 8)
+        meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+        body += meta_bytes
+
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, datetime.now().timestamp(), rules.version,
+                             exposure_version, order_hwm, len(meta_bytes), zlib.crc32(body))
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return len(header) + len(body)
+
+
+def write_warm_snapshot(path: str) -> Dict:
+    """
+    Write a snapshot of the current rules and open-batch exposure
+
+    The counters, high-water mark and totals are read in one transaction so
+    they describe the same point in time.
+
+    Returns:
+        Dict with 'path', 'bytes', 'rules_version', 'exposure_version', 'batches'
+    """
+    from flask import current_app
+    from sqlalchemy import func
+
+    from app import db
+    from app.models import NumberTotal, Order
+    from app.services.limit_service import LimitService
+    from app.services.rule_snapshot import get_rule_snapshot
+    from app.utils.change_tracking import EXPOSURE_COUNTER, get_counter
+
+    try:
+        rules = get_rule_snapshot()
+        if current_app.config.get('DB_PROFILE') == 'postgresql':
+            db.session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        exposure_version = get_counter(EXPOSURE_COUNTER)
+        order_hwm = db.session.query(func.max(Order.id)).scalar() or 0
+        exposure: Dict[str, ExposureTotals] = {}
+        rows = db.session.query(
+            NumberTotal.batch_id, NumberTotal.field, NumberTotal.number_norm,
+            NumberTotal.total_amount, NumberTotal.order_count
+        ).filter(NumberTotal.batch_id >= LimitService._get_current_batch_id())
+        for batch_id, field, number_norm, amount, order_count in rows:
+            exposure.setdefault(batch_id, {})[(field, number_norm)] = (amount, order_count)
+    finally:
+        db.session.remove()
+
+    size = WarmSnapshot.write(path, rules, exposure, exposure_version, order_hwm)
+    return {
+        'path': path,
+        'bytes': size,
+        'rules_version': rules.version,
+        'exposure_version': exposure_version,
+        'batches': sorted(exposure)
+    }
+
+
+def load_warm_snapshot(app) -> Optional[WarmSnapshot]:
+    """Map the configured snapshot (None when disabled, missing or invalid)"""
+    path = app.config.get('WARM_SNAPSHOT_PATH')
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return WarmSnapshot.load(path)
+    except WarmSnapshotError as e:
+        logger.warning("Ignoring warm snapshot: %s", e)
+        return None
+
+
+def warm_start(app) -> Optional[WarmSnapshot]:
+    """Seed the process rule snapshot from the snapshot file (startup; no queries)"""
+    from app.services.rule_snapshot import seed_rule_snapshot
+
+    snapshot = load_warm_snapshot(app)
+    if snapshot is not None:
+        seed_rule_snapshot(snapshot.rule_snapshot())
+    return snapshot
@@ -0,0 +1,254 @@
+"""
+Change tracking
+Keeps a database-wide counter per data set that is bumped in the same
+transaction as any change to the tracked models. Caches compare the counter
+with the value they were built from instead of reloading on every request.
+
+Rule/BlockedNumber changes also record which rows changed at each 'rules'
+version (rule_changes), so clients can fetch only what changed since the
+version they hold (see app.services.rule_sync).
+
+NumberTotal rows carry the 'exposure_seq' value of the transaction that
+last changed them, so clients can fetch the totals changed since the
+sequence they hold (see app.services.exposure_feed). Removed totals cannot
+be listed that way; they mark the batch's 'exposure_reset:<batch_id>'
+counter and clients behind it reload the batch.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pytz
+from sqlalchemy import delete, event, insert, inspect, select, update
+from sqlalchemy.orm import Session, scoped_session
+
+BANGKOK_TZ = pytz.timezone('Asia/Bangkok')
+
+# Counter bumped by any Rule / BlockedNumber change
+RULES_COUNTER = 'rules'
+
+# rule_changes rows older than this many versions are pruned; clients that
+# far behind get a full snapshot
+RULE_CHANGES_RETENTION = 5000
+
+# Counter bumped (explicitly) by number_totals changes other than new orders:
+# cancellations, reconcile fixes and archived batches
+EXPOSURE_COUNTER = 'exposure'
+
+# Counter giving every transaction that changes number_totals its sequence
+# (one bump per transaction; the counter row lock orders them by commit)
+EXPOSURE_SEQ_COUNTER = 'exposure_seq'
+
+# Prefix of the per-batch counters holding the sequence of the last removal
+EXPOSURE_RESET_PREFIX = 'exposure_reset:'
+
+# Execution option for bulk statements whose caller records the change
+# itself (one bump_counter + record_rule_changes for several statements)
+UNTRACKED_OPTION = 'change_tracking_untracked'
+
+# Counter bumped when a user's cached identity/role changes or a user is
+# deleted (see app.utils.user_cache)
+USERS_COUNTER = 'users'
+
+
+def _tracked_models() -> Dict[type, str]:
+    """Model class -> counter name"""
+    from app.models import Rule, BlockedNumber
+    return {
+        Rule: RULES_COUNTER,
+        BlockedNumber: RULES_COUNTER,
+    }
+
+
+def bump_counter(connection, name: str) -> int:
+    """
+    Increment a counter on the given connection (inside the caller's transaction)
+
+    Uses the connection directly so no ORM session events are triggered.
+
+    Returns:
+        The new counter value
+    """
+    from app.models import ChangeCounter
+
+    table = ChangeCounter.__table__
+    now = datetime.now(BANGKOK_TZ)
+    result = connection.execute(
+        update(table)
+        .where(table.c.name == name)
+        .values(value=table.c.value + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(name=name, value=1, updated_at=now))
+        return 1
+    return connection.execute(select(table.c.value).where(table.c.name == name)).scalar()
+
+
+def set_counter(connection, name: str, value: int) -> None:
+    """Set a counter to a value (inside the caller's transaction)"""
+    from app.models import ChangeCounter
+
+    table = ChangeCounter.__table__
+    now = datetime.now(BANGKOK_TZ)
+    result = connection.execute(
+        update(table).where(table.c.name == name).values(value=value, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(name=name, value=value, updated_at=now))
+
+
+def exposure_seq(session) -> int:
+    """
+    Sequence for number_totals changes in the session's current transaction
+
+    The 'exposure_seq' counter is bumped on first use and the value reused
+    for the rest of the transaction. The cached value is dropped when the
+    savepoint it was bumped in rolls back (see _drop_rolled_back_seq), since
+    the counter bump went with it.
+    """
+    if isinstance(session, scoped_session):
+        session = session()
+    transaction = session.get_transaction()
+    cached = session.info.get('exposure_seq')
+    if cached is not None and cached[0] is transaction:
+        return cached[1]
+    seq = bump_counter(session.connection(), EXPOSURE_SEQ_COUNTER)
+    session.info['exposure_seq'] = (transaction, seq, session.get_nested_transaction() or transaction)
+    return seq
+
+
+def _drop_rolled_back_seq(session, previous_transaction) -> None:
+    """Forget the cached exposure sequence if its bump was rolled back"""
+    cached = session.info.get('exposure_seq')
+    if cached is None:
+        return
+    bumped_in = cached[2]
+    while bumped_in is not None:
+        if bumped_in is previous_transaction:
+            del session.info['exposure_seq']
+            return
+        bumped_in = bumped_in.parent
+
+
+def mark_exposure_reset(session, batch_ids) -> int:
+    """
+    Record that number_totals rows of these batches were removed
+
+    Returns:
+        The transaction's exposure sequence
+    """
+    seq = exposure_seq(session)
+    for batch_id in sorted(set(batch_ids)):
+        set_counter(session.connection(), f"{EXPOSURE_RESET_PREFIX}{batch_id}", seq)
+    return seq
+
+
+def _rule_change_keys(obj) -> List[Tuple[str, Optional[str], str, Optional[str]]]:
+    """(entity, rule_type, field, number_norm) of a Rule/BlockedNumber, before and after the change"""
+    from app.models import Rule
+
+    if isinstance(obj, Rule):
+        entity, columns = 'rule', ('rule_type', 'field', 'number_norm')
+    else:
+        entity, columns = 'blocked_number', ('field', 'number_norm')
+
+    state = inspect(obj)
+    current = {column: getattr(obj, column) for column in columns}
+    keys = [current]
+    previous = dict(current)
+    for column in columns:
+        history = state.attrs[column].history
+        if history.deleted:
+            previous[column] = history.deleted[0]
+    if previous != current:
+        keys.append(previous)
+    return [(entity, key.get('rule_type'), key['field'], key['number_norm']) for key in keys]
+
+
+def record_rule_changes(connection, version: int, keys) -> None:
+    """
+    Write the changed row keys of a 'rules' version (inside the caller's transaction)
+
+    Args:
+        keys: (entity, rule_type, field, number_norm) tuples; entity 'reset'
+            marks a bulk change whose rows are unknown
+    """
+    from app.models import RuleChange
+
+    table = RuleChange.__table__
+    now = datetime.now(BANGKOK_TZ)
+    connection.execute(insert(table), [
+        {'version': version, 'entity': entity, 'rule_type': rule_type,
+         'field': field, 'number_norm': number_norm, 'created_at': now}
+        for entity, rule_type, field, number_norm in sorted(set(keys), key=str)
+    ])
+    if version % 100 == 0:
+        connection.execute(delete(table).where(table.c.version <= version - RULE_CHANGES_RETENTION))
+
+
+def get_counter(name: str, session=None) -> int:
+    """Current value of a counter (0 if it was never bumped)"""
+    from app import db
+    from app.models import ChangeCounter
+
+    session = session or db.session
+    value = session.execute(
+        select(ChangeCounter.value).where(ChangeCounter.name == name)
+    ).scalar()
+    return value or 0
+
+
+def register_change_tracking():
+    """Attach session listeners that bump counters for tracked models"""
+    if getattr(register_change_tracking, '_registered', False):
+        return
+    register_change_tracking._registered = True
+
+    from app.models import NumberTotal
+
+    tracked = _tracked_models()
+
+    event.listen(Session, 'after_soft_rollback', _drop_rolled_back_seq)
+
+    @event.listens_for(Session, 'before_flush')
+    def _on_flush(session, flush_context, instances):
+        names = set()
+        rule_keys = []
+        totals = []
+        removed_batches = set()
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, NumberTotal):
+                if obj in session.deleted:
+                    removed_batches.add(obj.batch_id)
+                elif obj not in session.dirty or session.is_modified(obj):
+                    totals.append(obj)
+                continue
+            name = tracked.get(type(obj))
+            if name and (obj not in session.dirty or session.is_modified(obj)):
+                names.add(name)
+                if name == RULES_COUNTER:
+                    rule_keys.extend(_rule_change_keys(obj))
+        for name in sorted(names):
+            version = bump_counter(session.connection(), name)
+            if name == RULES_COUNTER:
+                record_rule_changes(session.connection(), version, rule_keys)
+        if totals or removed_batches:
+            seq = mark_exposure_reset(session, removed_batches)
+            for total in totals:
+                total.seq = seq
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _on_bulk_statement(orm_execute_state):
+        # Bulk INSERT/UPDATE/DELETE (Query.delete(), session.execute(update(Model)))
+        # bypass flush events
+        if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        if orm_execute_state.execution_options.get(UNTRACKED_OPTION):
+            return
+        mapper = orm_execute_state.bind_mapper
+        name = tracked.get(mapper.class_) if mapper is not None else None
+        if name:
+            connection = orm_execute_state.session.connection()
+            version = bump_counter(connection, name)
+            if name == RULES_COUNTER:
+                record_rule_changes(connection, version, [('reset', None, None, None)])
@@ -0,0 +1,314 @@
+"""
+Database engine profiles
+Builds SQLAlchemy engine options for SQLite (WAL + pragmas) and PostgreSQL
+"""
+
+import os
+from typing import Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import scoped_session
+
+# Bind key for the read-only connection pool (dashboards / reports)
+READONLY_BIND = 'readonly'
+
+# Execution option asking the SQLite write engine for BEGIN IMMEDIATE
+IMMEDIATE_OPTION = 'sqlite_begin_immediate'
+
+# Default tuning values - override with environment variables of the same name
+PROFILE_DEFAULTS = {
+    # SQLite
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'SQLITE_CACHE_SIZE_KB': 65536,          # 64MB page cache per connection
+    'SQLITE_MMAP_SIZE': 268435456,          # 256MB memory-mapped I/O
+    'SQLITE_WRITE_POOL_SIZE': 5,
+    'SQLITE_READ_POOL_SIZE': 8,
+    'SQLITE_POOL_TIMEOUT': 30,
+    'SQLITE_BEGIN_IMMEDIATE': True,
+    # PostgreSQL
+    'PG_POOL_SIZE': 10,
+    'PG_MAX_OVERFLOW': 20,
+    'PG_READ_POOL_SIZE': 10,
+    'PG_POOL_TIMEOUT': 30,
+    'PG_POOL_RECYCLE': 1800,
+    'PG_STATEMENT_TIMEOUT_MS': 15000,
+    'PG_READ_STATEMENT_TIMEOUT_MS': 60000,  # reports are allowed to run longer
+    'PG_LOCK_TIMEOUT_MS': 5000,
+}
+
+
+def _setting(name: str, config: Optional[Dict] = None):
+    """Read a tuning value from app config, then environment, then defaults"""
+    default = PROFILE_DEFAULTS[name]
+    raw = None
+    if config is not None and name in config:
+        raw = config[name]
+    elif os.getenv(name) is not None:
+        raw = os.getenv(name)
+
+    if raw is None:
+        return default
+    if isinstance(default, bool):
+        return str(raw).lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, int):
+        return int(raw)
+    return str(raw)
+
+
+def detect_profile(database_uri: str, requested: str = None) -> str:
+    """
+    Determine engine profile for a database URI
+
+    Args:
+        database_uri: SQLAlchemy database URI
+        requested: Explicit profile name (sqlite, postgresql, default) or 'auto'
+
+    Returns:
+        Profile name
+    """
+    if requested and requested != 'auto':
+        return requested
+
+    backend = make_url(database_uri).get_backend_name()
+    if backend == 'sqlite':
+        return 'sqlite'
+    if backend == 'postgresql':
+        return 'postgresql'
+    return 'default'
+
+
+def _is_sqlite_memory(database_uri: str) -> bool:
+    """Check whether SQLite URI points to an in-memory database"""
+    url = make_url(database_uri)
+    return not url.database or url.database == ':memory:' or 'mode=memory' in str(url)
+
+
+def _sqlite_readonly_uri(database_uri: str) -> str:
+    """
+    Build a read-only URI for the same SQLite file
+
+    Uses SQLite URI filenames (file:...?mode=ro) so reader connections can never
+    take the write lock; with WAL they keep reading while a write is in progress.
+    """
+    url = make_url(database_uri)
+    database = url.database
+    if database.startswith('file:'):
+        separator = '&' if '?' in database else '?'
+        return f"sqlite:///{database}{separator}mode=ro&uri=true"
+    return f"sqlite:///file:{database}?mode=ro&uri=true"
+
+
+def build_engine_config(database_uri: str, profile: str = 'auto', config: Optional[Dict] = None) -> Dict:
+    """
+    Build Flask-SQLAlchemy engine configuration for the selected profile
+
+    Args:
+        database_uri: Primary (write) database URI
+        profile: Profile name or 'auto' to detect from URI
+        config: Optional mapping with overrides (usually app.config)
+
+    Returns:
+        Dict with 'profile', 'engine_options' and 'binds' keys
+    """
+    profile = detect_profile(database_uri, profile)
+
+    if profile == 'sqlite':
+        return _build_sqlite_config(database_uri, config)
+    if profile == 'postgresql':
+        return _build_postgresql_config(database_uri, config)
+
+    return {'profile': 'default', 'engine_options': {}, 'binds': {}}
+
+
+def _build_sqlite_config(database_uri: str, config: Optional[Dict]) -> Dict:
+    """SQLite profile: WAL, tuned pragmas, separate write and read-only pools"""
+    busy_timeout_s = _setting('SQLITE_BUSY_TIMEOUT_MS', config) / 1000.0
+
+    if _is_sqlite_memory(database_uri):
+        # In-memory databases cannot be shared between pools; keep defaults
+        return {'profile': 'sqlite', 'engine_options': {}, 'binds': {}}
+
+    write_options = {
+        'pool_size': _setting('SQLITE_WRITE_POOL_SIZE', config),
+        'max_overflow': _setting('SQLITE_WRITE_POOL_SIZE', config),
+        'pool_timeout': _setting('SQLITE_POOL_TIMEOUT', config),
+        'connect_args': {
+            'timeout': busy_timeout_s,
+            'check_same_thread': False,
+        },
+    }
+
+    read_options = {
+        'url': _sqlite_readonly_uri(database_uri),
+        'pool_size': _setting('SQLITE_READ_POOL_SIZE', config),
+        'max_overflow': _setting('SQLITE_READ_POOL_SIZE', config),
+        'pool_timeout': _setting('SQLITE_POOL_TIMEOUT', config),
+        'connect_args': {
+            'timeout': busy_timeout_s,
+            'check_same_thread': False,
+        },
+    }
+
+    return {
+        'profile': 'sqlite',
+        'engine_options': write_options,
+        'binds': {READONLY_BIND: read_options},
+    }
+
+
+def _build_postgresql_config(database_uri: str, config: Optional[Dict]) -> Dict:
+    """PostgreSQL profile: sized pools and server-side statement/lock timeouts"""
+    write_timeout = _setting('PG_STATEMENT_TIMEOUT_MS', config)
+    read_timeout = _setting('PG_READ_STATEMENT_TIMEOUT_MS', config)
+    lock_timeout = _setting('PG_LOCK_TIMEOUT_MS', config)
+
+    write_options = {
+        'pool_size': _setting('PG_POOL_SIZE', config),
+        'max_overflow': _setting('PG_MAX_OVERFLOW', config),
+        'pool_timeout': _setting('PG_POOL_TIMEOUT', config),
+        'pool_recycle': _setting('PG_POOL_RECYCLE', config),
+        'pool_pre_ping': True,
+        'connect_args': {
+            'options': f'-c statement_timeout={write_timeout} -c lock_timeout={lock_timeout}',
+            'application_name': 'lotoryjung',
+        },
+    }
+
+    # Read pool goes to a replica when configured, otherwise to the primary
+    # with read-only transactions so report queries can never take row locks.
+    replica_uri = (config or {}).get('SQLALCHEMY_REPLICA_URI') or os.getenv('SQLALCHEMY_REPLICA_URI')
+    read_options = {
+        'url': replica_uri or database_uri,
+        'pool_size': _setting('PG_READ_POOL_SIZE', config),
+        'max_overflow': _setting('PG_MAX_OVERFLOW', config),
+        'pool_timeout': _setting('PG_POOL_TIMEOUT', config),
+        'pool_recycle': _setting('PG_POOL_RECYCLE', config),
+        'pool_pre_ping': True,
+        'connect_args': {
+            'options': f'-c statement_timeout={read_timeout} -c default_transaction_read_only=on',
+            'application_name': 'lotoryjung-reports',
+        },
+    }
+
+    return {
+        'profile': 'postgresql',
+        'engine_options': write_options,
+        'binds': {READONLY_BIND: read_options},
+    }
+
+
+def apply_engine_profile(app):
+    """
+    Populate app.config with engine options and binds for the configured profile
+
+    Must be called before db.init_app(app).
+    """
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    requested = app.config.get('DB_PROFILE', os.getenv('DB_PROFILE', 'auto'))
+
+    engine_config = build_engine_config(database_uri, requested, app.config)
+
+    app.config['DB_PROFILE'] = engine_config['profile']
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_config['engine_options'],
+        **app.config['SQLALCHEMY_ENGINE_OPTIONS'],
+    }
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for key, value in engine_config['binds'].items():
+        binds.setdefault(key, value)
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+    return engine_config['profile']
+
+
+def _sqlite_pragmas(config: Optional[Dict], readonly: bool):
+    """Build PRAGMA statements executed on each new SQLite connection"""
+    pragmas = [
+        f"PRAGMA busy_timeout={_setting('SQLITE_BUSY_TIMEOUT_MS', config)}",
+        f"PRAGMA cache_size=-{_setting('SQLITE_CACHE_SIZE_KB', config)}",
+        f"PRAGMA mmap_size={_setting('SQLITE_MMAP_SIZE', config)}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if not readonly:
+        # journal_mode is persistent in the database file; set it from the writer
+        pragmas.insert(0, f"PRAGMA journal_mode={_setting('SQLITE_JOURNAL_MODE', config)}")
+        pragmas.insert(1, f"PRAGMA synchronous={_setting('SQLITE_SYNCHRONOUS', config)}")
+    return pragmas
+
+
+def register_sqlite_pragmas(engine, config: Optional[Dict] = None, readonly: bool = False):
+    """
+    Attach connection listeners that apply pragmas to an SQLite engine
+
+    Ordinary transactions keep pysqlite's implicit handling: SELECTs run
+    without a transaction and BEGIN is issued just before the first write, so
+    a read-then-write request waits on busy_timeout for the write lock. An
+    explicit deferred BEGIN on the first SELECT would pin a read snapshot that
+    cannot be upgraded once another writer commits ("database is locked"
+    without waiting).
+
+    Write paths that call immediate_transaction get BEGIN IMMEDIATE instead,
+    taking the write lock before their first read.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = _sqlite_pragmas(config, readonly)
+    begin_immediate = not readonly and _setting('SQLITE_BEGIN_IMMEDIATE', config)
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    if begin_immediate:
+        @event.listens_for(engine, 'begin')
+        def _on_begin(connection):
+            # pysqlite does not add its own BEGIN while one is open
+            if connection.get_execution_options().get(IMMEDIATE_OPTION):
+                connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def immediate_transaction(session):
+    """
+    Start the session's transaction as a write transaction
+
+    Call at the start of a write path so that on SQLite the transaction takes
+    the write lock immediately. A transaction left open earlier in the request
+    that has not written anything (e.g. by the user loader) is closed first;
+    one with pending or flushed changes is kept as it is, so the caller's
+    writes stay in one transaction. No effect on other databases.
+    """
+    if isinstance(session, scoped_session):
+        session = session()
+
+    if session.get_bind().dialect.name != 'sqlite':
+        return session.connection()
+
+    if session.in_transaction():
+        connection = session.connection()
+        # pysqlite opens the database transaction at the first write
+        if session.new or session.dirty or session.deleted or connection.connection.dbapi_connection.in_transaction:
+            return connection
+        session.commit()
+
+    return session.connection(execution_options={IMMEDIATE_OPTION: True})
+
+
+def register_engine_listeners(app, db):
+    """Attach profile-specific listeners to every engine created by Flask-SQLAlchemy"""
+    if app.config.get('DB_PROFILE') != 'sqlite':
+        return
+
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            register_sqlite_pragmas(engine, app.config, readonly=(bind_key == READONLY_BIND))
@@ -0,0 +1,175 @@
+"""
+HTTP caching and compression
+Conditional GET for JSON endpoints whose content only changes with a change
+counter (app.utils.change_tracking): the ETag carries the counter values
+and Last-Modified the time the counter was last bumped, so a polling client
+that is up to date gets 304 Not Modified before the view runs any query.
+
+JSON responses of at least GZIP_MIN_BYTES are gzip-compressed for clients
+that accept it (validation results, report payloads, exposure feeds).
+
+Settings:
+    GZIP_MIN_BYTES - smallest JSON body compressed (default 1024; 0 = off)
+    GZIP_LEVEL     - gzip compression level (default 5)
+"""
+
+import gzip
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Callable, Optional, Tuple
+
+import pytz
+from flask import current_app, make_response, request
+from sqlalchemy import func, select
+
+from app.utils.change_tracking import (
+    EXPOSURE_RESET_PREFIX, EXPOSURE_SEQ_COUNTER, RULES_COUNTER
+)
+
+BANGKOK_TZ = pytz.timezone('Asia/Bangkok')
+
+# (ETag part, last change time or None)
+Version = Tuple[str, Optional[datetime]]
+
+
+def _counter(name: str, session) -> Tuple[int, Optional[datetime]]:
+    """Value and update time of a counter (0, None if it was never bumped)"""
+    from app.models import ChangeCounter
+
+    row = session.execute(
+        select(ChangeCounter.value, ChangeCounter.updated_at).where(ChangeCounter.name == name)
+    ).first()
+    if row is None:
+        return 0, None
+    value, updated_at = row
+    if updated_at is not None and updated_at.tzinfo is None:
+        # Stored as Bangkok wall time
+        updated_at = BANGKOK_TZ.localize(updated_at)
+    return value, updated_at
+
+
+def rules_version(session=None) -> Version:
+    """Version of every Rule / BlockedNumber"""
+    from app import db
+
+    value, updated_at = _counter(RULES_COUNTER, session or db.session)
+    return f"rules-{value}", updated_at
+
+
+def exposure_version(session=None) -> Version:
+    """Version of the number totals of all batches"""
+    from app import db
+
+    value, updated_at = _counter(EXPOSURE_SEQ_COUNTER, session or db.session)
+    return f"exposure-{value}", updated_at
+
+
+def batch_version(batch_id: Optional[str], session=None) -> Optional[Version]:
+    """
+    Version of one batch's orders (None without a batch_id)
+
+    Every order, cancellation, reconcile fix and archive run changes the
+    batch's number totals, which stamps them with a new exposure sequence
+    (removals move the batch's reset counter instead), so the highest of the
+    two changes whenever anything reported for the batch does. One index
+    lookup on (batch_id, seq).
+
+    The time is when any batch last changed: never earlier than the batch's
+    own last change, so If-Modified-Since cannot miss one.
+    """
+    from app import db
+    from app.models import NumberTotal
+
+    if not batch_id:
+        return None
+    session = session or db.session
+    seq = session.execute(
+        select(func.max(NumberTotal.seq)).where(NumberTotal.batch_id == batch_id)
+    ).scalar() or 0
+    reset, _ = _counter(f"{EXPOSURE_RESET_PREFIX}{batch_id}", session)
+    _, updated_at = _counter(EXPOSURE_SEQ_COUNTER, session)
+    return f"batch-{max(seq, reset)}", updated_at
+
+
+def conditional(*versions: Callable[[], Optional[Version]]):
+    """
+    Answer GET requests with 304 Not Modified while versions are unchanged
+
+    Each argument is called (in the request) before the view and returns a
+    Version, or None to serve the request unconditionally (e.g. a required
+    argument is missing). Read versions from the session the view reads its
+    data from, so a lagging replica never labels old data with a new version.
+
+    Usage:
+        @conditional(lambda: batch_version(request.args.get('batch_id'), read_session()))
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            parts = [version() for version in versions]
+            if request.method not in ('GET', 'HEAD') or any(part is None for part in parts):
+                return view(*args, **kwargs)
+
+            etag = '-'.join(tag for tag, _ in parts)
+            times = [changed_at for _, changed_at in parts if changed_at is not None]
+            last_modified = max(times) if len(times) == len(parts) else None
+
+            if _not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or _is_error(response):
+                    return response
+            response.set_etag(etag, weak=True)
+            # Within the same second a later change would carry the same
+            # (second-resolution) Last-Modified; leave it to the ETag
+            if last_modified is not None and datetime.now(BANGKOK_TZ) - last_modified >= timedelta(seconds=1):
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def _is_error(response) -> bool:
+    """{'success': False} bodies (also sent as 200) are not given a validator"""
+    if not response.is_json:
+        return False
+    body = response.get_json(silent=True)
+    return isinstance(body, dict) and body.get('success') is False
+
+
+def _not_modified(etag: str, last_modified: Optional[datetime]) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def register_compression(app):
+    """gzip JSON responses of at least GZIP_MIN_BYTES"""
+    min_bytes = app.config.get('GZIP_MIN_BYTES') or 0
+    level = app.config.get('GZIP_LEVEL') or 5
+    if min_bytes <= 0:
+        return
+
+    @app.after_request
+    def _compress(response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+            return response
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if not request.accept_encodings['gzip']:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=level, mtime=0))
+        response.headers['Content-Encoding'] = 'gzip'
+        # The ETag stays valid for the decoded body only
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -181,20 +181,29 @@ def is_number_blocked(number):
 def get_user_stats(user_id):
     """
     Get user betting statistics
-    TODO: Implement statistics calculation
+    Reads the running per-user statistics (user_stats table)
     
     Args:
         user_id (int): User ID
         
     Returns:
-        dict: User statistics
+        dict: User statistics; win_count and win_amount are always 0 (draw
+        results are not tracked)
     """
-    # TODO: Calculate from database
+    from app.services.limit_service import LimitService
+    from app.services.order_service import OrderService
+    from app.services.user_stats_service import UserStatsService
+    
+    today_batch = LimitService._get_current_batch_id()
+    period_batch = OrderService.get_current_batch_id()
+    
+    stats = UserStatsService.get_user_stats(user_id, [today_batch, period_batch])
+    
     return {
-        'total_orders': 0,
-        'total_amount': 0,
-        'today_amount': 0,
-        'this_period_amount': 0,
+        'total_orders': stats['total_orders'],
+        'total_amount': stats['total_amount'],
+        'today_amount': stats['by_batch'][today_batch]['amount'],
+        'this_period_amount': stats['by_batch'][period_batch]['amount'],
         'win_count': 0,
         'win_amount': 0
     }
@@ -3,10 +3,65 @@ Number utilities for lottery number processing
 """
 
 import re
+from types import MappingProxyType
 from typing import List, Tuple, Optional
 from itertools import permutations
 from datetime import datetime, date, timedelta
 
+# ---------------------------------------------------------------------------
+# Precomputed lookup tables
+# The whole domain is 100 two-digit and 1,000 three-digit strings, so every
+# permutation / tote key is computed once at import and looked up afterwards.
+# Tables are read-only (MappingProxyType / tuples).
+# ---------------------------------------------------------------------------
+
+ALL_2_DIGIT = tuple(f"{i:02d}" for i in range(100))
+ALL_3_DIGIT = tuple(f"{i:03d}" for i in range(1000))
+
+# number -> sorted unique permutations
+PERMUTATIONS_2 = MappingProxyType({
+    n: tuple(sorted({n, n[::-1]})) for n in ALL_2_DIGIT
+})
+PERMUTATIONS_3 = MappingProxyType({
+    n: tuple(sorted({''.join(p) for p in permutations(n)})) for n in ALL_3_DIGIT
+})
+
+# 3-digit number -> tote key (digits sorted ascending)
+TOTE_KEY = MappingProxyType({n: ''.join(sorted(n)) for n in ALL_3_DIGIT})
+
+# tote key -> all 3-digit numbers sharing it
+TOTE_MEMBERS = MappingProxyType({
+    key: PERMUTATIONS_3[key] for key in sorted(set(TOTE_KEY.values()))
+})
+
+# Array-index variants (index = int value of the number), for bulk paths
+# working on integer arrays: PERMUTATIONS_3_BY_INDEX[157] == (157, 175, ...)
+PERMUTATIONS_2_BY_INDEX = tuple(tuple(int(p) for p in PERMUTATIONS_2[n]) for n in ALL_2_DIGIT)
+PERMUTATIONS_3_BY_INDEX = tuple(tuple(int(p) for p in PERMUTATIONS_3[n]) for n in ALL_3_DIGIT)
+TOTE_KEY_BY_INDEX = tuple(int(TOTE_KEY[n]) for n in ALL_3_DIGIT)
+
+
+def _build_normalize_table():
+    """Results of normalize_number for every 1-3 digit input, per field"""
+    inputs = [f"{i:0{width}d}" for width in (1, 2, 3) for i in range(10 ** width)]
+    table = {}
+    for field in ('2_top', '2_bottom', '3_top', 'tote'):
+        table[field] = MappingProxyType({s: _normalize_number_slow(s, field) for s in inputs})
+    return MappingProxyType(table)
+
+
+def tote_key_index(index: int) -> int:
+    """Tote key of a 3-digit number given as int (e.g. 921 -> 129)"""
+    return TOTE_KEY_BY_INDEX[index]
+
+
+def permutation_indices(index: int, digits: int) -> Tuple[int, ...]:
+    """Permutations of a 2- or 3-digit number given as int"""
+    if digits == 2:
+        return PERMUTATIONS_2_BY_INDEX[index]
+    return PERMUTATIONS_3_BY_INDEX[index]
+
+
 def normalize_number(number: str, field: str) -> str:
     """
     Normalize lottery number based on field type
@@ -18,6 +73,15 @@ def normalize_number(number: str, field: str) -> str:
     Returns:
         Normalized number string
     """
+    table = _NORMALIZE_TABLE.get(field)
+    if table is not None:
+        result = table.get(number if isinstance(number, str) else str(number))
+        if result is not None:
+            return result
+    return _normalize_number_slow(number, field)
+
+def _normalize_number_slow(number, field: str) -> str:
+    """normalize_number for inputs outside the lookup table"""
     # Remove all non-digit characters
     clean_number = re.sub(r'\D', '', str(number))
     
@@ -36,6 +100,8 @@ def normalize_number(number: str, field: str) -> str:
     
     return clean_number
 
+_NORMALIZE_TABLE = _build_normalize_table()
+
 def canonicalize_tote(number: str) -> List[str]:
     """
     Canonicalize tote number to all possible permutations
@@ -53,6 +119,8 @@ def canonicalize_tote(number: str) -> List[str]:
         return [normalized]
     elif len(normalized) == 3:
         # 3-digit tote: return all unique permutations
+        if normalized in PERMUTATIONS_3:
+            return list(PERMUTATIONS_3[normalized])
         digits = list(normalized)
         permutations = set()
         
@@ -150,17 +218,15 @@ def generate_order_number() -> str:
     """
     Generate unique order number
     
+    Monotonic and collision-free across threads and worker processes
+    (see app.utils.order_number).
+    
     Returns:
         Order number string
     """
-    from datetime import datetime
-    import random
-    
-    now = datetime.now()
-    timestamp = now.strftime("%Y%m%d%H%M%S")
-    random_suffix = f"{random.randint(100, 999)}"
+    from app.utils.order_number import order_number_generator
     
-    return f"ORD{timestamp}{random_suffix}"
+    return order_number_generator.generate()
 
 def calculate_lottery_period(order_date: Optional[datetime] = None) -> date:
     """
@@ -220,6 +286,9 @@ def generate_2_digit_permutations(number):
         return []
     
     num_str = str(number).zfill(2)
+    if num_str in PERMUTATIONS_2:
+        return list(PERMUTATIONS_2[num_str])
+    
     digit1, digit2 = num_str[0], num_str[1]
     
     permutations = []
@@ -258,6 +327,9 @@ def generate_tote_number(number):
         return number
     
     num_str = str(number).zfill(3)
+    if num_str in TOTE_KEY:
+        return TOTE_KEY[num_str]
+    
     digits = list(num_str)
     digits.sort()  # Sort from smallest to largest
     
@@ -275,6 +347,9 @@ def generate_3_digit_permutations(number):
         return []
     
     num_str = str(number).zfill(3)
+    if num_str in PERMUTATIONS_3:
+        return list(PERMUTATIONS_3[num_str])
+    
     digits = [num_str[0], num_str[1], num_str[2]]
     
     # Get all unique permutations
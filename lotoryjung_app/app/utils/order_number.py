@@ -0,0 +1,163 @@
+"""
+Order number generator
+Monotonic, sortable, collision-free order numbers without database round-trips.
+
+Format (20 chars, fits orders.order_number):
+    ORD + YYYYMMDD + 9 base36 chars
+
+The base36 part packs (ms of day, worker id, sequence):
+    27 bits  millisecond of the day
+     8 bits  worker id (0-255), unique per process
+    11 bits  sequence within the millisecond (2,048 ids/ms per worker)
+
+Numbers from one worker are strictly increasing (the clock never goes
+backwards; on sequence overflow the next millisecond is borrowed), and
+numbers from different workers differ in the worker bits. Fixed width and
+upper-case base36 keep string order equal to time order, so inserts land
+at the end of the order_number index.
+
+Worker ids:
+    ORDER_WORKER_ID   - explicit id for a single-process deployment; must be
+                        unique per process (forked children ignore it)
+    otherwise         - first free lock file in ORDER_WORKER_LOCK_DIR
+                        (default: <instance>/order_workers), held for the
+                        life of the process; falls back to pid % 256 where
+                        file locks are unavailable
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+PREFIX = 'ORD'
+WORKER_BITS = 8
+SEQUENCE_BITS = 11
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+SUFFIX_LENGTH = 9
+
+_DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def _base36(value: int, width: int) -> str:
+    chars = []
+    for _ in range(width):
+        value, rem = divmod(value, 36)
+        chars.append(_DIGITS[rem])
+    return ''.join(reversed(chars))
+
+
+class OrderNumberGenerator:
+    """Per-process order number generator (thread-safe)"""
+
+    def __init__(self):
+        self.lock_dir = None
+        self._worker_id = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+        self._day_start_ms = 0
+        self._day_end_ms = 0
+        self._day_prefix = ''
+
+        if hasattr(os, 'register_at_fork'):
+            # Forked workers (gunicorn) must not reuse the parent's worker id
+            os.register_at_fork(after_in_child=self._reset)
+
+    def init_app(self, app):
+        self.lock_dir = app.config.get('ORDER_WORKER_LOCK_DIR') or os.path.join(app.instance_path, 'order_workers')
+        worker_id = app.config.get('ORDER_WORKER_ID')
+        if worker_id not in (None, ''):
+            self._set_worker_id(int(worker_id))
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._worker_id = None
+        self._lock_file = None
+        self._last_ms = 0
+        self._sequence = 0
+
+    def _set_worker_id(self, worker_id: int):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"ORDER_WORKER_ID must be between 0 and {MAX_WORKER_ID}")
+        self._worker_id = worker_id
+
+    def _claim_worker_id(self) -> int:
+        """Hold an exclusive lock on the first free worker-N.lock file"""
+        if fcntl is None or not self.lock_dir:
+            return os.getpid() & MAX_WORKER_ID
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        for worker_id in range(MAX_WORKER_ID + 1):
+            path = os.path.join(self.lock_dir, f"worker-{worker_id}.lock")
+            lock_file = open(path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            self._lock_file = lock_file  # keep open: closing releases the lock
+            return worker_id
+
+        raise RuntimeError(f"No free order worker id in {self.lock_dir}")
+
+    @property
+    def worker_id(self) -> int:
+        if self._worker_id is None:
+            with self._lock:
+                if self._worker_id is None:
+                    self._worker_id = self._claim_worker_id()
+        return self._worker_id
+
+    def _set_day(self, ms: int):
+        """Cache date prefix and day bounds for the day containing ms"""
+        day = datetime.fromtimestamp(ms / 1000).replace(hour=0, minute=0, second=0, microsecond=0)
+        self._day_start_ms = int(day.timestamp() * 1000)
+        self._day_end_ms = self._day_start_ms + 86_400_000
+        self._day_prefix = f"{PREFIX}{day.strftime('%Y%m%d')}"
+
+    def generate(self, now_ms: Optional[int] = None) -> str:
+        """
+        Generate the next order number
+
+        Args:
+            now_ms: Current time in epoch milliseconds (default: system clock)
+
+        Returns:
+            Order number string (20 chars)
+        """
+        worker_id = self.worker_id
+        if now_ms is None:
+            now_ms = time.time_ns() // 1_000_000
+
+        with self._lock:
+            ms = max(now_ms, self._last_ms)
+            if ms == self._last_ms:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # Borrow the next millisecond instead of waiting
+                    ms += 1
+                    self._sequence = 0
+            else:
+                self._sequence = 0
+            self._last_ms = ms
+            sequence = self._sequence
+
+            if not self._day_start_ms <= ms < self._day_end_ms:
+                self._set_day(ms)
+            prefix = self._day_prefix
+            ms_of_day = ms - self._day_start_ms
+
+        value = (((ms_of_day << WORKER_BITS) | worker_id) << SEQUENCE_BITS) | sequence
+        return prefix + _base36(value, SUFFIX_LENGTH)
+
+
+order_number_generator = OrderNumberGenerator()
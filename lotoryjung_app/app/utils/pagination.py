@@ -0,0 +1,147 @@
+"""
+Keyset (cursor) pagination
+Pages are fetched with WHERE (sort key) < (last seen key) instead of OFFSET,
+so page 1000 costs the same index range scan as page 1. Cursors are opaque
+URL-safe strings encoding the sort key of the last row on the page.
+"""
+
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded"""
+    pass
+
+
+def _to_json(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _from_json(column, value: Any):
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except (AttributeError, NotImplementedError):
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    if python_type is Decimal:
+        return Decimal(value)
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode sort key values into an opaque cursor string"""
+    payload = json.dumps([_to_json(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> List[Any]:
+    """Decode a cursor string back into sort key values for the given columns"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError('cursor length mismatch')
+        return [_from_json(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {e}')
+
+
+def _after(columns: Sequence, values: Sequence, descending: bool):
+    """
+    Build "row comes after key" condition for a composite sort key
+
+    Expanded form of (c1, c2, ...) < (v1, v2, ...) that every backend can
+    match against a composite index.
+    """
+    conditions = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        step = column < value if descending else column > value
+        conditions.append(and_(*equal_prefix, step))
+    return or_(*conditions)
+
+
+class KeysetPage:
+    """One page of keyset pagination results"""
+
+    def __init__(self, items: list, per_page: int, next_cursor: Optional[str], cursor: Optional[str]):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self) -> bool:
+        return not self.cursor
+
+    def to_dict(self) -> dict:
+        """Pagination metadata for JSON responses"""
+        return {
+            'per_page': self.per_page,
+            'count': len(self.items),
+            'cursor': self.cursor,
+            'next_cursor': self.next_cursor,
+            'has_next': self.has_next
+        }
+
+
+def keyset_paginate(query, columns: Sequence, cursor: Optional[str] = None,
+                    per_page: int = 20, descending: bool = True, max_per_page: int = 500,
+                    key=None) -> KeysetPage:
+    """
+    Paginate an ORM query by a unique composite sort key
+
+    Args:
+        query: Filtered query (must not already be ordered or limited)
+        columns: Sort key columns; the last one must make the key unique (usually id)
+        cursor: Cursor from the previous page's next_cursor (None for first page)
+        per_page: Page size
+        descending: Sort direction for all key columns
+        max_per_page: Upper bound on per_page
+        key: Function returning sort key values for a result row
+             (default: read attributes named like the columns)
+
+    Returns:
+        KeysetPage
+
+    Raises:
+        InvalidCursor: Cursor is malformed
+    """
+    per_page = max(1, min(int(per_page or 20), max_per_page))
+
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns), descending))
+
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = query.order_by(*order).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        if key is None:
+            values = [getattr(last, column.key) for column in columns]
+        else:
+            values = key(last)
+        next_cursor = encode_cursor(values)
+
+    return KeysetPage(rows, per_page, next_cursor, cursor)
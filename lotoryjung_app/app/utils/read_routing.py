@@ -0,0 +1,198 @@
+"""
+Read/write session routing
+Sends heavy report queries to a read-only engine so they do not compete with
+order submission for connections on the primary.
+
+Routing modes (READ_ROUTING):
+    auto      - sqlite: read-only pool on the same file; postgresql: replica if
+                SQLALCHEMY_REPLICA_URI is set, otherwise the read-only pool
+    readonly  - read-only pool (bind 'readonly', see app.utils.db_engine)
+    replica   - PostgreSQL replica; falls back to the primary when replication
+                lag exceeds READ_MAX_STALENESS_SECONDS
+    snapshot  - SQLite only: periodically refreshed copy of the database file,
+                never older than READ_MAX_STALENESS_SECONDS
+    primary   - no routing, reports use db.session
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from flask import g, current_app
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.utils.db_engine import READONLY_BIND, register_sqlite_pragmas
+
+
+class SQLiteSnapshot:
+    """Read-only copy of an SQLite database refreshed with the online backup API"""
+
+    def __init__(self, source_path: str, snapshot_path: str, max_staleness: float, config=None):
+        self.source_path = source_path
+        self.snapshot_path = snapshot_path
+        self.max_staleness = max_staleness
+        self.config = config
+        self.refreshed_at = None
+        self.engine = None
+        self._lock = threading.Lock()
+
+    def age(self) -> Optional[float]:
+        """Seconds since last refresh (None if never refreshed)"""
+        if self.refreshed_at is None:
+            return None
+        return time.monotonic() - self.refreshed_at
+
+    def is_stale(self) -> bool:
+        age = self.age()
+        return age is None or age > self.max_staleness
+
+    def refresh(self):
+        """Copy the primary database into the snapshot file atomically"""
+        tmp_path = f"{self.snapshot_path}.tmp"
+
+        source = sqlite3.connect(self.source_path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target)
+            # Snapshot is opened read-only/immutable; it must not need a WAL file
+            target.execute('PRAGMA journal_mode=DELETE')
+            target.commit()
+        finally:
+            target.close()
+            source.close()
+
+        # Readers that still hold connections keep the old inode until they return
+        os.replace(tmp_path, self.snapshot_path)
+
+        if self.engine is None:
+            self.engine = create_engine(
+                f"sqlite:///file:{self.snapshot_path}?mode=ro&immutable=1&uri=true",
+                connect_args={'check_same_thread': False}
+            )
+            register_sqlite_pragmas(self.engine, self.config, readonly=True)
+        else:
+            # New checkouts open the fresh file; checked-out connections finish normally
+            self.engine.dispose(close=False)
+
+        self.refreshed_at = time.monotonic()
+
+    def get_engine(self):
+        """Return snapshot engine, refreshing first if the copy is too old"""
+        if self.is_stale():
+            with self._lock:
+                if self.is_stale():
+                    self.refresh()
+        return self.engine
+
+
+class ReadRouter:
+    """Resolves the engine used for report sessions"""
+
+    def __init__(self):
+        self.mode = 'primary'
+        self.max_staleness = 60.0
+        self._db = None
+        self._snapshot = None
+        self._replica_lag = None
+        self._replica_lag_checked = None
+
+    def init_app(self, app, db):
+        self._db = db
+
+        mode = app.config.get('READ_ROUTING', os.getenv('READ_ROUTING', 'auto'))
+        profile = app.config.get('DB_PROFILE', 'default')
+        self.max_staleness = float(app.config.get(
+            'READ_MAX_STALENESS_SECONDS', os.getenv('READ_MAX_STALENESS_SECONDS', 60)
+        ))
+
+        if mode == 'auto':
+            if profile == 'postgresql' and (app.config.get('SQLALCHEMY_REPLICA_URI') or os.getenv('SQLALCHEMY_REPLICA_URI')):
+                mode = 'replica'
+            elif READONLY_BIND in (app.config.get('SQLALCHEMY_BINDS') or {}):
+                mode = 'readonly'
+            else:
+                mode = 'primary'
+
+        if mode == 'snapshot':
+            if profile != 'sqlite':
+                app.logger.warning('READ_ROUTING=snapshot requires SQLite; using primary')
+                mode = 'primary'
+            else:
+                with app.app_context():
+                    source_path = db.engine.url.database
+                snapshot_path = app.config.get(
+                    'READ_SNAPSHOT_PATH', os.getenv('READ_SNAPSHOT_PATH', f"{source_path}.snapshot")
+                )
+                self._snapshot = SQLiteSnapshot(source_path, snapshot_path, self.max_staleness, app.config)
+
+        self.mode = mode
+        app.config['READ_ROUTING'] = mode
+        app.teardown_appcontext(self._close_session)
+
+    def _replica_is_fresh(self, engine) -> bool:
+        """Check replica lag (cached for a few seconds) against the staleness bound"""
+        now = time.monotonic()
+        if self._replica_lag_checked is None or now - self._replica_lag_checked > 5:
+            try:
+                with engine.connect() as conn:
+                    lag = conn.execute(text(
+                        "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                    )).scalar()
+                self._replica_lag = float(lag or 0)
+            except Exception as e:
+                current_app.logger.warning(f"Replica lag check failed: {e}")
+                self._replica_lag = None
+            self._replica_lag_checked = now
+
+        return self._replica_lag is not None and self._replica_lag <= self.max_staleness
+
+    def get_engine(self):
+        """Return engine for report reads, or None to use the primary session"""
+        if self.mode in ('readonly', 'replica'):
+            engine = self._db.engines.get(READONLY_BIND)
+            if engine is None:
+                return None
+            if self.mode == 'replica' and not self._replica_is_fresh(engine):
+                return None
+            return engine
+
+        if self.mode == 'snapshot':
+            try:
+                return self._snapshot.get_engine()
+            except Exception as e:
+                current_app.logger.error(f"Read snapshot refresh failed: {e}")
+                return None
+
+        return None
+
+    def session(self):
+        """Session for report queries, scoped to the current app context"""
+        if self.mode == 'primary':
+            return self._db.session
+
+        session = g.get('_read_session')
+        if session is None:
+            engine = self.get_engine()
+            if engine is None:
+                return self._db.session
+            session = Session(bind=engine, autoflush=False, expire_on_commit=False)
+            g._read_session = session
+        return session
+
+    @staticmethod
+    def _close_session(exception=None):
+        session = g.pop('_read_session', None)
+        if session is not None:
+            session.close()
+
+
+# Global router instance
+read_router = ReadRouter()
+
+
+def read_session():
+    """Shortcut used by report services in place of db.session"""
+    return read_router.session()
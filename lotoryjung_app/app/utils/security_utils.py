@@ -270,22 +270,26 @@ class CSVSanitizer:
         if value is None:
             return ""
         
-        str_value = str(value)
+        str_value = CSVSanitizer.escape_formula(str(value))
         
+        # Escape quotes
+        str_value = str_value.replace('"', '""')
+        
+        # Wrap in quotes if contains comma, quotes or line breaks
+        if ',' in str_value or '"' in str_value or '\n' in str_value or '\r' in str_value:
+            str_value = f'"{str_value}"'
+        
+        return str_value
+    
+    @staticmethod
+    def escape_formula(str_value: str) -> str:
+        """Prefix values a spreadsheet would treat as a formula"""
         # Remove or escape dangerous characters
         dangerous_chars = ['=', '+', '-', '@', '\t', '\r', '\n']
         
         for char in dangerous_chars:
             if str_value.startswith(char):
-                str_value = "'" + str_value  # Prefix with single quote
-                break
-        
-        # Escape quotes
-        str_value = str_value.replace('"', '""')
-        
-        # Wrap in quotes if contains comma or quotes
-        if ',' in str_value or '"' in str_value:
-            str_value = f'"{str_value}"'
+                return "'" + str_value  # Prefix with single quote
         
         return str_value
     
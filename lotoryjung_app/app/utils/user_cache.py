@@ -0,0 +1,178 @@
+"""
+Authenticated user cache
+Per-process TTL cache of user identity/role so Flask-Login's user_loader
+does not load the User row on every request.
+
+Entries are tagged with the 'users' change counter, bumped in the same
+transaction as any change to a cached column or a user deletion. load()
+compares it (one counter lookup) so a deactivated or demoted user loses
+access on every worker at the next request, not when the entry expires.
+USER_CACHE_TTL only bounds how long unused entries are kept.
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from app.utils.change_tracking import USERS_COUNTER, bump_counter, get_counter
+
+# User columns copied into CachedUser
+CACHED_COLUMNS = ('name', 'username', 'role', 'is_active')
+
+
+class CachedUser(UserMixin):
+    """
+    Detached snapshot of a User row used as current_user
+
+    Carries only what request handlers and templates read from current_user;
+    load the User model explicitly when the full row is needed.
+    """
+
+    def __init__(self, id: int, name: str, username: str, role: str, is_active: bool):
+        self.id = id
+        self.name = name
+        self.username = username
+        self.role = role
+        self._is_active = is_active
+
+    @property
+    def is_active(self):
+        return self._is_active
+
+    def is_admin(self):
+        """Check if user is admin"""
+        return self.role == 'admin'
+
+    @classmethod
+    def from_user(cls, user) -> 'CachedUser':
+        return cls(user.id, user.name, user.username, user.role, bool(user.is_active))
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+class UserCache:
+    """Thread-safe TTL cache of CachedUser keyed by user id"""
+
+    def __init__(self, ttl: float = 60, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: Dict[int, Tuple[float, int, CachedUser]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, version: int = None) -> Optional[CachedUser]:
+        """Cached user (None if missing, expired or cached at another 'users' version)"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, cached_version, cached = entry
+        if expires_at < time.monotonic() or (version is not None and cached_version != version):
+            self._entries.pop(user_id, None)
+            return None
+        return cached
+
+    def set(self, cached: CachedUser, version: int = None):
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                self._evict()
+            self._entries[cached.id] = (time.monotonic() + self.ttl, version, cached)
+
+    def invalidate(self, user_id: int = None):
+        """Drop one user (or everything when user_id is None)"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def _evict(self):
+        """Remove expired entries, then the oldest half if still full (lock held)"""
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _, _) in self._entries.items() if expires_at < now]:
+            del self._entries[key]
+        if len(self._entries) >= self.max_size:
+            oldest = sorted(self._entries.items(), key=lambda item: item[1][0])
+            for key, _ in oldest[:len(oldest) // 2]:
+                del self._entries[key]
+
+    def load(self, user_id: int) -> Optional[CachedUser]:
+        """Return cached user, loading from the database on a miss"""
+        from app import db
+        from app.models import User
+
+        # Read before the row, so a change committed in between is seen as a new version
+        version = get_counter(USERS_COUNTER, db.session)
+        cached = self.get(user_id, version)
+        if cached is not None:
+            return cached
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+
+        cached = CachedUser.from_user(user)
+        self.set(cached, version)
+        return cached
+
+
+# Global cache instance
+user_cache = UserCache()
+
+
+def _pending_invalidations(session) -> set:
+    return session.info.setdefault('_user_cache_invalidate', set())
+
+
+def register_user_cache(app):
+    """Configure TTL and hook invalidation on User updates/deletes"""
+    from app.models import User
+
+    user_cache.ttl = float(app.config.get('USER_CACHE_TTL', 60))
+    user_cache.max_size = int(app.config.get('USER_CACHE_MAX_SIZE', 10000))
+
+    if getattr(register_user_cache, '_registered', False):
+        return
+    register_user_cache._registered = True
+
+    def _invalidate(connection, target):
+        # Other workers notice the counter; drop here now and again after
+        # commit, so a concurrent request cannot re-cache the old row
+        # between flush and commit
+        bump_counter(connection, USERS_COUNTER)
+        user_cache.invalidate(target.id)
+        session = object_session(target)
+        if session is not None:
+            _pending_invalidations(session).add(target.id)
+
+    @event.listens_for(User, 'after_update')
+    def _on_user_update(mapper, connection, target):
+        state = inspect(target)
+        if any(state.attrs[column].history.has_changes() for column in CACHED_COLUMNS):
+            _invalidate(connection, target)
+
+    @event.listens_for(User, 'after_delete')
+    def _on_user_delete(mapper, connection, target):
+        _invalidate(connection, target)
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _on_bulk_statement(orm_execute_state):
+        # Query.update()/delete() on users bypass the mapper events
+        if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ is User:
+            bump_counter(orm_execute_state.session.connection(), USERS_COUNTER)
+            user_cache.invalidate()
+
+    @event.listens_for(Session, 'after_commit')
+    def _on_commit(session):
+        for user_id in session.info.pop('_user_cache_invalidate', ()):
+            user_cache.invalidate(user_id)
+
+    @event.listens_for(Session, 'after_rollback')
+    def _on_rollback(session):
+        session.info.pop('_user_cache_invalidate', None)
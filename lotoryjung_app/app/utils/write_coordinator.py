@@ -0,0 +1,215 @@
+"""
+Single-writer group commit (SQLite)
+Funnels order writes through one writer thread per process. The writer takes
+every job waiting in the queue (up to WRITE_GROUP_MAX_JOBS, collecting for at
+most WRITE_GROUP_WAIT_MS), runs each one inside a SAVEPOINT of a single
+BEGIN IMMEDIATE transaction and commits once for the whole group, then hands
+each job's result (or exception) back to the request thread waiting for it.
+
+One fsync and one write-lock acquisition per group instead of per order:
+concurrent submits in a worker no longer queue on the database lock, and
+validation inside a job sees the totals written by earlier jobs of the same
+group (the session autoflushes before each query).
+
+Jobs are plain functions run with the writer's db.session:
+    result = write_coordinator.run(job, *args)
+They must not use request state (current_user, request) and should return
+plain data rather than ORM objects, which belong to the writer's session.
+A job that raises has only its own savepoint rolled back.
+
+Settings:
+    WRITE_COORDINATOR          - 'on' to enable (SQLite profile with explicit
+                                 BEGIN only); otherwise jobs run inline in the
+                                 request's own transaction
+    WRITE_GROUP_MAX_JOBS       - jobs per transaction (default 32)
+    WRITE_GROUP_WAIT_MS        - how long to collect a group (default 2)
+    WRITE_TIMEOUT_SECONDS      - how long a request waits for a job that has
+                                 not started yet (default 30)
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, List
+
+from app.utils.db_engine import immediate_transaction, _setting
+
+logger = logging.getLogger(__name__)
+
+
+class WriteTimeout(Exception):
+    """Raised when a queued write was not started in time (it will not run)"""
+    pass
+
+
+class _WriteJob:
+    """One queued job and its outcome"""
+
+    __slots__ = ('fn', 'args', 'kwargs', 'done', 'result', 'error', 'started', 'cancelled')
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.started = False
+        self.cancelled = False
+
+
+class WriteCoordinator:
+    """Per-process group-commit writer"""
+
+    def __init__(self):
+        self.app = None
+        self.db = None
+        self.enabled = False
+        self.max_jobs = 32
+        self.wait_seconds = 0.002
+        self.timeout = 30.0
+        self._reset()
+
+        if hasattr(os, 'register_at_fork'):
+            # The writer thread does not survive fork; children start their own
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.groups = 0
+        self.jobs = 0
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.max_jobs = int(app.config.get('WRITE_GROUP_MAX_JOBS') or 32)
+        self.wait_seconds = int(app.config.get('WRITE_GROUP_WAIT_MS') or 2) / 1000.0
+        self.timeout = float(app.config.get('WRITE_TIMEOUT_SECONDS') or 30)
+
+        requested = str(app.config.get('WRITE_COORDINATOR') or 'off').lower() in ('1', 'true', 'yes', 'on')
+        self.enabled = requested and app.config.get('DB_PROFILE') == 'sqlite'
+        if requested and not self.enabled:
+            logger.warning("WRITE_COORDINATOR needs the sqlite profile; writes run inline")
+        if self.enabled and not _setting('SQLITE_BEGIN_IMMEDIATE', app.config):
+            # pysqlite's implicit transactions break SAVEPOINT handling
+            logger.warning("WRITE_COORDINATOR needs SQLITE_BEGIN_IMMEDIATE; writes run inline")
+            self.enabled = False
+
+    def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a write job and commit it
+
+        Args:
+            fn: Job function; called as fn(*args, **kwargs) with db.session
+                bound to the transaction it must write in
+            *args, **kwargs: Job arguments
+
+        Returns:
+            The job's return value, once its transaction has committed
+
+        Raises:
+            The job's exception, the commit error, or WriteTimeout
+        """
+        session = self.db.session
+        if not self.enabled or session.new or session.dirty or session.deleted:
+            # Changes already pending in the request's session must commit
+            # together with the job, so it cannot move to the writer
+            return self._run_inline(fn, args, kwargs)
+
+        # Give the request's connection back to the pool while waiting, or
+        # waiting requests can starve the writer of connections. close()
+        # keeps loaded attributes (e.g. current_user.id) usable.
+        session.close()
+
+        job = _WriteJob(fn, args, kwargs)
+        self._ensure_writer()
+        self._queue.put(job)
+
+        if not job.done.wait(self.timeout):
+            with self._lock:
+                if not job.started:
+                    job.cancelled = True
+                    raise WriteTimeout('ระบบบันทึกข้อมูลไม่ว่าง กรุณาลองใหม่')
+            # Already running - its outcome is committed or rolled back shortly
+            job.done.wait()
+
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _run_inline(self, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        """Coordinator disabled: run in the caller's session and commit"""
+        session = self.db.session
+        immediate_transaction(session)
+        try:
+            result = fn(*args, **kwargs)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return result
+
+    def _ensure_writer(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._writer_loop, name='write-coordinator', daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[_WriteJob]:
+        """Block for the first job, then gather what arrives within the wait window"""
+        group = [self._queue.get()]
+        deadline = time.monotonic() + self.wait_seconds
+        while len(group) < self.max_jobs:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            group.append(job)
+        return group
+
+    def _writer_loop(self):
+        with self.app.app_context():
+            while True:
+                group = self._collect()
+                with self._lock:
+                    group = [job for job in group if not job.cancelled]
+                    for job in group:
+                        job.started = True
+                if group:
+                    self._commit_group(group)
+
+    def _commit_group(self, group: List[_WriteJob]):
+        session = self.db.session
+        try:
+            immediate_transaction(session)
+            for job in group:
+                try:
+                    with session.begin_nested():
+                        job.result = job.fn(*job.args, **job.kwargs)
+                except Exception as e:
+                    job.error = e
+            session.commit()
+            self.groups += 1
+            self.jobs += len(group)
+        except Exception as e:
+            # Commit (or BEGIN) failed: nothing in the group was written
+            logger.exception("Group commit of %d jobs failed", len(group))
+            session.rollback()
+            for job in group:
+                job.result = None
+                if job.error is None:
+                    job.error = e
+        finally:
+            session.close()
+            for job in group:
+                job.done.set()
+
+
+write_coordinator = WriteCoordinator()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check
+Measures how long `create_app()` takes in a fresh interpreter (imports plus
+app factory) for a web worker and for CLI commands, and fails when the
+median exceeds the budget or when a lazily loaded subsystem (PDF, reports,
+SocketIO, ...) is imported at startup.
+
+Usage:
+    python check_import_budget.py [--runs 5] [--web-budget-ms 1500] [--cli-budget-ms 1200]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that must only be imported on first use
+LAZY_MODULES = {
+    'web': ('reportlab', 'numpy', 'pandas', 'openpyxl', 'flask_socketio'),
+    'cli': ('reportlab', 'numpy', 'pandas', 'openpyxl', 'flask_socketio', 'flask_limiter', 'flask_cors'),
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+from app import create_app
+create_app(web={web})
+elapsed = (time.perf_counter() - start) * 1000
+print('{{:.1f}}'.format(elapsed))
+print(','.join(sorted(name for name in sys.modules if '.' not in name)))
+"""
+
+
+def run_probe(mode: str, importtime: bool = False):
+    """Run create_app() in a fresh interpreter; returns (ms, top-level modules, importtime log)"""
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['-c', PROBE.format(web=mode == 'web')]
+    result = subprocess.run(cmd, cwd=APP_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"create_app() failed:\n{result.stderr}")
+    elapsed, modules = result.stdout.strip().splitlines()[-2:]
+    return float(elapsed), set(modules.split(',')), result.stderr
+
+
+def slowest_imports(log: str, limit: int = 10):
+    """Top-level packages by cumulative import time (from -X importtime)"""
+    rows = []
+    for line in log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Modules imported by the probe itself and their direct imports
+        if len(name) - len(name.lstrip()) <= 3:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check app startup against an import-time budget')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--web-budget-ms', type=float, default=float(os.getenv('IMPORT_BUDGET_WEB_MS', 1500)))
+    parser.add_argument('--cli-budget-ms', type=float, default=float(os.getenv('IMPORT_BUDGET_CLI_MS', 1200)))
+    args = parser.parse_args()
+
+    budgets = {'web': args.web_budget_ms, 'cli': args.cli_budget_ms}
+    failed = False
+
+    for mode, budget in budgets.items():
+        timings = []
+        modules = set()
+        for _ in range(args.runs):
+            elapsed, modules, _ = run_probe(mode)
+            timings.append(elapsed)
+        median = statistics.median(timings)
+
+        status = 'OK' if median <= budget else 'OVER BUDGET'
+        print(f"{mode:>3}: median {median:.0f} ms (min {min(timings):.0f}, max {max(timings):.0f}) "
+              f"budget {budget:.0f} ms - {status}")
+
+        eager = sorted(set(LAZY_MODULES[mode]) & modules)
+        if eager:
+            print(f"     imported at startup (should be lazy): {', '.join(eager)}")
+
+        if median > budget or eager:
+            failed = True
+            _, _, log = run_probe(mode, importtime=True)
+            print("     slowest imports (cumulative ms):")
+            for cumulative, name in slowest_imports(log):
+                print(f"       {cumulative / 1000:8.1f}  {name}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+SQLite concurrent-write check
+Runs the login flow (SELECT user, then INSERT audit_log) from several threads
+against a fresh SQLite file with the sqlite engine profile, and fails if any
+request errors. Ordinary read-then-write requests must wait on busy_timeout
+for the write lock, never fail with "database is locked" because another
+writer committed between their read and their write.
+
+Usage:
+    python check_sqlite_concurrency.py [--threads 8] [--logins 5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check concurrent SQLite writes through the login flow')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=5, help='Logins per thread')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='lotoryjung-concurrency-')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir, 'check.db')}"
+    os.environ['DB_PROFILE'] = 'sqlite'
+    os.environ['ORDER_WORKER_LOCK_DIR'] = workdir
+    sys.path.insert(0, APP_DIR)
+
+    from app import create_app, db
+    from app.models import User
+
+    app = create_app(web=False)
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        for index in range(args.threads):
+            user = User(name=f'Check {index}', username=f'check{index}', role='user')
+            user.set_password('check123')
+            db.session.add(user)
+        db.session.commit()
+
+    results = []
+    start = threading.Barrier(args.threads)
+
+    def worker(index):
+        client = app.test_client()
+        start.wait()
+        for _ in range(args.logins):
+            try:
+                response = client.post('/auth/login', data={'username': f'check{index}', 'password': 'check123'})
+                results.append(response.status_code if response.status_code >= 400 else 'ok')
+            except Exception as e:
+                results.append(f"{type(e).__name__}: {str(e).splitlines()[0]}")
+            client.get('/auth/logout')
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    failures = [result for result in results if result != 'ok']
+    print(f"{len(results) - len(failures)}/{len(results)} logins OK")
+    for failure, count in sorted(Counter(map(str, failures)).items()):
+        print(f"  {count}x {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,7 @@ from app.models import User, Rule, BlockedNumber
 
 def init_database():
     """Initialize database with tables and initial data"""
-    app = create_app()
+    app = create_app(web=False)
     
     with app.app_context():
         print("Creating database tables...")
@@ -13,7 +13,7 @@ from decimal import Decimal
 
 def init_group_limits():
     """Initialize default group limits"""
-    app = create_app()
+    app = create_app(web=False)
     
     with app.app_context():
         # Default limits for each group
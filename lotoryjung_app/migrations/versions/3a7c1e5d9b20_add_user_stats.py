@@ -0,0 +1,49 @@
+"""Add user_stats running statistics table
+
+Revision ID: 3a7c1e5d9b20
+Revises: 8216c1be0e84
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7c1e5d9b20'
+down_revision = '8216c1be0e84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('batch_id', sa.String(length=20), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('total_amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('last_updated', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'batch_id', 'status', name='unique_user_stat')
+    )
+
+    # Backfill from existing orders (per batch, then all batches)
+    op.execute("""
+        INSERT INTO user_stats (user_id, batch_id, status, order_count, total_amount, last_updated)
+        SELECT user_id, batch_id, status, COUNT(id), COALESCE(SUM(total_amount), 0), CURRENT_TIMESTAMP
+        FROM orders
+        GROUP BY user_id, batch_id, status
+    """)
+    op.execute("""
+        INSERT INTO user_stats (user_id, batch_id, status, order_count, total_amount, last_updated)
+        SELECT user_id, 'ALL', status, COUNT(id), COALESCE(SUM(total_amount), 0), CURRENT_TIMESTAMP
+        FROM orders
+        GROUP BY user_id, status
+    """)
+
+
+def downgrade():
+    op.drop_table('user_stats')
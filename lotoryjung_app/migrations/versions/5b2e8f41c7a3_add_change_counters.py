@@ -0,0 +1,31 @@
+"""Add change_counters table
+
+Revision ID: 5b2e8f41c7a3
+Revises: 3a7c1e5d9b20
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e8f41c7a3'
+down_revision = '3a7c1e5d9b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('change_counters',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    op.execute("INSERT INTO change_counters (name, value, updated_at) VALUES ('rules', 0, CURRENT_TIMESTAMP)")
+
+
+def downgrade():
+    op.drop_table('change_counters')
@@ -0,0 +1,28 @@
+"""Add orders.idempotency_key
+
+Revision ID: 7c4d2a9e1f36
+Revises: 5b2e8f41c7a3
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4d2a9e1f36'
+down_revision = '5b2e8f41c7a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('unique_order_idempotency_key', ['user_id', 'batch_id', 'idempotency_key'])
+
+
+def downgrade():
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_constraint('unique_order_idempotency_key', type_='unique')
+        batch_op.drop_column('idempotency_key')
@@ -0,0 +1,38 @@
+"""Add rule_changes table
+
+Revision ID: 9e3b5f7a2c41
+Revises: 7c4d2a9e1f36
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3b5f7a2c41'
+down_revision = '7c4d2a9e1f36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rule_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('rule_type', sa.String(length=50), nullable=True),
+    sa.Column('field', sa.String(length=20), nullable=True),
+    sa.Column('number_norm', sa.String(length=10), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('rule_changes', schema=None) as batch_op:
+        batch_op.create_index('idx_rule_changes_version', ['version'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('rule_changes', schema=None) as batch_op:
+        batch_op.drop_index('idx_rule_changes_version')
+
+    op.drop_table('rule_changes')
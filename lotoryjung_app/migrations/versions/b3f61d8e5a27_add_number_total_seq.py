@@ -0,0 +1,28 @@
+"""Add number_totals.seq
+
+Revision ID: b3f61d8e5a27
+Revises: 9e3b5f7a2c41
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f61d8e5a27'
+down_revision = '9e3b5f7a2c41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('number_totals', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seq', sa.BigInteger(), nullable=False, server_default='0'))
+        batch_op.create_index('idx_total_batch_seq', ['batch_id', 'seq'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('number_totals', schema=None) as batch_op:
+        batch_op.drop_index('idx_total_batch_seq')
+        batch_op.drop_column('seq')
@@ -220,6 +220,16 @@ const API = {
         return await this.request(`/number_totals/${field}/${number}`);
     },
 
+    /**
+     * Get number totals of a batch changed since a sequence (all totals if omitted)
+     */
+    getExposureChanges: async function(batchId, since) {
+        const params = new URLSearchParams();
+        if (batchId) params.set('batch_id', batchId);
+        if (since !== undefined && since !== null) params.set('since', since);
+        return await this.request(`/sync/exposure?${params}`);
+    },
+
     /**
      * Validate order before submission
      */
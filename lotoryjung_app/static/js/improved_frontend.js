@@ -23,9 +23,8 @@ class LotoJungOrderForm {
     }
     
     async init() {
-        // Load initial data
-        await this.loadBlockedNumbers();
-        await this.loadPayoutRates();
+        // Load initial data (blocked numbers + payout rates)
+        await this.syncRules();
         
         // Setup event listeners
         this.setupEventListeners();
@@ -37,6 +36,69 @@ class LotoJungOrderForm {
         this.updateLotteryDate();
     }
     
+    async syncRules() {
+        // Delta sync: fetch only rules/blocked numbers changed since the cached version
+        const cacheKey = 'lotojung.ruleSync';
+        let cache = null;
+        try {
+            cache = JSON.parse(localStorage.getItem(cacheKey));
+        } catch (error) {
+            cache = null;
+        }
+        
+        try {
+            const url = cache ? `/api/sync/rules?since=${cache.version}` : '/api/sync/rules';
+            const headers = cache && cache.etag ? { 'If-None-Match': cache.etag } : {};
+            const response = await fetch(url, { headers });
+            
+            if (response.status !== 304) {
+                const data = await response.json();
+                if (!data.success) {
+                    throw new Error(data.error);
+                }
+                cache = this.applyRuleChanges(data.full ? null : cache, data);
+                cache.etag = response.headers.get('ETag');
+                localStorage.setItem(cacheKey, JSON.stringify(cache));
+            }
+        } catch (error) {
+            console.warn('Rule sync failed, loading full lists:', error);
+            await this.loadBlockedNumbers();
+            await this.loadPayoutRates();
+            return;
+        }
+        
+        this.blockedNumbers = { '2_top': [], '2_bottom': [], '3_top': [], 'tote': [] };
+        cache.blocked_numbers.forEach(({ field, number_norm }) => {
+            (this.blockedNumbers[field] = this.blockedNumbers[field] || []).push(number_norm);
+        });
+        
+        this.payoutRates = { '2_top': 90, '2_bottom': 90, '3_top': 900, 'tote': 150 };
+        cache.rules
+            .filter(rule => rule.rule_type === 'payout' && rule.number_norm === null)
+            .forEach(rule => { this.payoutRates[rule.field] = rule.value; });
+        this.updatePayoutRateDisplay();
+    }
+    
+    applyRuleChanges(cache, data) {
+        // Merge a sync response into the cached rows (cache is null for a full snapshot)
+        const ruleKey = (rule) => `${rule.rule_type}|${rule.field}|${rule.number_norm}`;
+        const blockedKey = (blocked) => `${blocked.field}|${blocked.number_norm}`;
+        
+        const rules = new Map((cache ? cache.rules : []).map(rule => [ruleKey(rule), rule]));
+        const blocked = new Map((cache ? cache.blocked_numbers : []).map(row => [blockedKey(row), row]));
+        
+        data.deleted_rules.forEach(rule => rules.delete(ruleKey(rule)));
+        data.deleted_blocked_numbers.forEach(row => blocked.delete(blockedKey(row)));
+        data.rules.forEach(rule => rules.set(ruleKey(rule), rule));
+        data.blocked_numbers.forEach(row => blocked.set(blockedKey(row), row));
+        
+        return {
+            version: data.version,
+            rules: Array.from(rules.values()),
+            blocked_numbers: Array.from(blocked.values())
+        };
+    }
+    
     async loadBlockedNumbers() {
         try {
             const response = await fetch('/api/v2/blocked_numbers');